@@ -0,0 +1,100 @@
+"""
+Benchmark of the stored context encodings: legacy JSON vs ContextCodec.
+
+Run from the root of the repository: ``python -m benchmarks.bench_context_codec``.
+"""
+import json
+import random
+import string
+import time
+
+from bot_ai.storage.context_codec import ContextCodec, zstandard
+
+
+def make_context(turns: int, answer_length: int, seed: int = 0) -> list:
+    """
+    Build a realistic context: the system message and user / assistant turns.
+
+    :param turns: Count of user / assistant pairs.
+    :param answer_length: Approximate length of an answer (characters).
+    :param seed: Seed of the generator.
+
+    :return: List of messages.
+    """
+    generator: random.Random = random.Random(seed)
+    words: list[str] = [
+        "".join(generator.choices(string.ascii_lowercase, k=generator.randint(2, 9)))
+        for _ in range(400)
+    ] + ["привет", "ответ", "модель", "контекст", "запрос"]
+
+    def text(length: int) -> str:
+        result: list[str] = list()
+        size: int = 0
+        while size < length:
+            word: str = generator.choice(words)
+            result.append(word)
+            size += len(word) + 1
+        return " ".join(result)
+
+    context: list = [
+        {
+            "role": "system",
+            "content": "You're an AI assistant integrated from SBER's GigaChat API."
+        }
+    ]
+    for _ in range(turns):
+        context.append({"role": "user", "content": text(120)})
+        context.append({"role": "assistant", "content": text(answer_length)})
+
+    return context
+
+
+def timeit(function, repeat: int) -> float:
+    """
+    Measure the mean duration of the call.
+
+    :param function: Callable without arguments.
+    :param repeat: Count of calls.
+
+    :return: Mean duration in microseconds.
+    """
+    start: float = time.perf_counter()
+    for _ in range(repeat):
+        function()
+
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main() -> None:
+    """
+    Print size and encode / decode timings for several context sizes.
+
+    :return: None.
+    """
+    print(f"compression: {'zstd' if zstandard is not None else 'zlib'}")
+    print(
+        f"{'context':>16} | {'json bytes':>10} | {'codec bytes':>11} | {'ratio':>5} | "
+        f"{'json enc us':>11} | {'codec enc us':>12} | {'json dec us':>11} | "
+        f"{'codec dec us':>12}"
+    )
+
+    for turns, answer_length in ((1, 200), (5, 1000), (5, 4000), (10, 4000)):
+        context: list = make_context(turns, answer_length)
+        legacy: bytes = json.dumps({"data": context}).encode("utf-8")
+        encoded: bytes = ContextCodec.encode(context)
+        assert ContextCodec.decode(encoded) == context
+        assert ContextCodec.decode(legacy) == context
+
+        repeat: int = 200
+        print(
+            f"{f'{turns} x {answer_length}':>16} | {len(legacy):>10} | {len(encoded):>11} | "
+            f"{len(encoded) / len(legacy):>5.2f} | "
+            f"{timeit(lambda: json.dumps({'data': context}).encode('utf-8'), repeat):>11.1f} | "
+            f"{timeit(lambda: ContextCodec.encode(context), repeat):>12.1f} | "
+            f"{timeit(lambda: json.loads(legacy)['data'], repeat):>11.1f} | "
+            f"{timeit(lambda: ContextCodec.decode(encoded), repeat):>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark of the JSON serializers: the standard library vs Serializer (orjson if it is
+installed) on the chat request bodies and the responses of realistic context sizes.
+
+Run from the root of the repository: ``python -m benchmarks.bench_serializer``.
+"""
+import json
+
+from benchmarks.bench_context_codec import make_context, timeit
+from bot_ai.utils.serializer import Serializer
+
+
+def make_body(context: list) -> dict:
+    """
+    Build the body of the chat completion request.
+
+    :param context: List of messages.
+    :return: Body.
+    """
+    return {
+        "model": "GigaChat-Max",
+        "messages": context,
+        "temperature": 1.0,
+        "top_p": 1.0
+    }
+
+
+def main() -> None:
+    """
+    Print encode / decode timings of the request bodies for several context sizes.
+
+    :return: None.
+    """
+    print(f"serializer backend: {Serializer.backend}")
+    print(
+        f"{'context':>16} | {'body bytes':>10} | {'json enc us':>11} | {'fast enc us':>11} | "
+        f"{'json dec us':>11} | {'fast dec us':>11}"
+    )
+
+    for turns, answer_length in ((1, 200), (5, 1000), (5, 4000), (10, 4000), (20, 4000)):
+        body: dict = make_body(make_context(turns, answer_length))
+        # The former path: str from json.dumps, encoded to bytes by the transport
+        legacy: bytes = json.dumps(body).encode("utf-8")
+        encoded: bytes = Serializer.dumps(body)
+        assert Serializer.loads(encoded) == body == json.loads(legacy)
+
+        repeat: int = 200
+        print(
+            f"{f'{turns} x {answer_length}':>16} | {len(encoded):>10} | "
+            f"{timeit(lambda: json.dumps(body).encode('utf-8'), repeat):>11.1f} | "
+            f"{timeit(lambda: Serializer.dumps(body), repeat):>11.1f} | "
+            f"{timeit(lambda: json.loads(legacy), repeat):>11.1f} | "
+            f"{timeit(lambda: Serializer.loads(encoded), repeat):>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
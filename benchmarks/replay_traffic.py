@@ -0,0 +1,590 @@
+"""
+Replay load test: the updates recorded by TrafficRecorder (bot_ai/utils/traffic.py) are
+replayed against the bot with the fake Telegram Bot API and GigaChat servers on the
+localhost, at the recorded pace or accelerated. The latency of the first and of the
+last reply of every update is reported per flow with the resource usage of the run.
+
+Run from the root of the repository::
+
+    python -m benchmarks.replay_traffic traffic/updates.jsonl --speed 10
+
+The bot uses the settings of bot.json (limits, scheduler, caches, ...) with the
+in-memory storage and the fake servers; it runs in a temporary working directory.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import resource
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+from aiohttp import web
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Methods of the Bot API which deliver an answer to the user
+REPLY_METHODS: tuple[str, ...] = ("sendMessage", "editMessageText", "sendPhoto", "sendDocument")
+WORDS: tuple[str, ...] = (
+    "привет", "как", "сделать", "модель", "ответ", "please", "explain", "the", "code", "why",
+    "картинку", "кота", "в", "космосе", "write", "a", "poem", "about", "summer", "and"
+)
+
+
+def make_png(width: int = 64, height: int = 64) -> bytes:
+    """
+    Build a valid grayscale PNG (the fake generated image).
+
+    :param width: Width.
+    :param height: Height.
+
+    :return: PNG bytes.
+    """
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + \
+            struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    rows: bytes = b"".join(b"\x00" + bytes((x * 4) % 256 for x in range(width))
+                           for _ in range(height))
+
+    return b"\x89PNG\r\n\x1a\n" + \
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)) + \
+        chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def make_text(generator: random.Random, length: int) -> str:
+    """
+    Build a text of the given length.
+
+    :param generator: Random generator.
+    :param length: Length (characters).
+
+    :return: Text.
+    """
+    words: list[str] = list()
+    size: int = 0
+    while size < length:
+        word: str = generator.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+
+    return " ".join(words)[:max(1, length)]
+
+
+def percentile(values: list[float], share: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    :param values: Values.
+    :param share: Percentile (0..1).
+
+    :return: Value (0.0 for no values).
+    """
+    if not values:
+        return 0.0
+    ordered: list[float] = sorted(values)
+
+    return ordered[min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))]
+
+
+def load_records(paths: list[str]) -> list[dict]:
+    """
+    Read the recorded updates (rotated files included), ordered by time.
+
+    :param paths: Files or glob patterns.
+    :return: Records.
+    """
+    records: list[dict] = list()
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with open(path, "r", encoding="utf-8") as file:
+                records.extend(json.loads(line) for line in file if line.strip())
+
+    return sorted(records, key=lambda record: record["ts"])
+
+
+class ScheduledUpdate:
+    """Update of the replay."""
+
+    def __init__(
+            self,
+            at: float,
+            user_id: int,
+            flow: str,
+            text: str | None = None,
+            data: str | None = None,
+            measured: bool = True
+    ) -> None:
+        self.at: float = at
+        self.user_id: int = user_id
+        self.flow: str = flow
+        self.text: str | None = text
+        self.data: str | None = data
+        self.measured: bool = measured
+
+    def payload(self, update_id: int, message_id: int) -> dict:
+        """
+        Build the Bot API update.
+
+        :param update_id: Update ID.
+        :param message_id: Message ID.
+
+        :return: Update (dict).
+        """
+        user: dict = {"id": self.user_id, "is_bot": False, "first_name": "Replay"}
+        chat: dict = {"id": self.user_id, "type": "private", "first_name": "Replay"}
+        if self.data is None:
+            return {"update_id": update_id, "message": {
+                "message_id": message_id, "date": int(time.time()), "chat": chat,
+                "from": user, "text": self.text
+            }}
+
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": "replay", "data": self.data,
+            "message": {
+                "message_id": message_id, "date": int(time.time()), "chat": chat,
+                "from": {"id": 1, "is_bot": True, "first_name": "Bot"}, "text": "menu"
+            }
+        }}
+
+
+def build_schedule(records: list[dict], speed: float, seed: int = 0) -> list[ScheduledUpdate]:
+    """
+    Convert the records to the updates of the replay. The users are put into the FSM
+    state of the recorded flow first (unmeasured updates) if the recording has started
+    in the middle of their dialog.
+
+    :param records: Records ordered by time.
+    :param speed: Replay speed (2.0 is twice as fast as recorded).
+    :param seed: Seed of the texts.
+
+    :return: Updates ordered by time.
+    """
+    generator: random.Random = random.Random(seed)
+    users: dict[str, int] = dict()
+    states: dict[int, str | None] = dict()
+    schedule: list[ScheduledUpdate] = list()
+    start: float = records[0]["ts"] if records else 0.0
+
+    for record in records:
+        user_id: int = users.setdefault(record["user"], 100000 + len(users))
+        at: float = (record["ts"] - start) / speed + 1.0
+        flow: str = record["flow"]
+        action: str = record["action"]
+        state: str | None = states.get(user_id)
+
+        def prime(data: str, text: str | None = None) -> None:
+            schedule.append(ScheduledUpdate(at - 0.6, user_id, flow, data=data, measured=False))
+            if text is not None:
+                schedule.append(ScheduledUpdate(at - 0.3, user_id, flow, text, measured=False))
+
+        if action.startswith("callback:"):
+            data: str = action.split(":", 1)[1]
+            if data == "generate" and state != "image_confirm":
+                prime("start_image_generate", make_text(generator, 40))
+            schedule.append(ScheduledUpdate(at, user_id, flow, data=data))
+            states[user_id] = {
+                "start_chat_dialog_ai": "chat", "start_image_generate": "image_prompt",
+                "generate": None
+            }.get(data, state)
+        elif action.startswith("command:"):
+            command: str = action.split(":", 1)[1]
+            schedule.append(ScheduledUpdate(at, user_id, flow, "/" + command))
+            if command == "stop" and state == "chat":
+                states[user_id] = None
+        elif flow == "chat":
+            if state != "chat":
+                prime("start_chat_dialog_ai")
+            schedule.append(ScheduledUpdate(
+                at, user_id, flow, make_text(generator, record.get("length", 40))
+            ))
+            states[user_id] = "chat"
+        elif flow == "image":
+            if state != "image_prompt":
+                prime("start_image_generate")
+            schedule.append(ScheduledUpdate(
+                at, user_id, flow, make_text(generator, record.get("length", 40))
+            ))
+            states[user_id] = "image_confirm"
+        else:
+            schedule.append(ScheduledUpdate(
+                at, user_id, flow, make_text(generator, record.get("length", 10))
+            ))
+
+    return sorted(schedule, key=lambda update: update.at)
+
+
+class Delivery:
+    """Replies of one measured update."""
+
+    def __init__(self, flow: str) -> None:
+        self.flow: str = flow
+        self.delivered_at: float = time.perf_counter()
+        self.first: float | None = None
+        self.last: float | None = None
+
+
+class ReplyTracker:
+    """Attribution of the replies to the last delivered update of the chat."""
+
+    def __init__(self) -> None:
+        self.deliveries: list[Delivery] = list()
+        self.__current: dict[int, Delivery | None] = dict()
+
+    def deliver(self, update: ScheduledUpdate) -> None:
+        """
+        Mark the update as delivered to the bot.
+
+        :param update: Update.
+        :return: None.
+        """
+        delivery: Delivery | None = Delivery(update.flow) if update.measured else None
+        if delivery is not None:
+            self.deliveries.append(delivery)
+        self.__current[update.user_id] = delivery
+
+    def reply(self, chat_id: int) -> None:
+        """
+        Register a reply of the bot.
+
+        :param chat_id: Chat ID.
+        :return: None.
+        """
+        delivery: Delivery | None = self.__current.get(chat_id)
+        if delivery is not None:
+            now: float = time.perf_counter() - delivery.delivered_at
+            delivery.first = now if delivery.first is None else delivery.first
+            delivery.last = now
+
+
+class FakeTelegram:
+    """Fake Bot API server: answers every method and tracks the replies."""
+
+    def __init__(self, tracker: ReplyTracker) -> None:
+        self.tracker: ReplyTracker = tracker
+        self.calls: dict[str, int] = dict()
+        self.__message_id: int = 10 ** 6
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """
+        Answer the Bot API method.
+
+        :param request: Request.
+        :return: Response.
+        """
+        method: str = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        form = await request.post()
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Replay", "username": "replay_bot"
+            }})
+        if method not in REPLY_METHODS:
+            return web.json_response({"ok": True, "result": True})
+
+        chat_id: int = int(form.get("chat_id", 0))
+        self.tracker.reply(chat_id)
+        self.__message_id += 1
+        message: dict = {
+            "message_id": self.__message_id, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": "reply"
+        }
+        if method == "sendPhoto":
+            message["photo"] = [{"file_id": "p", "file_unique_id": "p", "width": 64, "height": 64}]
+        elif method == "sendDocument":
+            message["document"] = {"file_id": "d", "file_unique_id": "d"}
+
+        return web.json_response({"ok": True, "result": message})
+
+
+class FakeGigaChat:
+    """Fake GigaChat API: OAuth, completions (with latency), files and embeddings."""
+
+    def __init__(self, text_latency: float, image_latency: float, seed: int = 0) -> None:
+        self.text_latency: float = text_latency
+        self.image_latency: float = image_latency
+        self.generator: random.Random = random.Random(seed)
+        self.image: bytes = make_png()
+
+    async def oauth(self, request: web.Request) -> web.Response:
+        """
+        Issue the access token.
+
+        :param request: Request.
+        :return: Response.
+        """
+        return web.json_response({
+            "access_token": "replay", "expires_at": int((time.time() + 1800) * 1000)
+        })
+
+    async def completions(self, request: web.Request) -> web.Response:
+        """
+        Answer the chat completion (or the image generation) after the latency.
+
+        :param request: Request.
+        :return: Response.
+        """
+        body: dict = await request.json()
+        if "function_call" in body:
+            await asyncio.sleep(self.image_latency * self.generator.uniform(0.6, 1.4))
+            content: str = '<img src="replay-image" fuse="true"/>'
+        else:
+            await asyncio.sleep(self.text_latency * self.generator.uniform(0.5, 1.5))
+            content = make_text(self.generator, self.generator.randint(200, 1500))
+
+        return web.json_response({
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "model": body.get("model")
+        })
+
+    async def file(self, request: web.Request) -> web.Response:
+        """
+        Download the generated image.
+
+        :param request: Request.
+        :return: Response.
+        """
+        return web.Response(body=self.image, content_type="image/png")
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        """
+        Hashed embeddings of the inputs.
+
+        :param request: Request.
+        :return: Response.
+        """
+        body: dict = await request.json()
+        data: list[dict] = list()
+        for index, text in enumerate(body.get("input", [])):
+            vector: list[float] = [0.0] * 64
+            for word in str(text).lower().split():
+                vector[zlib.crc32(word.encode("utf-8")) % 64] += 1.0
+            data.append({"index": index, "embedding": vector})
+
+        return web.json_response({"data": data})
+
+
+async def start_servers(telegram: FakeTelegram, giga: FakeGigaChat) -> tuple[list, str, str]:
+    """
+    Start the fake servers on free ports of the localhost.
+
+    :param telegram: Fake Bot API.
+    :param giga: Fake GigaChat API.
+
+    :return: Runners and the base URLs of the Bot API and of the GigaChat API.
+    """
+    telegram_app: web.Application = web.Application()
+    telegram_app.router.add_post("/bot{token}/{method}", telegram.handle)
+
+    giga_app: web.Application = web.Application()
+    giga_app.router.add_post("/api/v2/oauth", giga.oauth)
+    giga_app.router.add_post("/api/v1/chat/completions", giga.completions)
+    giga_app.router.add_get("/api/v1/files/{file}/content", giga.file)
+    giga_app.router.add_post("/api/v1/embeddings", giga.embeddings)
+
+    runners: list = list()
+    urls: list[str] = list()
+    for app in (telegram_app, giga_app):
+        runner: web.AppRunner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site: web.TCPSite = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port: int = site._server.sockets[0].getsockname()[1]
+        runners.append(runner)
+        urls.append(f"http://127.0.0.1:{port}")
+
+    return runners, urls[0], urls[1]
+
+
+class ReplayIntake:
+    """Intake of the bot: feed the scheduled updates to the dispatcher on time."""
+
+    def __init__(self, schedule: list[ScheduledUpdate], tracker: ReplyTracker, drain: float):
+        self.schedule: list[ScheduledUpdate] = schedule
+        self.tracker: ReplyTracker = tracker
+        self.drain: float = drain
+        self.loop_lags: list[float] = list()
+
+    async def __watch_loop(self) -> None:
+        """
+        Sample the event loop lag.
+
+        :return: None.
+        """
+        while True:
+            start: float = time.perf_counter()
+            await asyncio.sleep(0.05)
+            self.loop_lags.append(max(0.0, time.perf_counter() - start - 0.05))
+
+    async def __call__(self, bot, dispatcher) -> None:
+        """
+        Feed the updates, then wait for their handlers (at most `drain` seconds).
+
+        :param bot: Bot.
+        :param dispatcher: Dispatcher.
+
+        :return: None.
+        """
+        from aiogram.types import Update
+
+        watcher: asyncio.Task = asyncio.create_task(self.__watch_loop())
+        tasks: set[asyncio.Task] = set()
+        started: float = time.perf_counter()
+        for number, scheduled in enumerate(self.schedule, start=1):
+            delay: float = scheduled.at - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            update: Update = Update.model_validate(
+                scheduled.payload(number, number), context={"bot": bot}
+            )
+            self.tracker.deliver(scheduled)
+            tasks.add(asyncio.create_task(dispatcher.feed_update(bot, update)))
+
+        if tasks:
+            await asyncio.wait(tasks, timeout=self.drain)
+        watcher.cancel()
+
+
+def make_config(source: str, telegram_url: str, giga_url: str) -> dict:
+    """
+    Build bot.json of the replay: the given settings with the fake servers, the
+    in-memory storage and no recorder / health endpoint.
+
+    :param source: Path of the source bot.json (may be missing).
+    :param telegram_url: Base URL of the fake Bot API.
+    :param giga_url: Base URL of the fake GigaChat API.
+
+    :return: Settings.
+    """
+    config: dict = dict()
+    if os.path.exists(source):
+        with open(source, "r", encoding="utf-8") as file:
+            config = json.load(file)
+
+    config.update({
+        "BOT_TOKEN": "1:replay",
+        "GIGA_CHAT_TOKEN": "replay",
+        "GIGA_CHAT_AUTH_TOKEN": "replay",
+        "STORAGE": {"BACKEND": "memory"},
+        "HEALTH": {"ENABLED": False},
+        "WORKERS": {"ENABLED": False},
+        "TRAFFIC_RECORDER": {"ENABLED": False},
+        "TELEGRAM_API": {"BASE_URL": telegram_url},
+        "GIGACHAT_API": {"API_URL": f"{giga_url}/api/v1", "AUTH_URL": f"{giga_url}/api/v2/oauth"}
+    })
+
+    return config
+
+
+def report(tracker: ReplyTracker, intake: ReplayIntake, seconds: float, cpu: float) -> None:
+    """
+    Print the latency percentiles per flow and the resource usage.
+
+    :param tracker: Reply tracker.
+    :param intake: Replay intake.
+    :param seconds: Wall time of the replay.
+    :param cpu: CPU time of the replay.
+
+    :return: None.
+    """
+    print(
+        f"{'flow':>6} | {'updates':>7} | {'no reply':>8} | {'first p50':>9} | "
+        f"{'first p95':>9} | {'first p99':>9} | {'done p50':>8} | {'done p95':>8} | "
+        f"{'done p99':>8}"
+    )
+    for flow in sorted({delivery.flow for delivery in tracker.deliveries}):
+        deliveries: list[Delivery] = [
+            delivery for delivery in tracker.deliveries if delivery.flow == flow
+        ]
+        first: list[float] = [item.first for item in deliveries if item.first is not None]
+        done: list[float] = [item.last for item in deliveries if item.last is not None]
+        print(
+            f"{flow:>6} | {len(deliveries):>7} | {len(deliveries) - len(first):>8} | "
+            f"{percentile(first, 0.5):>8.3f}s | {percentile(first, 0.95):>8.3f}s | "
+            f"{percentile(first, 0.99):>8.3f}s | {percentile(done, 0.5):>7.3f}s | "
+            f"{percentile(done, 0.95):>7.3f}s | {percentile(done, 0.99):>7.3f}s"
+        )
+
+    print(
+        f"\nwall {seconds:.1f} s, cpu {cpu:.1f} s ({cpu / max(seconds, 1e-9):.0%} of a core), "
+        f"max rss {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB, "
+        f"loop lag p99 {percentile(intake.loop_lags, 0.99) * 1000:.1f} ms, "
+        f"max {max(intake.loop_lags, default=0.0) * 1000:.1f} ms"
+    )
+
+
+async def replay(arguments: argparse.Namespace) -> None:
+    """
+    Run the replay.
+
+    :param arguments: Command line arguments.
+    :return: None.
+    """
+    records: list[dict] = load_records(arguments.records)
+    schedule: list[ScheduledUpdate] = build_schedule(records, arguments.speed, arguments.seed)
+    print(f"{len(records)} records, {len(schedule)} updates, speed x{arguments.speed:g}")
+
+    tracker: ReplyTracker = ReplyTracker()
+    runners, telegram_url, giga_url = await start_servers(
+        FakeTelegram(tracker),
+        FakeGigaChat(arguments.text_latency, arguments.image_latency, arguments.seed)
+    )
+
+    source: str = os.path.abspath(arguments.config)
+    workdir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory(prefix="replay-")
+    os.chdir(workdir.name)
+    with open("bot.json", "w", encoding="utf-8") as file:
+        json.dump(make_config(source, telegram_url, giga_url), file, ensure_ascii=False)
+
+    from bot_ai.bot import BotAI, GetData
+
+    data: dict = await GetData.get_data()
+    intake: ReplayIntake = ReplayIntake(schedule, tracker, arguments.drain)
+    usage_before: resource.struct_rusage = resource.getrusage(resource.RUSAGE_SELF)
+    started: float = time.perf_counter()
+    try:
+        await BotAI(data["BOT_TOKEN"], data["MYSQL"], data).run(intake)
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+        os.chdir(ROOT)
+        workdir.cleanup()
+
+    usage: resource.struct_rusage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu: float = usage.ru_utime + usage.ru_stime - usage_before.ru_utime - usage_before.ru_stime
+    report(tracker, intake, time.perf_counter() - started, cpu)
+
+
+def main() -> None:
+    """
+    Parse the arguments and run the replay.
+
+    :return: None.
+    """
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="Replay the recorded traffic against the fake servers"
+    )
+    parser.add_argument("records", nargs="+", help="recorded JSONL files (globs allowed)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor")
+    parser.add_argument("--config", default="bot.json", help="settings of the bot")
+    parser.add_argument("--text-latency", type=float, default=1.5, help="mean completion s")
+    parser.add_argument("--image-latency", type=float, default=6.0, help="mean image s")
+    parser.add_argument("--drain", type=float, default=120.0, help="max wait for handlers")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments: argparse.Namespace = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+
+    asyncio.run(replay(arguments))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,43 @@
 """Main-module of the bot."""
-import json
+import asyncio
+import html
 import abc
 import logging
-import pymysql
+import os
+from typing import Awaitable, Callable
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.fsm.context import FSMContext
 from aiogram import Router
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import ContentType
 from aiogram.filters import Command
 
 from bot_ai.buttons import Buttons
-from bot_ai.utils.create_table import CreateTable
-from bot_ai.utils.mysql_connection import Connection
+from bot_ai.storage.base import BaseStorage
+from bot_ai.storage.factory import StorageFactory
+from bot_ai.utils.archiver import ContextArchiver
+from bot_ai.utils.serializer import Serializer
+from bot_ai.utils.startup import Startup
 from bot_ai.gigachat.giga_chat_ai import router_chat_ai, GigaChatAI
+from bot_ai.gigachat.memory import LongTermMemory
+from bot_ai.gigachat.prefetch import ContextPrefetcher
+from bot_ai.gigachat.semantic_cache import SemanticCache
+from bot_ai.gigachat.giga_requests import GetData as GigaData, GigaSession, TokenStore
+from bot_ai.utils.dedup import DeduplicationMiddleware
 from bot_ai.utils.handler_db import HandlerDB
+from bot_ai.utils.health import HealthServer
+from bot_ai.utils.logger import LogContextMiddleware
+from bot_ai.utils.memory_report import MemoryReporter
+from bot_ai.utils.persistence import PersistenceQueue
+from bot_ai.utils.profiler import ProfileResult, SamplingProfiler
+from bot_ai.utils.rate_limit import RateLimiter
+from bot_ai.utils.scheduler import WorkScheduler
+from bot_ai.utils.shutdown import shutdown_coordinator
+from bot_ai.utils.tracing import TelegramTracingMiddleware, Tracer, TracingMiddleware
+from bot_ai.utils.traffic import TrafficRecorder, TrafficRecordingMiddleware
+from bot_ai.utils.usage_stats import UsageRecorder, UsageReport
 from bot_ai.gigachat.giga_image_ai import router_ai_img, GigaCreator
 
 
@@ -124,11 +145,20 @@ class ViewAnalytics(BasicMethod):
         result: str = await HandlerDB.get_analytic_datas_count_ai_queries(
             callback_query.from_user.id
         )
+        limiter: RateLimiter = RateLimiter.get()
+        remaining: list[str] = [
+            f"{name}: {'♾' if left is None else left}"
+            for name, left in (
+                ("💬 text", limiter.remaining("text", callback_query.from_user.id)),
+                ("🖼 images", limiter.remaining("image", callback_query.from_user.id))
+            )
+        ]
         await bot.edit_message_text(
             text=f"💻 <b>Analytics</b>\n"
                  f"<b>*-*-*-*-*-*-*-*-*-*-*</b>\n\n"
                  f"👑 <b>{callback_query.from_user.first_name}</b>, you used "
-                 f"{result} requests.\n\nTo back to main menu - click on the corresponding button "
+                 f"{result} requests.\n\nRequests left today: {', '.join(remaining)}."
+                 f"\n\nTo back to main menu - click on the corresponding button "
                  f"below.",
             chat_id=callback_query.from_user.id,
             reply_markup=button.as_markup(),
@@ -137,6 +167,104 @@ class ViewAnalytics(BasicMethod):
         )
 
 
+class AdminStats(BasicMethod):
+    """The class for the global usage stats (admins only)."""
+
+    @staticmethod
+    async def method(bot: Bot, message: Message | CallbackQuery) -> None:
+        """
+        The method for answer to the stats cmd (command).
+
+        :param bot: The Bot Object.
+        :param message: The message object.
+        :type message: Message | CallbackQuery.
+
+        :return: None.
+        """
+        await bot.send_message(
+            text=await UsageReport.build(),
+            chat_id=message.from_user.id,
+            parse_mode="HTML"
+        )
+
+
+class AdminProfile(BasicMethod):
+    """The class for the on-demand profiling (admins only)."""
+
+    @staticmethod
+    async def method(bot: Bot, message: Message | CallbackQuery) -> None:
+        """
+        The method for answer to the profile cmd (command): "/profile [seconds] [focus]",
+        e.g. "/profile 30 chat_dialog".
+
+        :param bot: The Bot Object.
+        :param message: The message object.
+        :type message: Message | CallbackQuery.
+
+        :return: None.
+        """
+        profiler: SamplingProfiler = SamplingProfiler.get()
+        args: list[str] = (message.text or "").split()[1:]
+        seconds: float | None = None
+        if args:
+            try:
+                seconds = float(args[0])
+                args = args[1:]
+            except ValueError:
+                pass
+        if seconds is not None and not seconds > 0:
+            seconds = None
+        focus: str | None = args[-1] if args else None
+
+        duration: float = min(seconds or profiler.default_seconds, profiler.max_seconds)
+        await bot.send_message(
+            text=f"⏱ Profiling for {duration:g} s...",
+            chat_id=message.from_user.id
+        )
+        try:
+            result: ProfileResult = await profiler.profile(seconds, focus)
+        except RuntimeError as ex:
+            await bot.send_message(text=f"⚠ {ex}", chat_id=message.from_user.id)
+            return
+
+        path: str = await asyncio.to_thread(profiler.save, result)
+        await bot.send_message(
+            text=f"<pre>{html.escape(result.summary(profiler.top_limit))}</pre>",
+            chat_id=message.from_user.id,
+            parse_mode="HTML"
+        )
+        await bot.send_document(
+            chat_id=message.from_user.id,
+            document=BufferedInputFile(
+                result.collapsed().encode("utf-8"), filename=os.path.basename(path)
+            ),
+            caption="Collapsed stacks (flamegraph.pl / speedscope)"
+        )
+
+
+class AdminMemory(BasicMethod):
+    """The class for the memory report (admins only)."""
+
+    @staticmethod
+    async def method(bot: Bot, message: Message | CallbackQuery) -> None:
+        """
+        The method for answer to the memory cmd (command): the report is diffed with
+        the previous one, so the second "/memory" shows the growth.
+
+        :param bot: The Bot Object.
+        :param message: The message object.
+        :type message: Message | CallbackQuery.
+
+        :return: None.
+        """
+        report: str = await MemoryReporter.get().report()
+        await bot.send_message(
+            text=f"<pre>{html.escape(report[:3900])}</pre>",
+            chat_id=message.from_user.id,
+            parse_mode="HTML"
+        )
+
+
 class DefaultMessage(BasicMethod):
     """The class for the default message."""
 
@@ -171,12 +299,35 @@ class DefaultMessage(BasicMethod):
 
 
 class BotAI(Bot):
-    def __init__(self, token: str, mysql_data: dict):
-        super().__init__(token)
+    def __init__(self, token: str, mysql_data: dict, settings: dict | None = None):
+        settings = dict() if settings is None else settings
+        super().__init__(token, **self.session_options(settings.get("TELEGRAM_API", {})))
         self.__dispatcher: Dispatcher = Dispatcher()
         self.__router: Router = Router()
 
         self.__mysql_data: dict = mysql_data
+        self.__settings: dict = settings
+
+    @staticmethod
+    def session_options(telegram_api: dict) -> dict:
+        """
+        Get the keyword arguments of the Bot for the Bot API server (section
+        "TELEGRAM_API" of bot.json).
+
+        :param telegram_api: Telegram API settings.
+        :return: Dict with the session of a local Bot API server (or the fake one of
+            the replay load test), empty for api.telegram.org.
+        """
+        api_url: str | None = telegram_api.get("BASE_URL")
+        if api_url is None:
+            return dict()
+
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+
+        return {
+            "session": AiohttpSession(api=TelegramAPIServer.from_base(api_url, is_local=True))
+        }
 
     async def __start_command(self, message: Message) -> None:
         """
@@ -252,6 +403,78 @@ class BotAI(Bot):
         """
         await ViewAnalytics.method(self, callback_query)
 
+    async def __admin_stats(self, message: Message) -> None:
+        """
+        The function for the stats command (ignored for non-admin users).
+
+        :param message: Message.
+        :return: None.
+        """
+        if message.from_user.id not in self.__settings.get("ADMINS", []):
+            await DefaultMessage.method(self, message)
+            return
+
+        await AdminStats.method(self, message)
+
+    async def __admin_profile(self, message: Message) -> None:
+        """
+        The function for the profile command (ignored for non-admin users).
+
+        :param message: Message.
+        :return: None.
+        """
+        if message.from_user.id not in self.__settings.get("ADMINS", []):
+            await DefaultMessage.method(self, message)
+            return
+
+        await AdminProfile.method(self, message)
+
+    async def __admin_memory(self, message: Message) -> None:
+        """
+        The function for the memory command (ignored for non-admin users).
+
+        :param message: Message.
+        :return: None.
+        """
+        if message.from_user.id not in self.__settings.get("ADMINS", []):
+            await DefaultMessage.method(self, message)
+            return
+
+        await AdminMemory.method(self, message)
+
+    def __register_memory_counters(self) -> None:
+        """
+        Register the per-subsystem counters of the memory report.
+
+        :return: None.
+        """
+        routers: dict[str, Router] = {
+            "dispatcher": self.__dispatcher,
+            "chat_ai": router_chat_ai,
+            "image_ai": router_ai_img,
+            "main": self.__router
+        }
+        reporter: MemoryReporter = MemoryReporter.get()
+
+        # The memory FSM storage keeps a dict: StorageKey -> record (state and data)
+        reporter.register(
+            "fsm_records", lambda: len(getattr(self.__dispatcher.storage, "storage", {}))
+        )
+        reporter.register("handlers", lambda: {
+            name: sum(len(observer.handlers) for observer in router.observers.values())
+            for name, router in routers.items()
+        })
+        reporter.register("memory_users", LongTermMemory.get().cached_users)
+        reporter.register("prefetched_contexts", ContextPrefetcher.get().entries)
+        reporter.register(
+            "semantic_cache_entries",
+            lambda: len(SemanticCache.get().index) if SemanticCache.get().index is not None else 0
+        )
+        reporter.register("rate_limits", RateLimiter.get().tracked)
+        reporter.register("persistence_pending", PersistenceQueue.get().pending)
+        reporter.register("scheduler_queued", WorkScheduler.get().queued)
+        reporter.register("in_flight", shutdown_coordinator.in_flight)
+
     async def __default_message(self, message: Message) -> None:
         """
         The function for the default message.
@@ -261,25 +484,47 @@ class BotAI(Bot):
         """
         await DefaultMessage.method(self, message)
 
-    async def run(self) -> None:
+    async def __startup(self) -> None:
         """
-        Run function for register routers and methods.
+        Initialize the dependencies concurrently: the schema and getMe are critical,
+        the pool warm-up and the GigaChat OAuth token are finished in the background.
 
         :return: None.
         """
-        connection: pymysql.connections.Connection = await Connection.get_connection(
-            self.__mysql_data
+        storage: BaseStorage = StorageFactory.get()
+        giga_data: dict = await GigaData.get_data()
+
+        startup: Startup = Startup()
+        await startup.run(
+            {
+                "schema": storage.init(),
+                "pool_warm_up": storage.warm_up(),
+                "oauth_token": TokenStore.refresh(giga_data["auth_token"]),
+                "quota_usage": RateLimiter.get().load(),
+                "get_me": self.me()
+            },
+            critical={"schema", "get_me"},
+            depends_on={"quota_usage": "schema"}
         )
-        cursor = connection.cursor()
-
-        table: CreateTable = CreateTable(
-            connection, cursor
+        # The readiness probe requires a fresh token even when no requests come
+        giga_settings: dict = self.__settings.get("GIGACHAT_API", {})
+        TokenStore.start(
+            giga_data["auth_token"],
+            giga_settings.get("TOKEN_REFRESH_MARGIN", 300.0),
+            giga_settings.get("TOKEN_RETRY", 30.0)
         )
-        table.create()
 
+    async def run(self, intake: Callable[[Bot, Dispatcher], Awaitable] | None = None) -> None:
+        """
+        Run function for register routers and methods.
+
+        :param intake: Source of the updates (e.g. the queue of a worker process); the
+            long polling of the dispatcher by default.
+
+        :return: None.
+        """
         logging.info(
-            f"The table has been created successfully! "
-            f"Starting registering methods and commands..."
+            "Starting registering methods and commands..."
         )
 
         self.__router.message.register(
@@ -292,6 +537,21 @@ class BotAI(Bot):
             F.data == "start_chat_dialog_ai"
         )
 
+        self.__router.message.register(
+            self.__admin_stats,
+            Command(commands=["stats"])
+        )
+
+        self.__router.message.register(
+            self.__admin_profile,
+            Command(commands=["profile"])
+        )
+
+        self.__router.message.register(
+            self.__admin_memory,
+            Command(commands=["memory"])
+        )
+
         self.__router.message.register(
             self.__default_message,
             F.content_type == ContentType.TEXT
@@ -316,14 +576,66 @@ class BotAI(Bot):
             self.__router
         )
 
+        self.__dispatcher.update.outer_middleware(LogContextMiddleware())
+        self.__dispatcher.update.outer_middleware(DeduplicationMiddleware())
+        if TrafficRecorder.get().enabled:
+            self.__dispatcher.update.outer_middleware(TrafficRecordingMiddleware())
+
+        Tracer.configure(self.__settings.get("TRACING", {}))
+        GigaSession.configure(self.__settings.get("GIGACHAT_API", {}))
+        if Tracer.enabled:
+            self.__dispatcher.update.outer_middleware(TracingMiddleware())
+            self.session.middleware(TelegramTracingMiddleware())
+
         logging.info(
-            f"I have ended registering methods and commands already"
+            "I have ended registering methods and commands already"
         )
 
-        await self.__dispatcher.start_polling(self)
+        health_settings: dict = self.__settings.get("HEALTH", {})
+        health: HealthServer | None = None
+        if health_settings.get("ENABLED", False):
+            health = HealthServer(health_settings)
+            await health.start()
+
+        await self.__startup()
+
+        RateLimiter.get().start()
+        UsageRecorder.get().start()
+        TrafficRecorder.get().start()
+        ContextArchiver.get().start()
+        self.__register_memory_counters()
+        MemoryReporter.get().start()
+        shutdown_coordinator.register_flush("rate_limits", RateLimiter.get().stop)
+        shutdown_coordinator.register_flush("usage_stats", UsageRecorder.get().stop)
+        shutdown_coordinator.register_flush("memory", LongTermMemory.get().stop)
+        shutdown_coordinator.register_flush("persistence", PersistenceQueue.get().stop)
+        shutdown_coordinator.register_flush("traffic", TrafficRecorder.get().stop)
+        shutdown_coordinator.register_flush("archiver", ContextArchiver.get().stop)
+        # The probes use the storage: the health server is stopped first
+        if health is not None:
+            shutdown_coordinator.register_close("health", health.stop)
+        shutdown_coordinator.register_close("storage", StorageFactory.close)
+        shutdown_coordinator.register_close("giga_token", TokenStore.stop)
+        shutdown_coordinator.register_close("giga_session", GigaSession.close)
+        shutdown_coordinator.register_close("bot_session", self.session.close)
+        shutdown_coordinator.register_close("memory_report", MemoryReporter.get().stop)
+        shutdown_coordinator.register_close("tracing", lambda: asyncio.to_thread(Tracer.close))
+        SamplingProfiler.get().install_signal_handler()
 
         logging.info(
-            f"The bot is up and running"
+            "The bot is up and running"
+        )
+
+        if intake is None:
+            shutdown_coordinator.install_signal_handlers(self.__dispatcher)
+            await self.__dispatcher.start_polling(
+                self, handle_signals=False, close_bot_session=False
+            )
+        else:
+            await intake(self, self.__dispatcher)
+
+        await shutdown_coordinator.shutdown(
+            self.__settings.get("SHUTDOWN", {}).get("DEADLINE", 25.0)
         )
 
 
@@ -353,10 +665,19 @@ class GetData(BaseGetData):
         :return: Dict-data.
         """
         with open(file_path, "r") as file:
-            data: dict = json.load(file)
+            data: dict = Serializer.loads(file.read())
             result_dict: dict = {
                 "BOT_TOKEN": data["BOT_TOKEN"],
-                "MYSQL": data["MYSQL"]
+                "MYSQL": data.get("MYSQL", {}),
+                "SHUTDOWN": data.get("SHUTDOWN", {}),
+                "HEALTH": data.get("HEALTH", {}),
+                "ADMINS": data.get("ADMINS", []),
+                "TRACING": data.get("TRACING", {}),
+                "PROFILER": data.get("PROFILER", {}),
+                "TRAFFIC_RECORDER": data.get("TRAFFIC_RECORDER", {}),
+                "WORKERS": data.get("WORKERS", {}),
+                "TELEGRAM_API": data.get("TELEGRAM_API", {}),
+                "GIGACHAT_API": data.get("GIGACHAT_API", {})
             }
 
             return result_dict
@@ -371,6 +692,7 @@ async def run() -> None:
     data: dict = await GetData.get_data()
     bot: BotAI = BotAI(
         data["BOT_TOKEN"],
-        data["MYSQL"]
+        data["MYSQL"],
+        data
     )
     await bot.run()
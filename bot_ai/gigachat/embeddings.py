@@ -0,0 +1,118 @@
+"""
+Module of the text embeddings: the GigaChat embeddings API and a local hashing stub
+(no network, for development and tests).
+"""
+import abc
+import math
+import re
+import zlib
+
+from bot_ai.gigachat.giga_requests import (
+    GetData, GigaSession, TokenExpiredError, TokenStore
+)
+from bot_ai.utils.serializer import Serializer
+from bot_ai.utils.tracing import Tracer
+
+
+class BaseEmbedder(abc.ABC):
+    """Base class of the embedders."""
+
+    @abc.abstractmethod
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed the texts (one request for the batch).
+
+        :param texts: Texts.
+        :return: Vectors in the order of the texts.
+        """
+
+
+class GigaEmbedder(BaseEmbedder):
+    """Embeddings of the GigaChat API."""
+
+    def __init__(self, model: str = "Embeddings") -> None:
+        self.model: str = model
+
+    @Tracer.trace("giga.embeddings")
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed the texts by the GigaChat API.
+
+        :param texts: Texts.
+        :return: Vectors in the order of the texts.
+        """
+        data: dict = await GetData.get_data()
+        url: str = f"{GigaSession.api_url}/embeddings"
+        headers: dict = {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+            'Authorization': 'Bearer ' + await TokenStore.get_token(data)
+        }
+        body: bytes = Serializer.dumps({"model": self.model, "input": texts})
+
+        async with GigaSession.get().post(url, data=body, headers=headers) as answer:
+            if answer.status == 401:
+                await TokenStore.refresh(data["auth_token"])
+                raise TokenExpiredError(await answer.text())
+            response: dict = Serializer.loads(await answer.read())
+
+        items: list[dict] = sorted(response["data"], key=lambda item: item.get("index", 0))
+
+        return [item["embedding"] for item in items]
+
+
+class HashEmbedder(BaseEmbedder):
+    """Local stub: hashed bag of the words and character trigrams."""
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim: int = dim
+
+    def embed_one(self, text: str) -> list[float]:
+        """
+        Embed one text.
+
+        :param text: Text.
+        :return: Unit vector.
+        """
+        vector: list[float] = [0.0] * self.dim
+        for word in re.findall(r"\w+", text.lower()):
+            padded: str = f"#{word}#"
+            features: list[str] = [word] + [padded[i:i + 3] for i in range(len(padded) - 2)]
+            for feature in features:
+                digest: int = zlib.crc32(feature.encode("utf-8"))
+                vector[digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+
+        norm: float = math.sqrt(sum(value * value for value in vector)) or 1.0
+
+        return [value / norm for value in vector]
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed the texts locally.
+
+        :param texts: Texts.
+        :return: Vectors in the order of the texts.
+        """
+        return [self.embed_one(text) for text in texts]
+
+
+class EmbedderFactory:
+    """Creation of the embedder by the settings."""
+
+    @staticmethod
+    def create(settings: dict) -> BaseEmbedder:
+        """
+        Create the embedder.
+
+        :param settings: Settings with "EMBEDDER" ("giga" or "hash"), "EMBEDDING_MODEL"
+            and "HASH_DIM".
+
+        :return: Embedder.
+        """
+        kind: str = settings.get("EMBEDDER", "giga").lower()
+        if kind == "giga":
+            return GigaEmbedder(settings.get("EMBEDDING_MODEL", "Embeddings"))
+        if kind == "hash":
+            return HashEmbedder(settings.get("HASH_DIM", 256))
+
+        raise ValueError(f"Unknown embedder: {kind}")
@@ -1,6 +1,7 @@
 """Module for manage Giga Chat AI."""
 
 import abc
+import functools
 import logging
 
 from aiogram import Bot, Router
@@ -10,8 +11,16 @@ from aiogram import types
 
 from bot_ai.states import GetQuery
 from bot_ai.buttons import Buttons
-from bot_ai.gigachat.giga_requests import VersionAIPro
+from bot_ai.gigachat.giga_requests import TOKEN_REFRESH_ANSWER, VersionAIPro
+from bot_ai.gigachat.memory import LongTermMemory
+from bot_ai.gigachat.prefetch import ContextPrefetcher
+from bot_ai.gigachat.semantic_cache import SemanticCache
 from bot_ai.utils.handler_db import HandlerDB
+from bot_ai.utils.persistence import PersistenceQueue
+from bot_ai.utils.rate_limit import LimitDecision, RateLimiter
+from bot_ai.utils.scheduler import OverloadedError, WorkScheduler
+from bot_ai.utils.shutdown import shutdown_coordinator
+from bot_ai.utils.usage_stats import UsageRecorder
 
 router_chat_ai: Router = Router()
 
@@ -41,13 +50,13 @@ class BaseUpdateMessages(abc.ABC):
 
     @staticmethod
     @abc.abstractmethod
-    async def update_messages(role: str, content: str, telegram_id: int) -> None:
+    async def append_turn(telegram_id: int, prompt: str, response: str) -> None:
         """
-        The method for update messages.
+        The method for append the turn to the stored context.
 
-        :param role: Role of message.
-        :param content: Content of message.
         :param telegram_id: Telegram ID.
+        :param prompt: Message of the user.
+        :param response: Answer of the AI.
 
         :return: None.
         """
@@ -86,38 +95,45 @@ class UpdateMessages(BaseUpdateMessages):
     """The class for update messages."""
 
     @staticmethod
-    @abc.abstractmethod
-    async def update_messages(role: str, content: str, telegram_id: int) -> None:
+    def append(messages: list, role: str, content: str) -> list:
         """
-        The method for update messages.
+        Append the message to the context (the oldest non-system message is dropped
+        when the context is full).
 
+        :param messages: Context.
         :param role: Role of message.
         :param content: Content of message.
+
+        :return: The same context.
+        """
+        if len(messages) >= 10:
+            messages.pop(1)
+
+        messages.append(
+            {
+                "role": role,
+                "content": content
+            }
+        )
+
+        return messages
+
+    @staticmethod
+    async def append_turn(telegram_id: int, prompt: str, response: str) -> None:
+        """
+        The method for append the turn to the stored context. The context is re-read
+        here (in the persistence worker of the user), so concurrent turns of the same
+        user are appended one after another instead of overwriting each other.
+
         :param telegram_id: Telegram ID.
+        :param prompt: Message of the user.
+        :param response: Answer of the AI.
 
         :return: None.
         """
         messages: list = await HandlerDB.get_context(telegram_id)
-        try:
-            if len(messages) >= 10:
-                messages.pop(1)
-
-            messages.append(
-                {
-                    "role": role,
-                    "content": content
-                }
-            )
-        except Exception as ex:
-            logging.error(
-                f"Error in update messages: {ex}"
-            )
-            messages.append(
-                {
-                    "role": role,
-                    "content": content
-                }
-            )
+        UpdateMessages.append(messages, "user", prompt)
+        UpdateMessages.append(messages, "assistant", response)
 
         await HandlerDB.update_context(telegram_id, messages)
 
@@ -145,6 +161,8 @@ class GigaChatAI:
         :return: None.
         """
         await state.set_state(GetQuery.query)
+        # The first message is likely to follow: load its context while the user types
+        ContextPrefetcher.get().prefetch(callback_query.from_user.id)
 
         await self.__bot.edit_message_text(
             text="Hey, I'm ready to start the dialogue with you! What question are you interested "
@@ -184,6 +202,24 @@ class ChatDialogGigaVersionPro(BaseChatDialog):
     The class for Chat-Dialog function (GigaPro V. dialog).
     """
 
+    async def __notify_queued(self, telegram_id: int, wait: float) -> None:
+        """
+        Tell the user that the request is queued.
+
+        :param telegram_id: Telegram ID of the user.
+        :param wait: Estimated wait (seconds).
+
+        :return: None.
+        """
+        try:
+            await self.bot.send_message(
+                text=f"⏳ Many requests right now, your answer is in the queue "
+                     f"(about {max(1, round(wait))} s).",
+                chat_id=telegram_id
+            )
+        except Exception as ex:
+            logging.warning("The exception has arisen: %s.", ex)
+
     async def chat_dialog(self, message: types.Message, state: FSMContext) -> None:
         """
         GLV Chat-Dialog function.
@@ -194,40 +230,89 @@ class ChatDialogGigaVersionPro(BaseChatDialog):
         :return: None.
         """
         if message.text.lower() != "/stop":
-            router_chat_ai.message.register(
-                ChatDialogGigaVersionPro.chat_dialog,
-                GetQuery.query
-            )
-
-            await HandlerDB.update_analytic_datas_count_ai_queries(message)
-            await UpdateMessages.update_messages("user", message.text, message.from_user.id)
-            messages: list = await HandlerDB.get_context(message.from_user.id)
-
-            response: str = await VersionAIPro.request(messages, message.from_user.id)
+            async with shutdown_coordinator.job("chat", message.from_user.id):
+                limiter: RateLimiter = RateLimiter.get()
+                decision: LimitDecision = limiter.acquire("text", message.from_user.id)
+                if not decision.allowed:
+                    await self.bot.send_message(
+                        text=decision.message(),
+                        chat_id=message.from_user.id
+                    )
+                    return
+
+                router_chat_ai.message.register(
+                    ChatDialogGigaVersionPro.chat_dialog,
+                    GetQuery.query
+                )
 
-            try:
-                await self.bot.send_message(
-                    text=response,
-                    chat_id=message.from_user.id,
-                    parse_mode="Markdown",
+                # The previous turn may still be persisting: read the context after it
+                persistence: PersistenceQueue = PersistenceQueue.get()
+                await persistence.drain(message.from_user.id)
+                prefetcher: ContextPrefetcher = ContextPrefetcher.get()
+                messages: list = UpdateMessages.append(
+                    await prefetcher.context(message.from_user.id), "user", message.text
                 )
-            except Exception as ex:
-                logging.error(
-                    f"Error in send message: {ex}"
+
+                try:
+                    async with WorkScheduler.get().slot(
+                            "text", functools.partial(self.__notify_queued, message.from_user.id)
+                    ):
+                        memory: LongTermMemory = LongTermMemory.get()
+                        prompt, _ = await memory.assemble(message.from_user.id, messages)
+
+                        response: str = await SemanticCache.get().cached(
+                            messages,
+                            functools.partial(VersionAIPro.request, prompt, message.from_user.id)
+                        )
+                except OverloadedError as ex:
+                    limiter.refund("text", message.from_user.id)
+                    await self.bot.send_message(text=ex.message(), chat_id=message.from_user.id)
+                    return
+
+                if response == TOKEN_REFRESH_ANSWER:
+                    limiter.refund("text", message.from_user.id)
+                else:
+                    UsageRecorder.get().record(message.from_user.id, "text")
+                    memory.remember(message.from_user.id, message.text, response)
+
+                # The writes run in the background (in order per user), off the reply path;
+                # the turn is appended to the context as it is then, not to this snapshot
+                persistence.submit(
+                    message.from_user.id,
+                    "analytics",
+                    functools.partial(HandlerDB.update_analytic_datas_count_ai_queries, message)
                 )
-                await self.bot.send_message(
-                    text=response,
-                    chat_id=message.from_user.id,
-                    parse_mode=None,
+                persistence.submit(
+                    message.from_user.id,
+                    "context",
+                    functools.partial(
+                        UpdateMessages.append_turn, message.from_user.id, message.text, response
+                    )
                 )
-
-            await UpdateMessages.update_messages("assistant", response, message.from_user.id)
-
-            await state.clear()
-            new_state: BaseNewFSMContext = NewFSMContextPro(self.bot)
-            await new_state.set(state)
+                prefetcher.invalidate(message.from_user.id)
+
+                try:
+                    await self.bot.send_message(
+                        text=response,
+                        chat_id=message.from_user.id,
+                        parse_mode="Markdown",
+                    )
+                except Exception as ex:
+                    logging.error(
+                        "Error in send message: %s", ex
+                    )
+                    await self.bot.send_message(
+                        text=response,
+                        chat_id=message.from_user.id,
+                        parse_mode=None,
+                    )
+
+                await state.clear()
+                new_state: BaseNewFSMContext = NewFSMContextPro(self.bot)
+                await new_state.set(state)
 
         else:
+            ContextPrefetcher.get().invalidate(message.from_user.id)
             var: InlineKeyboardBuilder = await Buttons.create(
                 {"🌐 Main": "back_on_main"}
             )
@@ -1,13 +1,12 @@
 """Module for manage Giga Image AI:
 get requests, and send requests, images."""
 
+import functools
 import logging
-import os
 from io import BytesIO
-from PIL import Image
 
 from aiogram import types, Bot, Router, F
-from aiogram.types.input_file import FSInputFile
+from aiogram.types.input_file import BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
@@ -15,6 +14,11 @@ from bot_ai.buttons import Buttons
 from bot_ai.gigachat.giga_requests import VersionAIImagePro
 from bot_ai.states import GigaImage
 from bot_ai.utils.handler_db import HandlerDB
+from bot_ai.utils.rate_limit import LimitDecision, RateLimiter
+from bot_ai.utils.scheduler import OverloadedError, WorkScheduler
+from bot_ai.utils.shutdown import shutdown_coordinator
+from bot_ai.utils.tracing import Tracer
+from bot_ai.utils.usage_stats import UsageRecorder
 
 router_ai_img: Router = Router()
 
@@ -86,13 +90,58 @@ class GigaCreator:
 
     async def __handler_query(self, call: types.CallbackQuery) -> None:
         """
-        Manage of query from premium-user for create image.
+        Manage of query from premium-user for create image (tracked as an in-flight job).
+
+        :param call: Call-Query.
+        :return: None.
+        """
+        async with shutdown_coordinator.job("image", call.from_user.id):
+            await self.__generate(call)
+
+    async def __notify_queued(self, call: types.CallbackQuery, wait: float) -> None:
+        """
+        Tell the user that the generation is queued.
+
+        :param call: Call-Query.
+        :param wait: Estimated wait (seconds).
+
+        :return: None.
+        """
+        try:
+            await self.__bot.edit_message_text(
+                chat_id=call.from_user.id,
+                text=f"💫 Many requests right now, your image is in the queue "
+                     f"(about {max(1, round(wait))} s) ⏳",
+                message_id=call.message.message_id
+            )
+        except Exception as ex:
+            logging.warning("The exception has arisen: %s.", ex)
+
+    async def __generate(self, call: types.CallbackQuery) -> None:
+        """
+        Generate the image and send it to the user.
 
         :param call: Call-Query.
         :return: None.
         """
         query: str = self.__class__.__query
 
+        limiter: RateLimiter = RateLimiter.get()
+        decision: LimitDecision = limiter.acquire("image", call.from_user.id)
+        if not decision.allowed:
+            var: InlineKeyboardBuilder = await Buttons.create(
+                data={
+                    "Back to main menu 🌐": "back_on_main"
+                }
+            )
+            await self.__bot.edit_message_text(
+                chat_id=call.from_user.id,
+                text=decision.message(),
+                message_id=call.message.message_id,
+                reply_markup=var.as_markup()
+            )
+            return
+
         try:
             await self.__bot.edit_message_text(
                 chat_id=call.from_user.id,
@@ -100,14 +149,37 @@ class GigaCreator:
                 message_id=call.message.message_id
             )
         except Exception as ex:
-            logging.warning(f"The exception has arisen: {ex}.")
+            logging.warning("The exception has arisen: %s.", ex)
 
             await self.__bot.send_message(
                 chat_id=call.from_user.id,
                 text="💫 Please, wait! I'm generating... ⏳",
             )
 
-        image_data: str | bytes = await VersionAIImagePro.request(query)
+        try:
+            async with WorkScheduler.get().slot(
+                    "image", functools.partial(self.__notify_queued, call)
+            ):
+                image_data: str | bytes = await VersionAIImagePro.request(query)
+        except OverloadedError as ex:
+            limiter.refund("image", call.from_user.id)
+            var: InlineKeyboardBuilder = await Buttons.create(
+                data={
+                    "Back to main menu 🌐": "back_on_main"
+                }
+            )
+            await self.__bot.edit_message_text(
+                chat_id=call.from_user.id,
+                text=ex.message(),
+                message_id=call.message.message_id,
+                reply_markup=var.as_markup()
+            )
+            return
+
+        if not isinstance(image_data, bytes):
+            limiter.refund("image", call.from_user.id)
+
+        remaining: int | None = limiter.remaining("image", call.from_user.id)
         try:
             if image_data == "Sorry! I updated the data. Please, repeat your request :)":
                 var: InlineKeyboardBuilder = await Buttons.create(
@@ -122,16 +194,22 @@ class GigaCreator:
                     reply_markup=var.as_markup()
                 )
             else:
-                image: Image = Image.open(BytesIO(image_data))
-                temp_image: str = 'AI_Photo_By_CW_PREMIUM_Version.jpg'
-                image.save(temp_image, 'JPEG')
+                from PIL import Image
+
+                with Tracer.span("pil.convert", size=len(image_data)):
+                    image: Image.Image = Image.open(BytesIO(image_data))
+                    buffer: BytesIO = BytesIO()
+                    image.save(buffer, 'JPEG')
 
                 await self.__bot.send_document(
                     chat_id=call.from_user.id,
-                    document=FSInputFile(temp_image),
+                    document=BufferedInputFile(
+                        buffer.getvalue(), filename='AI_Photo_By_CW_PREMIUM_Version.jpg'
+                    ),
                     caption=f"<b>{call.from_user.first_name}</b>, the new photo has been generated"
                             f" according to your request: <blockquote>{self.__class__.__query}"
-                            f"</blockquote>\n\n✨ There are still generations left: ♾.\n\nThe "
+                            f"</blockquote>\n\n✨ There are still generations left: "
+                            f"{'♾' if remaining is None else remaining}.\n\nThe "
                             f"photo is attached to the message as a file. Download it by clicking "
                             f"on the button above.\n\n"
                             f"#AI_Photo\nDeveloper: @aleksandr_twitt.",
@@ -139,8 +217,6 @@ class GigaCreator:
                     message_effect_id='5104841245755180586'
                 )
 
-                os.remove(temp_image)
-
                 var: InlineKeyboardBuilder = await Buttons.create(
                     data={
                         "Back to main menu 🌐": "back_on_main"
@@ -153,6 +229,7 @@ class GigaCreator:
                 )
 
                 await HandlerDB.update_analytic_datas_count_ai_queries(call)
+                UsageRecorder.get().record(call.from_user.id, "image")
 
                 await self.__bot.delete_message(
                     chat_id=call.from_user.id,
@@ -160,7 +237,7 @@ class GigaCreator:
                 )
 
         except Exception as ex:
-            logging.warning(f"The exception has arisen: {ex}.")
+            logging.warning("The exception has arisen: %s.", ex)
 
             var: InlineKeyboardBuilder = await Buttons.create(
                 data={
@@ -1,10 +1,27 @@
 """
 Module of the GigaChatAI model -- API requests.
 """
+import asyncio
+import functools
 import json
-import requests
 import logging
 import abc
+import os
+import tempfile
+import time
+
+import aiohttp
+
+from bot_ai.gigachat.hedging import Hedger
+from bot_ai.gigachat.model_router import ModelRouter
+from bot_ai.utils.serializer import Serializer
+from bot_ai.utils.tracing import Tracer
+
+TOKEN_REFRESH_ANSWER: str = "Sorry! I updated the data. Please, repeat your request :)"
+
+
+class TokenExpiredError(Exception):
+    """The GigaChat API has rejected the access token."""
 
 
 class BaseGetData(abc.ABC):
@@ -51,6 +68,49 @@ class BaseGetToken(abc.ABC):
         """
 
 
+class GigaSession:
+    """Holder of the shared HTTP session for the GigaChat API (non-blocking requests)."""
+    __session: aiohttp.ClientSession | None = None
+    api_url: str = "https://gigachat.devices.sberbank.ru/api/v1"
+    auth_url: str = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+
+    @classmethod
+    def configure(cls, settings: dict) -> None:
+        """
+        Set the endpoints of the API (e.g. a local fake server for load tests).
+
+        :param settings: Section "GIGACHAT_API" of bot.json.
+        :return: None.
+        """
+        cls.api_url = settings.get("API_URL", cls.api_url).rstrip("/")
+        cls.auth_url = settings.get("AUTH_URL", cls.auth_url)
+
+    @classmethod
+    def get(cls) -> aiohttp.ClientSession:
+        """
+        Get the session (create it on the first call).
+
+        :return: Client session.
+        """
+        if cls.__session is None or cls.__session.closed:
+            cls.__session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(ssl=False)
+            )
+
+        return cls.__session
+
+    @classmethod
+    async def close(cls) -> None:
+        """
+        Close the session.
+
+        :return: None.
+        """
+        if cls.__session is not None:
+            await cls.__session.close()
+            cls.__session = None
+
+
 class GetAuthTokenSber(BaseGetToken):
     """The base class for obtaining a token AI SBER API (GigaChat API)."""
 
@@ -62,7 +122,20 @@ class GetAuthTokenSber(BaseGetToken):
         :param auth_token_giga: Authorization token for GigaChatAI (requests only now).
         :return: Access (Auth) Token for GigaChatAI (answers).
         """
-        url: str = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+        token, _ = await GetAuthTokenSber.get_token_info(auth_token_giga)
+
+        return token
+
+    @staticmethod
+    @Tracer.trace("giga.get_token")
+    async def get_token_info(auth_token_giga: str) -> tuple[str, float]:
+        """
+        Get token for admin-AI-Account GigaChat and the time of its expiration.
+
+        :param auth_token_giga: Authorization token for GigaChatAI (requests only now).
+        :return: Access (Auth) Token for GigaChatAI and its expiration (unix time, seconds).
+        """
+        url: str = GigaSession.auth_url
 
         payload: str = 'scope=GIGACHAT_API_PERS'
         headers: dict = {
@@ -72,15 +145,146 @@ class GetAuthTokenSber(BaseGetToken):
             'Authorization': 'Basic ' + auth_token_giga
         }
 
-        response: dict = requests.request(
-            method="POST",
-            url=url,
-            headers=headers,
-            data=payload,
-            verify=False
-        ).json()
+        async with GigaSession.get().post(url, headers=headers, data=payload) as answer:
+            response: dict = Serializer.loads(await answer.read())
+
+        return response['access_token'], response.get('expires_at', 0) / 1000
+
+
+class TokenStore:
+    """
+    Cache of the access token of GigaChat API. The token is fetched at startup and
+    refreshed before its expiration (or after a failed request).
+    """
+    token: str | None = None
+    expires_at: float = 0.0
+    __lock: asyncio.Lock | None = None
+    __task: asyncio.Task | None = None
+
+    @classmethod
+    def is_fresh(cls, margin: float = 60.0) -> bool:
+        """
+        Check if the cached token is valid for at least `margin` seconds.
+
+        :param margin: Margin in seconds.
+        :return: True if the token is fresh.
+        """
+        return cls.token is not None and cls.expires_at - margin > time.time()
+
+    @classmethod
+    async def refresh(cls, auth_token_giga: str) -> str:
+        """
+        Fetch a new token and save it to the conf-file. Concurrent callers share
+        one request.
+
+        :param auth_token_giga: Authorization token for GigaChatAI.
+        :return: Access token.
+        """
+        if cls.__lock is None:
+            cls.__lock = asyncio.Lock()
+
+        expires_at: float = cls.expires_at
+        async with cls.__lock:
+            if cls.expires_at != expires_at and cls.is_fresh():
+                return cls.token
 
-        return response['access_token']
+            token, expires_at = await GetAuthTokenSber.get_token_info(auth_token_giga)
+            cls.token, cls.expires_at = token, expires_at
+
+            await asyncio.to_thread(cls.__save, token)
+
+        return token
+
+    @staticmethod
+    def __save(token: str, file_path: str = "bot.json") -> None:
+        """
+        Save the token to the conf-file. The file is replaced atomically: the other
+        worker processes read it at the same time and must never see it half-written.
+
+        :param token: Access token.
+        :param file_path: bot.json path.
+
+        :return: None.
+        """
+        with open(file_path, encoding='utf-8') as f:
+            dt: dict = json.load(f)
+
+        dt["GIGA_CHAT_TOKEN"] = token
+
+        descriptor, temp_path = tempfile.mkstemp(
+            prefix=".bot.json.", dir=os.path.dirname(os.path.abspath(file_path))
+        )
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as fl:
+                json.dump(dt, fl, ensure_ascii=False, indent=4)
+            os.chmod(temp_path, os.stat(file_path).st_mode & 0o777)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    @classmethod
+    async def __run(cls, auth_token_giga: str, margin: float, retry: float) -> None:
+        """
+        Refresh the token `margin` seconds before its expiration (retry after a failure),
+        so an idle process keeps a fresh token too.
+
+        :param auth_token_giga: Authorization token for GigaChatAI.
+        :param margin: Margin in seconds.
+        :param retry: Pause before the next attempt after a failure.
+
+        :return: None.
+        """
+        while True:
+            await asyncio.sleep(max(cls.expires_at - margin - time.time(), 0.0))
+            try:
+                await cls.refresh(auth_token_giga)
+            except Exception as ex:
+                logging.warning("GigaChat token has not been refreshed: %r", ex)
+                await asyncio.sleep(retry)
+
+    @classmethod
+    def start(cls, auth_token_giga: str, margin: float = 300.0, retry: float = 30.0) -> None:
+        """
+        Start the background refresh of the token.
+
+        :param auth_token_giga: Authorization token for GigaChatAI.
+        :param margin: Refresh the token this many seconds before its expiration.
+        :param retry: Pause before the next attempt after a failure.
+
+        :return: None.
+        """
+        if cls.__task is None:
+            cls.__task = asyncio.create_task(
+                cls.__run(auth_token_giga, margin, retry), name="giga-token-refresher"
+            )
+
+    @classmethod
+    async def stop(cls) -> None:
+        """
+        Stop the background refresh of the token.
+
+        :return: None.
+        """
+        if cls.__task is not None:
+            cls.__task.cancel()
+            cls.__task = None
+
+    @classmethod
+    async def get_token(cls, data: dict) -> str:
+        """
+        Get the access token: the cached one if it is fresh, a refreshed one if it has
+        expired, otherwise the one from the conf-file.
+
+        :param data: Dict with data of GetData.get_data.
+        :return: Access token.
+        """
+        if cls.is_fresh():
+            return cls.token
+        if cls.token is not None:
+            return await cls.refresh(data["auth_token"])
+
+        return data["token"]
 
 
 class BaseAIText(abc.ABC):
@@ -128,22 +332,22 @@ class GigaChatPro(BaseAIText):
     """
 
     @staticmethod
-    async def request(messages: list, token_giga: str, temperature_giga: float,
-                      top_p_giga: float, auth_token_giga: str, telegram_id: int) -> str:
+    @Tracer.trace("giga.chat_completion")
+    async def complete(messages: list, token_giga: str, temperature_giga: float,
+                       top_p_giga: float, telegram_id: int, model: str) -> str:
         """
-        Answer for the user from the request (from the user) by GigaChatPRO.
-        Limited Version of the Answers for the user. Premium answers (PRO).
+        One chat completion by the model.
 
         :param messages: Messages from the user.
         :param token_giga: Token of the GigaChatAI.
         :param temperature_giga: Temperature of an answer.
         :param top_p_giga: Alternative to temperature.
-        :param auth_token_giga: Authorization token of the GigaChatAI.
         :param telegram_id: Telegram ID of the user.
+        :param model: Name of the model.
 
-        :return: Result.
+        :return: Answer.
         """
-        url: str = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
+        url: str = f"{GigaSession.api_url}/chat/completions"
 
         headers: dict = {
             'Content-Type': 'application/json',
@@ -152,63 +356,93 @@ class GigaChatPro(BaseAIText):
             'X-Session-ID': f"{telegram_id}"
         }
 
-        body: str = json.dumps({
-            "model": "GigaChat-Max",
+        body: bytes = Serializer.dumps({
+            "model": model,
             "messages": messages,
             "temperature": temperature_giga,
             "top_p": top_p_giga
         })
 
-        try:
-            logging.info("Sending a request to retrieve text in PRO mode at the user's request")
-            response: dict = requests.request(
-                method="POST",
-                url=url,
-                data=body,
-                headers=headers,
-                verify=False
-            ).json()
+        async with GigaSession.get().post(url, data=body, headers=headers) as answer:
+            if answer.status == 401:
+                raise TokenExpiredError(await answer.text())
+            response: dict = Serializer.loads(await answer.read())
 
-            logging.info("Successful! I return the answer as text / lines")
+        return response['choices'][0]['message']['content']
 
-            return response['choices'][0]['message']['content']
+    @staticmethod
+    async def request(messages: list, token_giga: str, temperature_giga: float,
+                      top_p_giga: float, auth_token_giga: str, telegram_id: int) -> str:
+        """
+        Answer for the user from the request (from the user) by GigaChatPRO.
+        Limited Version of the Answers for the user. Premium answers (PRO).
+        The model is picked by the ModelRouter (with the fallback to the next one), slow
+        completions are hedged by the Hedger.
 
-        except Exception as ex:
-            new_token: str = await GetAuthTokenSber.get_token(auth_token_giga)
+        :param messages: Messages from the user.
+        :param token_giga: Token of the GigaChatAI.
+        :param temperature_giga: Temperature of an answer.
+        :param top_p_giga: Alternative to temperature.
+        :param auth_token_giga: Authorization token of the GigaChatAI.
+        :param telegram_id: Telegram ID of the user.
 
-            with open("bot.json", encoding='utf-8') as f:
-                dt: dict = json.load(f)
+        :return: Result.
+        """
+        router: ModelRouter = ModelRouter.get()
+        models: list[str] = router.route("text", messages)
 
-            dt["GIGA_CHAT_TOKEN"] = new_token
+        try:
+            logging.info("Sending a request to retrieve text in PRO mode at the user's request")
+            for attempt, model in enumerate(models, start=1):
+                start: float = time.perf_counter()
+                try:
+                    content: str = await Hedger.get().run(model, functools.partial(
+                        GigaChatPro.complete,
+                        messages, token_giga, temperature_giga, top_p_giga, telegram_id, model
+                    ))
+                except TokenExpiredError:
+                    raise
+                except Exception as ex:
+                    router.observe("text", model, time.perf_counter() - start, False)
+                    if attempt == len(models):
+                        raise
+                    router.fallback("text", model, ex)
+                    continue
+
+                router.observe("text", model, time.perf_counter() - start, True)
+                logging.info("Successful! I return the answer of %s as text / lines", model)
+
+                return content
 
-            with open("bot.json", 'w', encoding='utf-8') as fl:
-                json.dump(dt, fl, ensure_ascii=False, indent=4)
+        except Exception as ex:
+            await TokenStore.refresh(auth_token_giga)
 
             logging.warning(
-                f"The AI token has expired. But it's already been updated. Write the "
-                f"AI model enquiry again. The exception has arisen: {ex}"
+                "The AI token has expired. But it's already been updated. Write the "
+                "AI model enquiry again. The exception has arisen: %s", ex
             )
 
-            return "Sorry! I updated the data. Please, repeat your request :)"
+        return TOKEN_REFRESH_ANSWER
 
 
 class GigaImagePro(BaseAIImage):
     """Class of generate images for premium-users."""
 
     @staticmethod
-    async def request(request: str, auth_token_giga: str, token_giga: str) -> bytes | str:
+    @Tracer.trace("giga.image_completion")
+    async def complete(request: str, token_giga: str, model: str) -> bytes | str:
         """
-        Create image for Premium users.
+        One image generation by the model.
 
         :param request: Request / Query from the user.
-        :param auth_token_giga: Authorization token for GigaChatAI (requests only now).
         :param token_giga: Token for requests.
+        :param model: Name of the model.
 
-        :return: Image data | Result (str).
+        :return: Image data | Text answer of the model (str).
         """
-        url: str = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
-        payload: str = json.dumps({
-            "model": "GigaChat-Max",
+        url: str = f"{GigaSession.api_url}/chat/completions"
+        payload: bytes = Serializer.dumps({
+            "model": model,
             "messages": [
                 {
                     "role": "system",
@@ -228,68 +462,84 @@ class GigaImagePro(BaseAIImage):
             'Authorization': 'Bearer ' + token_giga
         }
 
-        try:
+        async with GigaSession.get().post(url, headers=headers, data=payload) as answer:
+            if answer.status == 401:
+                raise TokenExpiredError(await answer.text())
+            response: dict = Serializer.loads(await answer.read())
+
+        if "<img" in str(response["choices"][0]["message"]["content"]):
+            src: str = str(response["choices"][0]["message"]["content"]).split('"')[1]
+
+            url_get_data: str = f"{GigaSession.api_url}/files/{src}/content"
+            headers_get_data: dict = {
+                'Accept': 'application/jpg',
+                'Authorization': 'Bearer ' + token_giga
+            }
+
+            with Tracer.span("giga.file_download"):
+                async with GigaSession.get().get(
+                        url_get_data, headers=headers_get_data
+                ) as answer:
+                    response: bytes = await answer.read()
+
             logging.info(
-                "Sending a request to get the AI image at the user's request"
+                "Successful! The picture was generated, I am returning the response as bytes "
+                "(later converted to a file)"
             )
-            response: dict = requests.request(
-                method="POST",
-                url=url,
-                headers=headers,
-                data=payload,
-                verify=False
-            ).json()
-            if "<img" in str(response["choices"][0]["message"]["content"]):
-                src: str = str(response["choices"][0]["message"]["content"]).split('"')[1]
-
-                url_get_data: str = "https://gigachat.devices.sberbank.ru/api/v1/files/" + \
-                                    src + "/content"
-                headers_get_data: dict = {
-                    'Accept': 'application/jpg',
-                    'Authorization': 'Bearer ' + token_giga
-                }
-
-                response: bytes = requests.request(
-                    method="GET",
-                    url=url_get_data,
-                    headers=headers_get_data,
-                    stream=True,
-                    verify=False
-                ).content
-
-                logging.info(
-                    "Successful! The picture was generated, I am returning the response as bytes "
-                    "(later converted to a file)"
-                )
-
-                return response
-            else:
-                src: str = str(response["choices"][0]["message"]["content"])
-
-                logging.info(
-                    "Something wrong. Perhaps the user did not request an image, but entered a "
-                    "text generation request"
-                )
-
-                return src
 
-        except Exception as ex:
-            new_token: str = await GetAuthTokenSber.get_token(auth_token_giga)
+            return response
 
-            with open("bot.json", encoding='utf-8') as f:
-                dt: dict = json.load(f)
+        logging.info(
+            "Something wrong. Perhaps the user did not request an image, but entered a "
+            "text generation request"
+        )
 
-            dt["GIGA_CHAT_TOKEN"] = new_token
+        return str(response["choices"][0]["message"]["content"])
 
-            with open("bot.json", 'w', encoding='utf-8') as fl:
-                json.dump(dt, fl, ensure_ascii=False, indent=4)
+    @staticmethod
+    async def request(request: str, auth_token_giga: str, token_giga: str) -> bytes | str:
+        """
+        Create image for Premium users (the model is picked by the ModelRouter).
+
+        :param request: Request / Query from the user.
+        :param auth_token_giga: Authorization token for GigaChatAI (requests only now).
+        :param token_giga: Token for requests.
+
+        :return: Image data | Result (str).
+        """
+        router: ModelRouter = ModelRouter.get()
+        models: list[str] = router.route("image")
+
+        try:
+            logging.info(
+                "Sending a request to get the AI image at the user's request"
+            )
+            for attempt, model in enumerate(models, start=1):
+                start: float = time.perf_counter()
+                try:
+                    result: bytes | str = await GigaImagePro.complete(request, token_giga, model)
+                except TokenExpiredError:
+                    raise
+                except Exception as ex:
+                    router.observe("image", model, time.perf_counter() - start, False)
+                    if attempt == len(models):
+                        raise
+                    router.fallback("image", model, ex)
+                    continue
+
+                router.observe("image", model, time.perf_counter() - start, True)
+
+                return result
+
+        except Exception as ex:
+            await TokenStore.refresh(auth_token_giga)
 
             logging.warning(
-                f"The AI token has expired. But it's already been updated. Write the "
-                f"AI model enquiry again. The exception has arisen: {ex}"
+                "The AI token has expired. But it's already been updated. Write the "
+                "AI model enquiry again. The exception has arisen: %s", ex
             )
 
-            return "Sorry! I updated the data. Please, repeat your request :)"
+        return TOKEN_REFRESH_ANSWER
 
 
 class GetData(BaseGetData):
@@ -304,7 +554,7 @@ class GetData(BaseGetData):
         :return: Dict with data.
         """
         with open(file_path, encoding="utf-8") as file:
-            data: dict = json.load(file)
+            data: dict = Serializer.loads(file.read())
 
             token: str = data["GIGA_CHAT_TOKEN"]
             auth_token: str = data["GIGA_CHAT_AUTH_TOKEN"]
@@ -342,7 +592,7 @@ class VersionAIImagePro(BaseVersionAI):
         img_data: bytes | str = await GigaImagePro.request(
             messages,
             data["auth_token"],
-            data["token"]
+            await TokenStore.get_token(data)
         )
         return img_data
 
@@ -361,7 +611,7 @@ class VersionAIPro(BaseVersionAI):
         data: dict = await GetData.get_data()
         answer: str = await GigaChatPro.request(
             messages,
-            data["token"],
+            await TokenStore.get_token(data),
             data["temperature"],
             data["top_p"],
             data["auth_token"],
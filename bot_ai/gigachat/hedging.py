@@ -0,0 +1,158 @@
+"""
+Module of the hedged requests: if a chat completion has not returned within the
+observed p95 latency of its model, a duplicate request is sent, the first answer wins
+and the loser is cancelled. The extra load is capped by a budget.
+"""
+import asyncio
+import collections
+import json
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from bot_ai.utils.metrics import metrics
+
+T = TypeVar("T")
+
+metrics.describe("giga_hedge_total", "Duplicate (hedged) completions sent")
+metrics.describe("giga_hedge_wins_total", "Hedged completions which answered first")
+metrics.describe("giga_hedge_skipped_total", "Hedges not sent because of the budget")
+
+
+class LatencyWindow:
+    """Latencies of the last successful requests (for the quantile)."""
+
+    def __init__(self, size: int) -> None:
+        self.values: collections.deque = collections.deque(maxlen=size)
+
+    def add(self, latency: float) -> None:
+        """
+        Add the latency.
+
+        :param latency: Seconds.
+        :return: None.
+        """
+        self.values.append(latency)
+
+    def quantile(self, q: float) -> float:
+        """
+        Get the quantile of the window.
+
+        :param q: Quantile, e.g. 0.95.
+        :return: Seconds.
+        """
+        ordered: list[float] = sorted(self.values)
+
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Hedger:
+    """Hedging of the requests (section "HEDGING" of bot.json)."""
+    __instance: "Hedger | None" = None
+
+    def __init__(self, settings: dict) -> None:
+        self.enabled: bool = settings.get("ENABLED", False)
+        self.quantile: float = settings.get("QUANTILE", 0.95)
+        self.window: int = settings.get("WINDOW", 200)
+        self.min_samples: int = settings.get("MIN_SAMPLES", 20)
+        self.min_delay: float = settings.get("MIN_DELAY", 1.0)
+        self.budget: float = settings.get("BUDGET", 0.05)
+
+        self.__latencies: dict[str, LatencyWindow] = dict()
+        self.__hedged: collections.deque = collections.deque(maxlen=self.window)
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "Hedger":
+        """
+        Get the hedger (created from the "HEDGING" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Hedger.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("HEDGING", {}))
+
+        return cls.__instance
+
+    def threshold(self, key: str) -> float | None:
+        """
+        Get the delay before the hedge.
+
+        :param key: Key of the latency window (name of the model).
+        :return: Seconds or None (not enough samples yet).
+        """
+        window: LatencyWindow | None = self.__latencies.get(key)
+        if window is None or len(window.values) < self.min_samples:
+            return None
+
+        return max(self.min_delay, window.quantile(self.quantile))
+
+    def __within_budget(self) -> bool:
+        """
+        Check if one more hedge keeps the share of the hedged requests under the budget.
+
+        :return: True if the hedge is allowed.
+        """
+        return sum(self.__hedged) + 1 <= self.budget * max(len(self.__hedged), 1)
+
+    async def __timed(self, key: str, make: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run the request and record its latency on success.
+
+        :param key: Key of the latency window.
+        :param make: Factory of the request.
+
+        :return: Result of the request.
+        """
+        start: float = time.perf_counter()
+        result: T = await make()
+        self.__latencies.setdefault(key, LatencyWindow(self.window)).add(
+            time.perf_counter() - start
+        )
+
+        return result
+
+    async def run(self, key: str, make: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run the request, hedged if it is slower than the threshold.
+
+        :param key: Key of the latency window (name of the model).
+        :param make: Factory of the request (called once per copy).
+
+        :return: Result of the first successful copy.
+        """
+        if not self.enabled:
+            return await make()
+
+        delay: float | None = self.threshold(key)
+        primary: asyncio.Task = asyncio.ensure_future(self.__timed(key, make))
+        tasks: set[asyncio.Task] = {primary}
+        hedged: bool = False
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    if self.__within_budget():
+                        hedged = True
+                        tasks.add(asyncio.ensure_future(self.__timed(key, make)))
+                        metrics.inc("giga_hedge_total", model=key)
+                        metrics.set("giga_hedge_threshold_seconds", delay, model=key)
+                    else:
+                        metrics.inc("giga_hedge_skipped_total", model=key)
+            self.__hedged.append(hedged)
+
+            error: BaseException | None = None
+            pending: set[asyncio.Task] = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            metrics.inc("giga_hedge_wins_total", model=key)
+                        return task.result()
+                    error = error or task.exception()
+
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,236 @@
+"""
+Module of the long-term retrieval memory: the past turns of every user are embedded
+and indexed, and each prompt is assembled from the system message, the top-k relevant
+past turns and the last few messages instead of the whole stored history.
+"""
+import array
+import asyncio
+import collections
+import json
+import logging
+
+from bot_ai.gigachat.embeddings import BaseEmbedder, EmbedderFactory
+from bot_ai.storage.factory import StorageFactory
+from bot_ai.utils.metrics import metrics
+from bot_ai.utils.vector_index import VectorIndex
+
+metrics.describe("memory_recalled_turns_total", "Past turns added to the prompts")
+
+
+class UserMemory:
+    """Vector index of the turns of one user."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity: int = capacity
+        self.index: VectorIndex | None = None
+        self.next_seq: int = 1
+
+    def add(self, seq: int, text: str, vector: list[float]) -> None:
+        """
+        Add the turn to the index.
+
+        :param seq: Sequence number of the turn.
+        :param text: Text of the turn.
+        :param vector: Embedding of the turn.
+
+        :return: None.
+        """
+        if self.index is None:
+            self.index = VectorIndex(len(vector), self.capacity, initial=16)
+        self.index.add(vector, (seq, text))
+        self.next_seq = max(self.next_seq, seq + 1)
+
+
+class LongTermMemory:
+    """Per-user long-term memory (section "MEMORY" of bot.json)."""
+    __instance: "LongTermMemory | None" = None
+
+    def __init__(self, settings: dict, embedder: BaseEmbedder | None = None) -> None:
+        self.enabled: bool = settings.get("ENABLED", False)
+        self.recent_messages: int = settings.get("RECENT_MESSAGES", 4)
+        self.top_k: int = settings.get("TOP_K", 3)
+        self.min_score: float = settings.get("MIN_SCORE", 0.35)
+        self.max_turns: int = settings.get("MAX_TURNS", 500)
+        self.max_turn_chars: int = settings.get("MAX_TURN_CHARS", 1000)
+        self.cache_users: int = settings.get("CACHE_USERS", 256)
+
+        self.embedder: BaseEmbedder = (
+            EmbedderFactory.create(settings) if embedder is None else embedder
+        )
+        self.__users: collections.OrderedDict[int, UserMemory] = collections.OrderedDict()
+        self.__loading: dict[int, asyncio.Task] = dict()
+        self.__tasks: set[asyncio.Task] = set()
+
+        if self.enabled:
+            try:
+                import numpy  # noqa: F401
+            except ImportError:
+                logging.warning("Long-term memory is disabled: numpy is not installed")
+                self.enabled = False
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "LongTermMemory":
+        """
+        Get the memory (created from the "MEMORY" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Long-term memory.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("MEMORY", {}))
+
+        return cls.__instance
+
+    def cached_users(self) -> int:
+        """
+        Count of the users whose memory is loaded.
+
+        :return: Count.
+        """
+        return len(self.__users)
+
+    async def __load(self, telegram_id: int) -> UserMemory:
+        """
+        Load the turns of the user from the storage.
+
+        :param telegram_id: Telegram User ID.
+        :return: Memory of the user.
+        """
+        memory: UserMemory = UserMemory(self.max_turns)
+        for seq, text, embedding in await StorageFactory.get().get_memory_turns(
+                telegram_id, self.max_turns
+        ):
+            memory.add(seq, text, array.array("f", embedding).tolist())
+
+        self.__users[telegram_id] = memory
+        while len(self.__users) > self.cache_users:
+            self.__users.popitem(last=False)
+
+        return memory
+
+    async def __user(self, telegram_id: int) -> UserMemory:
+        """
+        Get the memory of the user (loaded once for concurrent callers).
+
+        :param telegram_id: Telegram User ID.
+        :return: Memory of the user.
+        """
+        memory: UserMemory | None = self.__users.get(telegram_id)
+        if memory is not None:
+            self.__users.move_to_end(telegram_id)
+            return memory
+
+        task: asyncio.Task | None = self.__loading.get(telegram_id)
+        if task is None:
+            task = asyncio.create_task(self.__load(telegram_id))
+            self.__loading[telegram_id] = task
+            task.add_done_callback(lambda _: self.__loading.pop(telegram_id, None))
+
+        return await asyncio.shield(task)
+
+    async def warm(self, telegram_id: int) -> None:
+        """
+        Load the memory of the user ahead of the first prompt (the context prefetch).
+
+        :param telegram_id: Telegram User ID.
+        :return: None.
+        """
+        if self.enabled:
+            await self.__user(telegram_id)
+
+    async def assemble(self, telegram_id: int, messages: list) -> tuple[list, int]:
+        """
+        Assemble the prompt: the system message (with the relevant past turns) and the
+        last RECENT_MESSAGES messages.
+
+        :param telegram_id: Telegram User ID.
+        :param messages: Stored context (the last message is the current prompt).
+
+        :return: Messages of the prompt and the count of the recalled turns (the stored
+            context is returned as is if the memory is disabled, empty or failing).
+        """
+        if not self.enabled or len(messages) <= self.recent_messages + 1:
+            return messages, 0
+
+        try:
+            memory: UserMemory = await self.__user(telegram_id)
+            if memory.index is None:
+                return messages, 0
+
+            query: str = str(messages[-1].get("content", ""))[:self.max_turn_chars]
+            vector: list[float] = (await self.embedder.embed([query]))[0]
+        except Exception as ex:
+            logging.warning("Long-term memory recall has failed: %r", ex)
+            return messages, 0
+
+        in_prompt: int = memory.next_seq - self.recent_messages // 2
+        recalled: list[tuple[int, str]] = sorted([
+            memory.index.payloads[slot]
+            for slot, score in memory.index.top_k(vector, self.top_k + self.recent_messages)
+            if score >= self.min_score and memory.index.payloads[slot][0] < in_prompt
+        ][:self.top_k])
+
+        system: dict = dict(messages[0]) if messages[0].get("role") == "system" else {
+            "role": "system", "content": ""
+        }
+        if recalled:
+            system["content"] = (
+                f"{system['content']}\n\nRelevant parts of the earlier conversation "
+                f"with the user:\n" + "\n---\n".join(text for _, text in recalled)
+            ).strip()
+            metrics.inc("memory_recalled_turns_total", len(recalled))
+
+        return [system] + messages[-self.recent_messages:], len(recalled)
+
+    async def __remember(self, telegram_id: int, prompt: str, answer: str) -> None:
+        """
+        Embed, index and persist the turn.
+
+        :param telegram_id: Telegram User ID.
+        :param prompt: Message of the user.
+        :param answer: Answer of the model.
+
+        :return: None.
+        """
+        try:
+            memory: UserMemory = await self.__user(telegram_id)
+            seq: int = memory.next_seq
+            memory.next_seq += 1
+
+            text: str = (f"User: {prompt[:self.max_turn_chars]}\n"
+                         f"Assistant: {answer[:self.max_turn_chars]}")
+            vector: list[float] = (await self.embedder.embed([text]))[0]
+            memory.add(seq, text, vector)
+
+            await StorageFactory.get().save_memory_turn(
+                telegram_id, seq, text, array.array("f", vector).tobytes(), self.max_turns
+            )
+        except Exception as ex:
+            logging.warning("The turn has not been remembered: %r", ex)
+
+    def remember(self, telegram_id: int, prompt: str, answer: str) -> None:
+        """
+        Remember the turn in the background (off the reply path).
+
+        :param telegram_id: Telegram User ID.
+        :param prompt: Message of the user.
+        :param answer: Answer of the model.
+
+        :return: None.
+        """
+        if not self.enabled:
+            return
+
+        task: asyncio.Task = asyncio.create_task(self.__remember(telegram_id, prompt, answer))
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def stop(self) -> None:
+        """
+        Wait for the turns which are being remembered.
+
+        :return: None.
+        """
+        if self.__tasks:
+            await asyncio.gather(*self.__tasks, return_exceptions=True)
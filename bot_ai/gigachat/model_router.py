@@ -0,0 +1,190 @@
+"""
+Module of the model routing: a GigaChat model is picked per request by the prompt
+heuristics and by the observed EWMA latency / error rate of the models, with the
+automatic fallback to the next model when one is slow or failing.
+"""
+import json
+import logging
+import time
+
+from bot_ai.utils.metrics import metrics
+
+DEFAULT_MODEL: str = "GigaChat-Max"
+
+metrics.describe("giga_route_total", "Routing decisions by kind, model and reason")
+metrics.describe("giga_fallback_total", "Requests retried on the next model")
+metrics.describe("giga_request_seconds", "Latency of the GigaChat completions")
+
+
+class ModelStats:
+    """EWMA latency and error rate of one model."""
+
+    def __init__(self, alpha: float) -> None:
+        self.alpha: float = alpha
+        self.latency: float | None = None
+        self.error_rate: float = 0.0
+        self.failures: int = 0
+        self.cooldown_until: float = 0.0
+
+    def observe(self, latency: float, ok: bool) -> None:
+        """
+        Add the result of a request.
+
+        :param latency: Duration of the request (seconds).
+        :param ok: True if the request has succeeded.
+
+        :return: None.
+        """
+        if ok:
+            self.latency = latency if self.latency is None else (
+                self.alpha * latency + (1 - self.alpha) * self.latency
+            )
+            self.failures = 0
+        else:
+            self.failures += 1
+        self.error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.error_rate
+
+
+class ModelRouter:
+    """
+    Router of the requests between the configured models (section "MODEL_ROUTING" of
+    bot.json). The text models are listed from the lightest to the heaviest one.
+    """
+    __instance: "ModelRouter | None" = None
+
+    def __init__(self, settings: dict) -> None:
+        self.enabled: bool = settings.get("ENABLED", False)
+        self.text_models: list[str] = settings.get("TEXT_MODELS", [DEFAULT_MODEL])
+        self.image_models: list[str] = settings.get("IMAGE_MODELS", [DEFAULT_MODEL])
+        self.short_prompt: int = settings.get("SHORT_PROMPT", 64)
+        self.long_prompt: int = settings.get("LONG_PROMPT", 1500)
+        self.long_context: int = settings.get("LONG_CONTEXT", 6000)
+        self.max_latency: float = settings.get("MAX_LATENCY", 20.0)
+        self.max_error_rate: float = settings.get("MAX_ERROR_RATE", 0.5)
+        self.max_failures: int = settings.get("MAX_FAILURES", 3)
+        self.cooldown: float = settings.get("COOLDOWN", 60.0)
+        self.max_attempts: int = settings.get("MAX_ATTEMPTS", 2)
+
+        alpha: float = settings.get("ALPHA", 0.2)
+        self.stats: dict[str, ModelStats] = {
+            model: ModelStats(alpha) for model in self.text_models + self.image_models
+        }
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "ModelRouter":
+        """
+        Get the router (created from the "MODEL_ROUTING" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Model router.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("MODEL_ROUTING", {}))
+
+        return cls.__instance
+
+    def is_healthy(self, model: str, now: float | None = None) -> bool:
+        """
+        Check if the model is neither slow nor failing.
+
+        :param model: Name of the model.
+        :param now: Monotonic time.
+
+        :return: True if the model can be used.
+        """
+        stats: ModelStats = self.stats[model]
+        now = time.monotonic() if now is None else now
+
+        return (
+            stats.cooldown_until <= now
+            and stats.error_rate <= self.max_error_rate
+            and (stats.latency is None or stats.latency <= self.max_latency)
+        )
+
+    def tier(self, messages: list) -> int:
+        """
+        Pick the preferred text model by the prompt: short prompts go to the lightest
+        model, long prompts, code and long contexts go to the heaviest one.
+
+        :param messages: Messages of the dialog (the last one is the prompt).
+        :return: Index of the preferred model in TEXT_MODELS.
+        """
+        prompt: str = str(messages[-1].get("content", "")) if messages else ""
+        context: int = sum(len(str(message.get("content", ""))) for message in messages)
+
+        if len(prompt) > self.long_prompt or "```" in prompt or context > self.long_context:
+            return len(self.text_models) - 1
+        if len(prompt) <= self.short_prompt:
+            return 0
+
+        return min(1, len(self.text_models) - 1)
+
+    def route(self, kind: str, messages: list | None = None) -> list[str]:
+        """
+        Get the models to try in order: the preferred one, then the heavier ones, then
+        the lighter ones; the unhealthy models go last.
+
+        :param kind: "text" or "image".
+        :param messages: Messages of the dialog (for "text").
+
+        :return: Names of the models (at most MAX_ATTEMPTS).
+        """
+        if not self.enabled:
+            return [DEFAULT_MODEL]
+
+        models: list[str] = self.text_models if kind == "text" else self.image_models
+        preferred: int = self.tier(messages or []) if kind == "text" else 0
+        ordered: list[str] = models[preferred:] + models[:preferred][::-1]
+
+        now: float = time.monotonic()
+        healthy: list[str] = [model for model in ordered if self.is_healthy(model, now)]
+        candidates: list[str] = healthy + [model for model in ordered if model not in healthy]
+
+        reason: str = "preferred" if candidates[0] == ordered[0] else "unhealthy_skip"
+        metrics.inc("giga_route_total", kind=kind, model=candidates[0], reason=reason)
+
+        return candidates[:self.max_attempts]
+
+    def observe(self, kind: str, model: str, latency: float, ok: bool) -> None:
+        """
+        Record the result of a request and cool the model down after repeated failures.
+
+        :param kind: "text" or "image".
+        :param model: Name of the model.
+        :param latency: Duration of the request (seconds).
+        :param ok: True if the request has succeeded.
+
+        :return: None.
+        """
+        metrics.observe("giga_request_seconds", latency, kind=kind, model=model)
+        metrics.inc(
+            "giga_requests_total", kind=kind, model=model, result="ok" if ok else "error"
+        )
+
+        stats: ModelStats | None = self.stats.get(model)
+        if stats is None:
+            return
+
+        stats.observe(latency, ok)
+        if stats.failures >= self.max_failures:
+            stats.cooldown_until = time.monotonic() + self.cooldown
+            stats.failures = 0
+            logging.warning("Model %s is failing, cooled down for %s s", model, self.cooldown)
+
+        metrics.set("giga_model_latency_ewma_seconds", stats.latency or 0.0, model=model)
+        metrics.set("giga_model_error_rate", stats.error_rate, model=model)
+
+    @staticmethod
+    def fallback(kind: str, model: str, error: Exception) -> None:
+        """
+        Record the fallback from the model.
+
+        :param kind: "text" or "image".
+        :param model: Name of the failed model.
+        :param error: Error of the request.
+
+        :return: None.
+        """
+        metrics.inc("giga_fallback_total", kind=kind, model=model)
+        logging.warning("Model %s has failed (%r), falling back", model, error)
@@ -0,0 +1,149 @@
+"""
+Module of the context prefetch: when the user enters the chat mode, the stored context
+and the long-term memory of the user are loaded in the background, so the first message
+does not wait for the storage. The prefetch is speculative and bounded: at most
+MAX_INFLIGHT loads at once, MAX_ENTRIES loaded contexts, each used once within TTL.
+"""
+import asyncio
+import collections
+import json
+import logging
+import time
+
+from bot_ai.gigachat.memory import LongTermMemory
+from bot_ai.utils.handler_db import HandlerDB
+from bot_ai.utils.metrics import metrics
+from bot_ai.utils.persistence import PersistenceQueue
+
+metrics.describe(
+    "context_prefetch_total",
+    "Context prefetches by result (started, skipped, hit, late, expired, failed, dropped); "
+    "the hit rate is (hit + late) / started"
+)
+
+
+class ContextPrefetcher:
+    """Speculative loader of the chat context (section "PREFETCH" of bot.json)."""
+    __instance: "ContextPrefetcher | None" = None
+
+    def __init__(self, settings: dict) -> None:
+        self.enabled: bool = settings.get("ENABLED", True)
+        self.max_inflight: int = settings.get("MAX_INFLIGHT", 8)
+        self.max_entries: int = settings.get("MAX_ENTRIES", 512)
+        self.ttl: float = settings.get("TTL", 300.0)
+
+        self.__entries: collections.OrderedDict[int, tuple[float, asyncio.Task]] = (
+            collections.OrderedDict()
+        )
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "ContextPrefetcher":
+        """
+        Get the prefetcher (created from the "PREFETCH" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Context prefetcher.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("PREFETCH", {}))
+
+        return cls.__instance
+
+    def entries(self) -> int:
+        """
+        Count of the prefetched (or loading) contexts.
+
+        :return: Count.
+        """
+        return len(self.__entries)
+
+    async def __load(self, telegram_id: int) -> list | None:
+        """
+        Load the context and warm the long-term memory of the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Context or None if the load has failed.
+        """
+        try:
+            # The previous dialog may still be persisting: read the context after it
+            await PersistenceQueue.get().drain(telegram_id)
+            context, _ = await asyncio.gather(
+                HandlerDB.get_context(telegram_id),
+                LongTermMemory.get().warm(telegram_id)
+            )
+            return context
+        except Exception as ex:
+            logging.warning("Context of user %s has not been prefetched: %r", telegram_id, ex)
+            return None
+
+    def __drop(self, telegram_id: int) -> None:
+        """
+        Forget the prefetched context (the load is cancelled if it is still running).
+
+        :param telegram_id: Telegram User ID.
+        :return: None.
+        """
+        entry: tuple[float, asyncio.Task] | None = self.__entries.pop(telegram_id, None)
+        if entry is not None:
+            entry[1].cancel()
+            metrics.inc("context_prefetch_total", result="dropped")
+
+    def prefetch(self, telegram_id: int) -> None:
+        """
+        Start loading the context of the user in the background (skipped over the budget).
+
+        :param telegram_id: Telegram User ID.
+        :return: None.
+        """
+        if not self.enabled or telegram_id in self.__entries:
+            return
+
+        loading: int = sum(not task.done() for _, task in self.__entries.values())
+        if loading >= self.max_inflight:
+            metrics.inc("context_prefetch_total", result="skipped")
+            return
+
+        self.__entries[telegram_id] = (
+            time.monotonic(),
+            asyncio.create_task(self.__load(telegram_id), name=f"prefetch-{telegram_id}")
+        )
+        while len(self.__entries) > self.max_entries:
+            self.__drop(next(iter(self.__entries)))
+        metrics.inc("context_prefetch_total", result="started")
+
+    def invalidate(self, telegram_id: int) -> None:
+        """
+        Forget the prefetched context after the context of the user has been changed.
+
+        :param telegram_id: Telegram User ID.
+        :return: None.
+        """
+        self.__drop(telegram_id)
+
+    async def context(self, telegram_id: int) -> list:
+        """
+        Get the context of the user: the prefetched one (used once) or a fresh load.
+
+        :param telegram_id: Telegram User ID.
+        :return: Context.
+        """
+        entry: tuple[float, asyncio.Task] | None = self.__entries.pop(telegram_id, None)
+        if entry is None:
+            return await HandlerDB.get_context(telegram_id)
+
+        started, task = entry
+        if time.monotonic() - started > self.ttl:
+            task.cancel()
+            metrics.inc("context_prefetch_total", result="expired")
+            return await HandlerDB.get_context(telegram_id)
+
+        result: str = "hit" if task.done() else "late"
+        context: list | None = await task
+        if context is None:
+            metrics.inc("context_prefetch_total", result="failed")
+            return await HandlerDB.get_context(telegram_id)
+
+        metrics.inc("context_prefetch_total", result=result)
+
+        return context
@@ -0,0 +1,173 @@
+"""
+Module of the semantic response cache: first-turn prompts are embedded, concurrent
+lookups are batched into one embeddings request and one similarity search, and the
+cached answer is returned for paraphrases above the similarity threshold.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Awaitable, Callable
+
+from bot_ai.gigachat.embeddings import BaseEmbedder, EmbedderFactory
+from bot_ai.gigachat.giga_requests import TOKEN_REFRESH_ANSWER
+from bot_ai.utils.metrics import metrics
+from bot_ai.utils.vector_index import VectorIndex
+
+metrics.describe("semantic_cache_requests_total", "Semantic cache lookups by result")
+
+
+class SemanticCache:
+    """Semantic cache of the first-turn answers (section "SEMANTIC_CACHE" of bot.json)."""
+    __instance: "SemanticCache | None" = None
+
+    def __init__(self, settings: dict, embedder: BaseEmbedder | None = None) -> None:
+        self.enabled: bool = settings.get("ENABLED", False)
+        self.threshold: float = settings.get("THRESHOLD", 0.92)
+        self.max_entries: int = settings.get("MAX_ENTRIES", 5000)
+        self.ttl: float = settings.get("TTL", 86400)
+        self.max_prompt: int = settings.get("MAX_PROMPT", 500)
+
+        self.embedder: BaseEmbedder = (
+            EmbedderFactory.create(settings) if embedder is None else embedder
+        )
+        self.index: VectorIndex | None = None
+        self.__pending: list[tuple[str, asyncio.Future]] = list()
+        self.__tasks: set[asyncio.Task] = set()
+
+        if self.enabled:
+            try:
+                import numpy  # noqa: F401
+            except ImportError:
+                logging.warning("Semantic cache is disabled: numpy is not installed")
+                self.enabled = False
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "SemanticCache":
+        """
+        Get the cache (created from the "SEMANTIC_CACHE" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Semantic cache.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("SEMANTIC_CACHE", {}))
+
+        return cls.__instance
+
+    def first_turn_prompt(self, messages: list) -> str | None:
+        """
+        Get the prompt of the dialog if it is the first turn (a single user message).
+
+        :param messages: Messages of the dialog.
+        :return: Prompt or None (not cacheable).
+        """
+        prompts: list[str] = list()
+        for message in messages:
+            if message.get("role") == "assistant":
+                return None
+            if message.get("role") == "user":
+                prompts.append(str(message.get("content", "")).strip())
+
+        if len(prompts) != 1 or not prompts[0] or len(prompts[0]) > self.max_prompt:
+            return None
+
+        return prompts[0]
+
+    def __resolve(self, slot: int, score: float) -> str | None:
+        """
+        Get the cached answer of the found slot (an expired entry is removed).
+
+        :param slot: Slot of the nearest entry (-1 if the index is empty).
+        :param score: Similarity of the nearest entry.
+
+        :return: Answer or None (a miss).
+        """
+        if slot < 0 or score < self.threshold:
+            return None
+
+        answer, created_at = self.index.payloads[slot]
+        if time.monotonic() - created_at > self.ttl:
+            self.index.remove(slot)
+            return None
+
+        self.index.touch(slot)
+
+        return answer
+
+    async def __flush(self) -> None:
+        """
+        Embed and search all pending prompts in one batch.
+
+        :return: None.
+        """
+        batch: list[tuple[str, asyncio.Future]] = self.__pending
+        self.__pending = list()
+
+        try:
+            vectors: list[list[float]] = await self.embedder.embed([prompt for prompt, _ in batch])
+            if self.index is None:
+                self.index = VectorIndex(len(vectors[0]), self.max_entries)
+            found: list[tuple[int, float]] = self.index.search(vectors)
+            # Resolved before any other coroutine runs: index.add may reuse the slots
+            answers: list[str | None] = [self.__resolve(slot, score) for slot, score in found]
+        except Exception as ex:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(ex)
+            return
+
+        for (_, future), vector, answer in zip(batch, vectors, answers):
+            if not future.done():
+                future.set_result((vector, answer))
+
+    async def __lookup(self, prompt: str) -> tuple[list[float], str | None]:
+        """
+        Find the cached answer of the prompt.
+
+        :param prompt: Prompt.
+        :return: Vector of the prompt and the cached answer (None on a miss).
+        """
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.__pending.append((prompt, future))
+        if len(self.__pending) == 1:
+            task: asyncio.Task = asyncio.get_running_loop().create_task(self.__flush())
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+        return await future
+
+    async def cached(self, messages: list, request: Callable[[], Awaitable[str]]) -> str:
+        """
+        Return the cached answer for a similar first-turn prompt or make the request
+        and cache its answer.
+
+        :param messages: Messages of the dialog.
+        :param request: Request to the model.
+
+        :return: Answer.
+        """
+        prompt: str | None = self.first_turn_prompt(messages) if self.enabled else None
+        if prompt is None:
+            return await request()
+
+        try:
+            vector, answer = await self.__lookup(prompt)
+        except Exception as ex:
+            logging.warning("Semantic cache lookup has failed: %r", ex)
+            metrics.inc("semantic_cache_requests_total", result="error")
+            return await request()
+
+        if answer is not None:
+            metrics.inc("semantic_cache_requests_total", result="hit")
+            return answer
+
+        metrics.inc("semantic_cache_requests_total", result="miss")
+        answer = await request()
+        if answer != TOKEN_REFRESH_ANSWER:
+            self.index.add(vector, (answer, time.monotonic()))
+            metrics.set("semantic_cache_entries", len(self.index))
+            metrics.set("semantic_cache_evictions", self.index.evictions)
+
+        return answer
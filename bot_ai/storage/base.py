@@ -0,0 +1,253 @@
+"""Module of the storage interface (context, analytics counters and users)."""
+import abc
+
+
+class BaseStorage(abc.ABC):
+    """
+    Base class of the storage backends.
+
+    The context is stored as an opaque blob: encoding / decoding is done by the caller
+    (see HandlerDB).
+    """
+
+    @abc.abstractmethod
+    async def init(self) -> None:
+        """
+        Prepare the storage (create / migrate the schema).
+
+        :return: None.
+        """
+
+    async def warm_up(self) -> None:
+        """
+        Open connections in advance (nothing to do by default).
+
+        :return: None.
+        """
+
+    @abc.abstractmethod
+    async def close(self) -> None:
+        """
+        Release the resources of the storage.
+
+        :return: None.
+        """
+
+    @abc.abstractmethod
+    async def ping(self) -> bool:
+        """
+        Check that the storage answers (readiness probe).
+
+        :return: True if the storage is available.
+        """
+
+    @abc.abstractmethod
+    async def get_user(self, telegram_id: int) -> dict | None:
+        """
+        Get the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Dict (telegram_id, telegram_username, firstname, lastname,
+            count_of_ai_queries) or None if there is no such user.
+        """
+
+    @abc.abstractmethod
+    async def increment_count_of_ai_queries(
+            self,
+            telegram_id: int,
+            telegram_username: str | None,
+            firstname: str,
+            lastname: str | None,
+            count: int = 1
+    ) -> None:
+        """
+        Create the user if needed and increase the count of AI queries.
+
+        :param telegram_id: Telegram User ID.
+        :param telegram_username: Telegram username (may be None).
+        :param firstname: First name.
+        :param lastname: Last name (may be None).
+        :param count: Increment.
+
+        :return: None.
+        """
+
+    @abc.abstractmethod
+    async def get_count_of_ai_queries(self, telegram_id: int) -> int:
+        """
+        Get the count of AI queries of the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Count of AI queries (0 for unknown users).
+        """
+
+    @abc.abstractmethod
+    async def get_context(self, telegram_id: int) -> bytes | str | None:
+        """
+        Get the stored context of the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Encoded context or None.
+        """
+
+    @abc.abstractmethod
+    async def update_context(self, telegram_id: int, context: bytes) -> None:
+        """
+        Store the context of the user (and the time of the write).
+
+        :param telegram_id: Telegram User ID.
+        :param context: Encoded context.
+
+        :return: None.
+        """
+
+    @abc.abstractmethod
+    async def get_quota_usage(self, day: str) -> dict[tuple[str, int], int]:
+        """
+        Get the quota usage of the day.
+
+        :param day: Date (YYYY-MM-DD, UTC).
+        :return: Dict: (kind, telegram_id) -> count of used requests.
+        """
+
+    @abc.abstractmethod
+    async def save_quota_usage(self, day: str, rows: list[tuple[int, str, int]]) -> None:
+        """
+        Save the quota usage of the day (absolute values).
+
+        :param day: Date (YYYY-MM-DD, UTC).
+        :param rows: List of (telegram_id, kind, used).
+
+        :return: None.
+        """
+
+    @abc.abstractmethod
+    async def save_usage(
+            self,
+            events: list[tuple[int, str, str]],
+            hourly: dict[tuple[str, str], int],
+            daily: dict[tuple[str, str], int],
+            active: dict[tuple[str, str], set[int]]
+    ) -> None:
+        """
+        Append the usage events and apply their aggregates to the rollups (atomically).
+
+        :param events: List of (telegram_id, kind, created_at "YYYY-MM-DD HH:MM:SS").
+        :param hourly: Dict: (bucket "YYYY-MM-DD HH:00:00", kind) -> count of requests.
+        :param daily: Dict: (day "YYYY-MM-DD", kind) -> count of requests.
+        :param active: Dict: (day, kind) -> Telegram IDs active in the batch (only the
+            users not seen before on that day increase the count of users).
+
+        :return: None.
+        """
+
+    @abc.abstractmethod
+    async def get_usage_rollups(self, granularity: str, since: str) -> list[tuple]:
+        """
+        Read the rollups (the cost depends only on the count of returned rows).
+
+        :param granularity: "hour" or "day".
+        :param since: First bucket / day (inclusive).
+
+        :return: List of (bucket, kind, requests) for "hour" and
+            (day, kind, requests, users) for "day", ordered by time and kind.
+        """
+
+    @abc.abstractmethod
+    async def save_memory_turn(
+            self,
+            telegram_id: int,
+            seq: int,
+            text: str,
+            embedding: bytes,
+            keep: int
+    ) -> None:
+        """
+        Save a turn of the long-term memory and drop the turns older than the last `keep`.
+
+        :param telegram_id: Telegram User ID.
+        :param seq: Sequence number of the turn (per user).
+        :param text: Text of the turn.
+        :param embedding: Embedding of the turn (float32 array bytes).
+        :param keep: Count of the latest turns to keep.
+
+        :return: None.
+        """
+
+    @abc.abstractmethod
+    async def get_memory_turns(self, telegram_id: int, limit: int) -> list[tuple[int, str, bytes]]:
+        """
+        Get the latest turns of the long-term memory.
+
+        :param telegram_id: Telegram User ID.
+        :param limit: Count of the turns.
+
+        :return: List of (seq, text, embedding) ordered by seq.
+        """
+
+    @abc.abstractmethod
+    async def claim_updates(self, keys: list[str], seen_at: float) -> bool:
+        """
+        Mark the update keys as processed.
+
+        :param keys: Keys of the update (update ID, callback query ID).
+        :param seen_at: Unix time of the update.
+
+        :return: True if none of the keys has been processed before.
+        """
+
+    @abc.abstractmethod
+    async def release_updates(self, keys: list[str]) -> None:
+        """
+        Forget the update keys (the handling has failed, a redelivery must be processed).
+
+        :param keys: Keys of the update.
+        :return: None.
+        """
+
+    @abc.abstractmethod
+    async def purge_updates(self, before: float) -> int:
+        """
+        Forget the update keys processed before the time.
+
+        :param before: Unix time.
+        :return: Count of the forgotten keys.
+        """
+
+    @abc.abstractmethod
+    async def get_idle_contexts(self, before: float, limit: int) -> list[tuple[int, bytes | str]]:
+        """
+        Get the contexts which have not been written since the time (the oldest first).
+
+        :param before: Unix time.
+        :param limit: Count of the contexts.
+
+        :return: List of (telegram_id, encoded context).
+        """
+
+    @abc.abstractmethod
+    async def archive_contexts(
+            self,
+            rows: list[tuple[int, bytes]],
+            before: float,
+            archived_at: float
+    ) -> int:
+        """
+        Move the contexts to the archive (one transaction). A context written since
+        the time is left in place.
+
+        :param rows: List of (telegram_id, encoded context for the archive).
+        :param before: Unix time (the same as in get_idle_contexts).
+        :param archived_at: Unix time of the archiving.
+
+        :return: Count of the archived contexts.
+        """
+
+    @abc.abstractmethod
+    async def restore_context(self, telegram_id: int) -> bytes | None:
+        """
+        Move the archived context of the user back to the users (one transaction).
+
+        :param telegram_id: Telegram User ID.
+        :return: Encoded context or None if the user has no archived context.
+        """
@@ -0,0 +1,151 @@
+"""
+Module of the versioned binary codec of the conversation context.
+
+Layout (version 1)::
+
+    MAGIC (1 byte) | VERSION (1 byte) | COMPRESSION (1 byte) | payload
+
+The payload (after decompression) is the count of messages (uint32, LE) and, per
+message, the role code (1 byte) and the content length (uint32, LE) followed by the
+UTF-8 content. Messages with non-standard roles or extra keys are stored as JSON
+(role code ROLE_JSON). Rows written before the codec (JSON text ``{"data": [...]}``)
+are read transparently.
+"""
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from bot_ai.utils.serializer import Serializer
+
+MAGIC: int = 0xC7
+VERSION: int = 1
+
+COMPRESSION_NONE: int = 0
+COMPRESSION_ZLIB: int = 1
+COMPRESSION_ZSTD: int = 2
+
+ROLES: tuple[str, ...] = ("system", "user", "assistant")
+ROLE_CODES: dict[str, int] = {role: code for code, role in enumerate(ROLES)}
+ROLE_JSON: int = 0xFF
+
+COUNT: struct.Struct = struct.Struct("<I")
+ITEM: struct.Struct = struct.Struct("<BI")
+
+
+class ContextCodec:
+    """Encoder / decoder of the stored context."""
+    compress_threshold: int = 256
+    zlib_level: int = 1
+    zstd_level: int = 3
+    # The archived contexts are written once and read rarely: always compressed, harder
+    archive_zlib_level: int = 9
+    archive_zstd_level: int = 19
+
+    @staticmethod
+    def __serialize(context: list) -> bytes:
+        """
+        Serialize the messages to the compact binary form.
+
+        :param context: List of messages.
+        :return: Payload.
+        """
+        parts: list[bytes] = [COUNT.pack(len(context))]
+        for message in context:
+            code: int | None = ROLE_CODES.get(message.get("role"))
+            if code is None or len(message) != 2 or not isinstance(message.get("content"), str):
+                code = ROLE_JSON
+                content: bytes = Serializer.dumps(message)
+            else:
+                content = message["content"].encode("utf-8")
+
+            parts.append(ITEM.pack(code, len(content)))
+            parts.append(content)
+
+        return b"".join(parts)
+
+    @staticmethod
+    def __deserialize(payload: bytes) -> list:
+        """
+        Deserialize the messages from the compact binary form.
+
+        :param payload: Payload.
+        :return: List of messages.
+        """
+        view: memoryview = memoryview(payload)
+        count: int = COUNT.unpack_from(view, 0)[0]
+        offset: int = COUNT.size
+        context: list = list()
+
+        for _ in range(count):
+            code, length = ITEM.unpack_from(view, offset)
+            offset += ITEM.size
+            content: memoryview = view[offset:offset + length]
+            offset += length
+
+            if code == ROLE_JSON:
+                context.append(Serializer.loads(content))
+            else:
+                context.append({"role": ROLES[code], "content": str(content, "utf-8")})
+
+        return context
+
+    @classmethod
+    def encode(cls, context: list, archive: bool = False) -> bytes:
+        """
+        Encode the context (compressed if it is big enough and it pays off).
+
+        :param context: List of messages.
+        :param archive: Compress for the archive (any size, the higher levels).
+
+        :return: Encoded context.
+        """
+        payload: bytes = cls.__serialize(context)
+        compression: int = COMPRESSION_NONE
+
+        if archive or len(payload) >= cls.compress_threshold:
+            if zstandard is not None:
+                compressed: bytes = zstandard.ZstdCompressor(
+                    level=cls.archive_zstd_level if archive else cls.zstd_level
+                ).compress(payload)
+                method: int = COMPRESSION_ZSTD
+            else:
+                compressed = zlib.compress(
+                    payload, cls.archive_zlib_level if archive else cls.zlib_level
+                )
+                method = COMPRESSION_ZLIB
+
+            if len(compressed) < len(payload):
+                payload, compression = compressed, method
+
+        return bytes((MAGIC, VERSION, compression)) + payload
+
+    @classmethod
+    def decode(cls, data: bytes | str) -> list:
+        """
+        Decode the context (both the codec format and the legacy JSON rows).
+
+        :param data: Stored context.
+        :return: List of messages.
+        """
+        if isinstance(data, str) or len(data) < 3 or data[0] != MAGIC:
+            return Serializer.loads(data)["data"]
+
+        if data[1] != VERSION:
+            raise ValueError(f"Unsupported context codec version: {data[1]}")
+
+        compression: int = data[2]
+        payload: bytes = data[3:]
+        if compression == COMPRESSION_ZLIB:
+            payload = zlib.decompress(payload)
+        elif compression == COMPRESSION_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("The context is compressed by zstd, install zstandard")
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        elif compression != COMPRESSION_NONE:
+            raise ValueError(f"Unknown context compression: {compression}")
+
+        return cls.__deserialize(payload)
@@ -0,0 +1,73 @@
+"""Module for selecting the storage backend (key "STORAGE" of bot.json)."""
+import json
+import logging
+
+from bot_ai.storage.base import BaseStorage
+
+
+class StorageFactory:
+    """Factory and holder of the process-wide storage."""
+    __storage: BaseStorage | None = None
+
+    @staticmethod
+    def create(data: dict) -> BaseStorage:
+        """
+        Create the storage backend. Backend modules are imported on demand, so e.g.
+        pymysql is not needed for SQLite and in-memory deployments.
+
+        :param data: Dict-data of bot.json.
+        :return: Storage.
+        """
+        settings: dict = data.get("STORAGE", {})
+        backend: str = settings.get("BACKEND", "mysql").lower()
+
+        if backend == "mysql":
+            from bot_ai.storage.mysql_storage import MySQLStorage
+            storage: BaseStorage = MySQLStorage(data["MYSQL"])
+        elif backend == "sqlite":
+            from bot_ai.storage.sqlite_storage import SQLiteStorage
+            storage = SQLiteStorage(settings.get("SQLITE", {}))
+        elif backend == "memory":
+            from bot_ai.storage.memory_storage import MemoryStorage
+            storage = MemoryStorage(settings)
+        else:
+            raise ValueError(f"Unknown storage backend: {backend}")
+
+        logging.info("Storage backend: %s", backend)
+
+        return storage
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> BaseStorage:
+        """
+        Get the storage (create it from bot.json-file on the first call).
+
+        :param file_path: bot.json path.
+        :return: Storage.
+        """
+        if cls.__storage is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__storage = cls.create(json.load(file))
+
+        return cls.__storage
+
+    @classmethod
+    def set(cls, storage: BaseStorage | None) -> None:
+        """
+        Replace the storage (benchmarks, load tests).
+
+        :param storage: Storage or None.
+        :return: None.
+        """
+        cls.__storage = storage
+
+    @classmethod
+    async def close(cls) -> None:
+        """
+        Close the storage.
+
+        :return: None.
+        """
+        if cls.__storage is not None:
+            await cls.__storage.close()
+            cls.__storage = None
@@ -0,0 +1,339 @@
+"""Module of the in-memory storage backend (benchmarks and tests)."""
+import time
+
+from bot_ai.storage.base import BaseStorage
+
+
+class MemoryStorage(BaseStorage):
+    """Storage in the process memory. Nothing survives a restart."""
+
+    def __init__(self, settings: dict | None = None) -> None:
+        self.users: dict[int, dict] = dict()
+        self.quota_usage: dict[str, dict[tuple[str, int], int]] = dict()
+        self.usage_events: list[tuple[int, str, str]] = list()
+        self.usage_hourly: dict[tuple[str, str], int] = dict()
+        self.usage_daily: dict[tuple[str, str], list[int]] = dict()
+        self.usage_active: dict[tuple[str, str], set[int]] = dict()
+        self.memory_turns: dict[int, dict[int, tuple[str, bytes]]] = dict()
+        self.processed_updates: dict[str, float] = dict()
+        self.context_archive: dict[int, tuple[bytes, float]] = dict()
+
+    async def init(self) -> None:
+        """
+        Nothing to prepare.
+
+        :return: None.
+        """
+
+    async def close(self) -> None:
+        """
+        Nothing to release.
+
+        :return: None.
+        """
+
+    async def ping(self) -> bool:
+        """
+        The memory is always available.
+
+        :return: True.
+        """
+        return True
+
+    async def get_user(self, telegram_id: int) -> dict | None:
+        """
+        Get the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Dict with the user or None.
+        """
+        user: dict | None = self.users.get(int(telegram_id))
+        if user is None:
+            return None
+
+        return {
+            key: value for key, value in user.items()
+            if key not in ("context", "context_updated_at")
+        }
+
+    async def increment_count_of_ai_queries(
+            self,
+            telegram_id: int,
+            telegram_username: str | None,
+            firstname: str,
+            lastname: str | None,
+            count: int = 1
+    ) -> None:
+        """
+        Create the user if needed and increase the count of AI queries.
+
+        :param telegram_id: Telegram User ID.
+        :param telegram_username: Telegram username.
+        :param firstname: First name.
+        :param lastname: Last name.
+        :param count: Increment.
+
+        :return: None.
+        """
+        user: dict = self.users.setdefault(
+            int(telegram_id),
+            {
+                "telegram_id": int(telegram_id),
+                "context": None,
+                "context_updated_at": None,
+                "count_of_ai_queries": 0
+            }
+        )
+        user["telegram_username"] = telegram_username
+        user["firstname"] = firstname
+        user["lastname"] = lastname
+        user["count_of_ai_queries"] += count
+
+    async def get_count_of_ai_queries(self, telegram_id: int) -> int:
+        """
+        Get the count of AI queries of the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Count of AI queries.
+        """
+        user: dict | None = self.users.get(int(telegram_id))
+
+        return 0 if user is None else user["count_of_ai_queries"]
+
+    async def get_context(self, telegram_id: int) -> bytes | str | None:
+        """
+        Get the stored context of the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Encoded context or None.
+        """
+        user: dict | None = self.users.get(int(telegram_id))
+
+        return None if user is None else user["context"]
+
+    async def update_context(self, telegram_id: int, context: bytes) -> None:
+        """
+        Store the context of the user (like UPDATE: unknown users are ignored).
+
+        :param telegram_id: Telegram User ID.
+        :param context: Encoded context.
+
+        :return: None.
+        """
+        user: dict | None = self.users.get(int(telegram_id))
+        if user is not None:
+            user["context"] = context
+            user["context_updated_at"] = time.time()
+
+    async def get_quota_usage(self, day: str) -> dict[tuple[str, int], int]:
+        """
+        Get the quota usage of the day.
+
+        :param day: Date (YYYY-MM-DD, UTC).
+        :return: Dict: (kind, telegram_id) -> used.
+        """
+        return dict(self.quota_usage.get(day, {}))
+
+    async def save_quota_usage(self, day: str, rows: list[tuple[int, str, int]]) -> None:
+        """
+        Save the quota usage of the day.
+
+        :param day: Date (YYYY-MM-DD, UTC).
+        :param rows: List of (telegram_id, kind, used).
+
+        :return: None.
+        """
+        usage: dict = self.quota_usage.setdefault(day, dict())
+        for telegram_id, kind, used in rows:
+            usage[(kind, int(telegram_id))] = used
+
+    async def save_usage(
+            self,
+            events: list[tuple[int, str, str]],
+            hourly: dict[tuple[str, str], int],
+            daily: dict[tuple[str, str], int],
+            active: dict[tuple[str, str], set[int]]
+    ) -> None:
+        """
+        Append the usage events and apply their aggregates to the rollups.
+
+        :param events: List of (telegram_id, kind, created_at).
+        :param hourly: Dict: (bucket, kind) -> requests.
+        :param daily: Dict: (day, kind) -> requests.
+        :param active: Dict: (day, kind) -> Telegram IDs.
+
+        :return: None.
+        """
+        self.usage_events.extend(events)
+        for key, requests in hourly.items():
+            self.usage_hourly[key] = self.usage_hourly.get(key, 0) + requests
+        for key, requests in daily.items():
+            seen: set[int] = self.usage_active.setdefault(key, set())
+            new_users: set[int] = active.get(key, set()) - seen
+            seen.update(new_users)
+
+            row: list[int] = self.usage_daily.setdefault(key, [0, 0])
+            row[0] += requests
+            row[1] += len(new_users)
+
+    async def get_usage_rollups(self, granularity: str, since: str) -> list[tuple]:
+        """
+        Read the rollups.
+
+        :param granularity: "hour" or "day".
+        :param since: First bucket / day (inclusive).
+
+        :return: List of rows.
+        """
+        if granularity == "hour":
+            return sorted(
+                (bucket, kind, requests)
+                for (bucket, kind), requests in self.usage_hourly.items() if bucket >= since
+            )
+
+        return sorted(
+            (day, kind, requests, users)
+            for (day, kind), (requests, users) in self.usage_daily.items() if day >= since
+        )
+
+    async def save_memory_turn(
+            self,
+            telegram_id: int,
+            seq: int,
+            text: str,
+            embedding: bytes,
+            keep: int
+    ) -> None:
+        """
+        Save a turn of the long-term memory and drop the old turns.
+
+        :param telegram_id: Telegram User ID.
+        :param seq: Sequence number of the turn.
+        :param text: Text of the turn.
+        :param embedding: Embedding of the turn.
+        :param keep: Count of the latest turns to keep.
+
+        :return: None.
+        """
+        turns: dict[int, tuple[str, bytes]] = self.memory_turns.setdefault(int(telegram_id), dict())
+        turns[seq] = (text, embedding)
+        for old in [old for old in turns if old <= seq - keep]:
+            del turns[old]
+
+    async def get_memory_turns(self, telegram_id: int, limit: int) -> list[tuple[int, str, bytes]]:
+        """
+        Get the latest turns of the long-term memory.
+
+        :param telegram_id: Telegram User ID.
+        :param limit: Count of the turns.
+
+        :return: List of (seq, text, embedding) ordered by seq.
+        """
+        turns: dict[int, tuple[str, bytes]] = self.memory_turns.get(int(telegram_id), {})
+
+        return [(seq, *turns[seq]) for seq in sorted(turns)[-limit:]]
+
+    async def claim_updates(self, keys: list[str], seen_at: float) -> bool:
+        """
+        Mark the update keys as processed.
+
+        :param keys: Keys of the update.
+        :param seen_at: Unix time of the update.
+
+        :return: True if none of the keys has been processed before.
+        """
+        fresh: bool = not any(key in self.processed_updates for key in keys)
+        for key in keys:
+            self.processed_updates.setdefault(key, seen_at)
+
+        return fresh
+
+    async def release_updates(self, keys: list[str]) -> None:
+        """
+        Forget the update keys (the handling has failed, a redelivery must be processed).
+
+        :param keys: Keys of the update.
+        :return: None.
+        """
+        for key in keys:
+            self.processed_updates.pop(key, None)
+
+    async def purge_updates(self, before: float) -> int:
+        """
+        Forget the update keys processed before the time.
+
+        :param before: Unix time.
+        :return: Count of the forgotten keys.
+        """
+        old: list[str] = [key for key, seen_at in self.processed_updates.items() if seen_at < before]
+        for key in old:
+            del self.processed_updates[key]
+
+        return len(old)
+
+    async def get_idle_contexts(self, before: float, limit: int) -> list[tuple[int, bytes | str]]:
+        """
+        Get the contexts which have not been written since the time (the oldest first).
+
+        :param before: Unix time.
+        :param limit: Count of the contexts.
+
+        :return: List of (telegram_id, encoded context).
+        """
+        idle: list[dict] = sorted(
+            (
+                user for user in self.users.values()
+                if user["context"] is not None and user["context_updated_at"] < before
+            ),
+            key=lambda user: user["context_updated_at"]
+        )
+
+        return [(user["telegram_id"], user["context"]) for user in idle[:limit]]
+
+    async def archive_contexts(
+            self,
+            rows: list[tuple[int, bytes]],
+            before: float,
+            archived_at: float
+    ) -> int:
+        """
+        Move the contexts to the archive. A context written since the time is left
+        in place.
+
+        :param rows: List of (telegram_id, encoded context for the archive).
+        :param before: Unix time (the same as in get_idle_contexts).
+        :param archived_at: Unix time of the archiving.
+
+        :return: Count of the archived contexts.
+        """
+        archived: int = 0
+        for telegram_id, context in rows:
+            user: dict | None = self.users.get(int(telegram_id))
+            if user is None or user["context"] is None or user["context_updated_at"] >= before:
+                continue
+
+            user["context"] = None
+            self.context_archive[int(telegram_id)] = (context, archived_at)
+            archived += 1
+
+        return archived
+
+    async def restore_context(self, telegram_id: int) -> bytes | None:
+        """
+        Move the archived context of the user back to the users.
+
+        :param telegram_id: Telegram User ID.
+        :return: Encoded context or None if the user has no archived context.
+        """
+        user: dict | None = self.users.get(int(telegram_id))
+        if (
+                user is None or user["context"] is not None
+                or int(telegram_id) not in self.context_archive
+        ):
+            return None
+
+        context, _ = self.context_archive.pop(int(telegram_id))
+        user["context"] = context
+        user["context_updated_at"] = time.time()
+
+        return context
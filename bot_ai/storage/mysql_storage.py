@@ -0,0 +1,374 @@
+"""Module of the MySQL storage backend."""
+import asyncio
+import time
+
+import pymysql
+
+from bot_ai.storage.base import BaseStorage
+from bot_ai.utils.create_table import CreateTable
+from bot_ai.utils.mysql_connection import Connection
+from bot_ai.utils.queries import (
+    CLEAR_IDLE_CONTEXT,
+    Database,
+    DELETE_ARCHIVED_CONTEXT,
+    DELETE_OLD_MEMORY_TURNS,
+    DELETE_PROCESSED_UPDATE,
+    DELETE_PROCESSED_UPDATES,
+    INSERT_ACTIVE_USERS,
+    INSERT_MEMORY_TURN,
+    INSERT_PROCESSED_UPDATE,
+    INSERT_USAGE_EVENTS,
+    Query,
+    QueryExecutor,
+    RESTORE_CONTEXT,
+    SELECT_ARCHIVED_CONTEXT,
+    SELECT_CONTEXT,
+    SELECT_IDLE_CONTEXTS,
+    SELECT_MEMORY_TURNS,
+    SELECT_ONE,
+    SELECT_QUOTA_USAGE,
+    SELECT_USAGE_DAILY,
+    SELECT_USAGE_HOURLY,
+    SELECT_COUNT_OF_AI_QUERIES,
+    SELECT_USER,
+    UPDATE_CONTEXT,
+    UPSERT_ARCHIVED_CONTEXT,
+    UPSERT_COUNT_OF_AI_QUERIES,
+    UPSERT_QUOTA_USAGE,
+    UPSERT_USAGE_DAILY,
+    UPSERT_USAGE_HOURLY,
+)
+
+
+class MySQLStorage(BaseStorage):
+    """Storage in the MySQL Server (pooled, parameterized queries)."""
+
+    def __init__(self, mysql_data: dict) -> None:
+        self.__mysql_data: dict = mysql_data
+        self.__executor: QueryExecutor = Database.get_executor(mysql_data)
+
+    async def init(self) -> None:
+        """
+        Apply the schema migrations.
+
+        :return: None.
+        """
+        connection: pymysql.Connection | str = await Connection.get_connection(
+            self.__mysql_data
+        )
+        if isinstance(connection, str):
+            raise ConnectionError(connection)
+
+        table: CreateTable = CreateTable(
+            connection, connection.cursor()
+        )
+        await asyncio.to_thread(table.create)
+
+    async def warm_up(self) -> None:
+        """
+        Open the connections of the pool in advance.
+
+        :return: None.
+        """
+        await asyncio.to_thread(self.__executor.pool.warm_up)
+
+    async def close(self) -> None:
+        """
+        Close the pool.
+
+        :return: None.
+        """
+        await asyncio.to_thread(Database.close)
+
+    async def ping(self) -> bool:
+        """
+        Run a trivial query on a pooled connection.
+
+        :return: True if the pool gives a working connection.
+        """
+        row: tuple | None = await self.__executor.execute(SELECT_ONE)
+
+        return row is not None
+
+    async def get_user(self, telegram_id: int) -> dict | None:
+        """
+        Get the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Dict with the user or None.
+        """
+        row: tuple | None = await self.__executor.execute(SELECT_USER, (int(telegram_id),))
+        if row is None:
+            return None
+
+        return {
+            "telegram_id": row[0],
+            "telegram_username": row[1],
+            "firstname": row[2],
+            "lastname": row[3],
+            "count_of_ai_queries": row[4]
+        }
+
+    async def increment_count_of_ai_queries(
+            self,
+            telegram_id: int,
+            telegram_username: str | None,
+            firstname: str,
+            lastname: str | None,
+            count: int = 1
+    ) -> None:
+        """
+        Create the user if needed and increase the count of AI queries.
+
+        :param telegram_id: Telegram User ID.
+        :param telegram_username: Telegram username.
+        :param firstname: First name.
+        :param lastname: Last name.
+        :param count: Increment.
+
+        :return: None.
+        """
+        await self.__executor.execute(
+            UPSERT_COUNT_OF_AI_QUERIES,
+            (int(telegram_id), telegram_username, firstname, lastname, count)
+        )
+
+    async def get_count_of_ai_queries(self, telegram_id: int) -> int:
+        """
+        Get the count of AI queries of the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Count of AI queries.
+        """
+        row: tuple | None = await self.__executor.execute(
+            SELECT_COUNT_OF_AI_QUERIES, (int(telegram_id),)
+        )
+
+        return 0 if row is None else int(row[0])
+
+    async def get_context(self, telegram_id: int) -> bytes | str | None:
+        """
+        Get the stored context of the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Encoded context or None.
+        """
+        row: tuple | None = await self.__executor.execute(SELECT_CONTEXT, (int(telegram_id),))
+
+        return None if row is None else row[0]
+
+    async def update_context(self, telegram_id: int, context: bytes) -> None:
+        """
+        Store the context of the user.
+
+        :param telegram_id: Telegram User ID.
+        :param context: Encoded context.
+
+        :return: None.
+        """
+        await self.__executor.execute(UPDATE_CONTEXT, (context, time.time(), int(telegram_id)))
+
+    async def get_quota_usage(self, day: str) -> dict[tuple[str, int], int]:
+        """
+        Get the quota usage of the day.
+
+        :param day: Date (YYYY-MM-DD, UTC).
+        :return: Dict: (kind, telegram_id) -> used.
+        """
+        rows: tuple = await self.__executor.execute(SELECT_QUOTA_USAGE, (day,))
+
+        return {(kind, int(telegram_id)): used for telegram_id, kind, used in rows}
+
+    async def save_quota_usage(self, day: str, rows: list[tuple[int, str, int]]) -> None:
+        """
+        Save the quota usage of the day (one multi-row upsert).
+
+        :param day: Date (YYYY-MM-DD, UTC).
+        :param rows: List of (telegram_id, kind, used).
+
+        :return: None.
+        """
+        if rows:
+            await self.__executor.execute_many(
+                UPSERT_QUOTA_USAGE,
+                [(day, telegram_id, kind, used) for telegram_id, kind, used in rows]
+            )
+
+    async def save_usage(
+            self,
+            events: list[tuple[int, str, str]],
+            hourly: dict[tuple[str, str], int],
+            daily: dict[tuple[str, str], int],
+            active: dict[tuple[str, str], set[int]]
+    ) -> None:
+        """
+        Append the usage events and apply their aggregates to the rollups in one
+        transaction.
+
+        :param events: List of (telegram_id, kind, created_at).
+        :param hourly: Dict: (bucket, kind) -> requests.
+        :param daily: Dict: (day, kind) -> requests.
+        :param active: Dict: (day, kind) -> Telegram IDs.
+
+        :return: None.
+        """
+        def work(run) -> None:
+            run(INSERT_USAGE_EVENTS, list(events))
+            run(
+                UPSERT_USAGE_HOURLY,
+                [(bucket, kind, requests) for (bucket, kind), requests in hourly.items()]
+            )
+            for (day, kind), requests in daily.items():
+                new_users: int = run(
+                    INSERT_ACTIVE_USERS,
+                    [(day, kind, telegram_id) for telegram_id in active.get((day, kind), ())]
+                )
+                run(UPSERT_USAGE_DAILY, (day, kind, requests, new_users))
+
+        await self.__executor.transaction(work)
+
+    async def get_usage_rollups(self, granularity: str, since: str) -> list[tuple]:
+        """
+        Read the rollups.
+
+        :param granularity: "hour" or "day".
+        :param since: First bucket / day (inclusive).
+
+        :return: List of rows.
+        """
+        query: Query = SELECT_USAGE_HOURLY if granularity == "hour" else SELECT_USAGE_DAILY
+        rows: tuple = await self.__executor.execute(query, (since,))
+
+        return [(str(row[0]),) + tuple(row[1:]) for row in rows]
+
+    async def save_memory_turn(
+            self,
+            telegram_id: int,
+            seq: int,
+            text: str,
+            embedding: bytes,
+            keep: int
+    ) -> None:
+        """
+        Save a turn of the long-term memory and drop the old turns (one transaction).
+
+        :param telegram_id: Telegram User ID.
+        :param seq: Sequence number of the turn.
+        :param text: Text of the turn.
+        :param embedding: Embedding of the turn.
+        :param keep: Count of the latest turns to keep.
+
+        :return: None.
+        """
+        def work(run) -> None:
+            run(INSERT_MEMORY_TURN, (telegram_id, seq, text, embedding))
+            if seq > keep:
+                run(DELETE_OLD_MEMORY_TURNS, (telegram_id, seq - keep))
+
+        await self.__executor.transaction(work)
+
+    async def get_memory_turns(self, telegram_id: int, limit: int) -> list[tuple[int, str, bytes]]:
+        """
+        Get the latest turns of the long-term memory.
+
+        :param telegram_id: Telegram User ID.
+        :param limit: Count of the turns.
+
+        :return: List of (seq, text, embedding) ordered by seq.
+        """
+        rows: tuple = await self.__executor.execute(SELECT_MEMORY_TURNS, (telegram_id, limit))
+
+        return [(seq, text, bytes(embedding)) for seq, text, embedding in reversed(rows)]
+
+    async def claim_updates(self, keys: list[str], seen_at: float) -> bool:
+        """
+        Mark the update keys as processed (INSERT IGNORE, so concurrent workers agree).
+
+        :param keys: Keys of the update.
+        :param seen_at: Unix time of the update.
+
+        :return: True if none of the keys has been processed before.
+        """
+        inserted: int = await self.__executor.execute_many(
+            INSERT_PROCESSED_UPDATE, [(key, seen_at) for key in keys]
+        )
+
+        return inserted == len(keys)
+
+    async def release_updates(self, keys: list[str]) -> None:
+        """
+        Forget the update keys (the handling has failed, a redelivery must be processed).
+
+        :param keys: Keys of the update.
+        :return: None.
+        """
+        await self.__executor.execute_many(DELETE_PROCESSED_UPDATE, [(key,) for key in keys])
+
+    async def purge_updates(self, before: float) -> int:
+        """
+        Forget the update keys processed before the time.
+
+        :param before: Unix time.
+        :return: Count of the forgotten keys.
+        """
+        return await self.__executor.execute(DELETE_PROCESSED_UPDATES, (before,))
+
+    async def get_idle_contexts(self, before: float, limit: int) -> list[tuple[int, bytes | str]]:
+        """
+        Get the contexts which have not been written since the time (the oldest first).
+
+        :param before: Unix time.
+        :param limit: Count of the contexts.
+
+        :return: List of (telegram_id, encoded context).
+        """
+        rows: tuple = await self.__executor.execute(SELECT_IDLE_CONTEXTS, (before, limit))
+
+        return [(int(telegram_id), context) for telegram_id, context in rows]
+
+    async def archive_contexts(
+            self,
+            rows: list[tuple[int, bytes]],
+            before: float,
+            archived_at: float
+    ) -> int:
+        """
+        Move the contexts to the archive (one transaction). The conditional UPDATE locks
+        the row, so a context written since the time is left in place.
+
+        :param rows: List of (telegram_id, encoded context for the archive).
+        :param before: Unix time (the same as in get_idle_contexts).
+        :param archived_at: Unix time of the archiving.
+
+        :return: Count of the archived contexts.
+        """
+        def work(run) -> int:
+            archived: int = 0
+            for telegram_id, context in rows:
+                if run(CLEAR_IDLE_CONTEXT, (telegram_id, before)):
+                    run(UPSERT_ARCHIVED_CONTEXT, (telegram_id, context, archived_at))
+                    archived += 1
+
+            return archived
+
+        return await self.__executor.transaction(work)
+
+    async def restore_context(self, telegram_id: int) -> bytes | None:
+        """
+        Move the archived context of the user back to the users (one transaction).
+
+        :param telegram_id: Telegram User ID.
+        :return: Encoded context or None if the user has no archived context.
+        """
+        def work(run) -> bytes | None:
+            row: tuple | None = run(SELECT_ARCHIVED_CONTEXT, (int(telegram_id),))
+            if row is None:
+                return None
+            # A context written meanwhile is newer than the archived one: keep the archive
+            if not run(RESTORE_CONTEXT, (row[0], time.time(), int(telegram_id))):
+                return None
+            run(DELETE_ARCHIVED_CONTEXT, (int(telegram_id),))
+
+            return bytes(row[0])
+
+        return await self.__executor.transaction(work)
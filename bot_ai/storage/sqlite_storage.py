@@ -0,0 +1,674 @@
+"""Module of the embedded SQLite storage backend (WAL-mode)."""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+from bot_ai.storage.base import BaseStorage
+
+
+def _context_archive_migration(connection: sqlite3.Connection) -> str:
+    """
+    Script of the context archive migration (the column is added only if it is missing:
+    SQLite has no ADD COLUMN IF NOT EXISTS).
+
+    :param connection: Connection to the database.
+    :return: Script of the migration.
+    """
+    columns: set[str] = {row[1] for row in connection.execute("PRAGMA table_info(users);")}
+    script: str = "" if "context_updated_at" in columns else (
+        "ALTER TABLE users ADD COLUMN context_updated_at REAL;\n"
+    )
+
+    return script + """UPDATE users SET context_updated_at = CAST(strftime('%s', 'now') AS REAL)
+    WHERE context IS NOT NULL AND context_updated_at IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_users_context_updated_at ON users (context_updated_at);
+    CREATE TABLE IF NOT EXISTS context_archive (
+    telegram_id INTEGER PRIMARY KEY,
+    context BLOB NOT NULL,
+    archived_at REAL NOT NULL
+    );"""
+
+
+# A migration is a script or a callable building the script from the current schema
+SQLITE_MIGRATIONS: list[str | Callable[[sqlite3.Connection], str]] = [
+    """CREATE TABLE IF NOT EXISTS users (
+    telegram_id INTEGER PRIMARY KEY,
+    telegram_username TEXT,
+    firstname TEXT NOT NULL,
+    lastname TEXT,
+    context BLOB,
+    count_of_ai_queries INTEGER NOT NULL DEFAULT 0
+    );""",
+    """CREATE TABLE IF NOT EXISTS quota_usage (
+    day TEXT NOT NULL,
+    telegram_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (day, telegram_id, kind)
+    );""",
+    """CREATE TABLE IF NOT EXISTS usage_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    created_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS usage_rollup_hourly (
+    bucket TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    PRIMARY KEY (bucket, kind)
+    );
+    CREATE TABLE IF NOT EXISTS usage_rollup_daily (
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    users INTEGER NOT NULL,
+    PRIMARY KEY (day, kind)
+    );
+    CREATE TABLE IF NOT EXISTS usage_active_users (
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    telegram_id INTEGER NOT NULL,
+    PRIMARY KEY (day, kind, telegram_id)
+    );""",
+    """CREATE TABLE IF NOT EXISTS memory_turns (
+    telegram_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (telegram_id, seq)
+    );""",
+    """CREATE TABLE IF NOT EXISTS processed_updates (
+    update_key TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_processed_updates_seen_at ON processed_updates (seen_at);""",
+    _context_archive_migration,
+]
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Storage in an embedded SQLite database (single-node deployments).
+
+    One connection in WAL-mode is shared by the worker threads under a lock: the
+    writes are serialized anyway and the reads are short point lookups.
+    """
+
+    def __init__(self, sqlite_data: dict) -> None:
+        self.__path: str = sqlite_data.get("PATH", "bot_ai.sqlite3")
+        self.__connection: sqlite3.Connection | None = None
+        self.__lock: threading.Lock = threading.Lock()
+
+    def __execute(self, sql: str, params: tuple = (), fetch: str | None = None):
+        """
+        Execute the statement (blocking, called in a worker thread).
+
+        :param sql: SQL-template with ?-placeholders.
+        :param params: Parameters.
+        :param fetch: "one", "all" or None.
+
+        :return: Row, rows or count of affected rows.
+        """
+        with self.__lock:
+            cursor: sqlite3.Cursor = self.__connection.execute(sql, params)
+            if fetch == "one":
+                result = cursor.fetchone()
+            elif fetch == "all":
+                result = cursor.fetchall()
+            else:
+                result = cursor.rowcount
+            self.__connection.commit()
+
+            return result
+
+    async def _execute(self, sql: str, params: tuple = (), fetch: str | None = None):
+        """
+        Execute the statement in a worker thread.
+
+        :param sql: SQL-template with ?-placeholders.
+        :param params: Parameters.
+        :param fetch: "one", "all" or None.
+
+        :return: Row, rows or count of affected rows.
+        """
+        return await asyncio.to_thread(self.__execute, sql, params, fetch)
+
+    def __execute_many(self, sql: str, params: list[tuple]) -> int:
+        """
+        Execute the statement for many parameters in one transaction (blocking).
+
+        :param sql: SQL-template with ?-placeholders.
+        :param params: List of parameters.
+
+        :return: Count of affected rows.
+        """
+        with self.__lock:
+            cursor: sqlite3.Cursor = self.__connection.executemany(sql, params)
+            self.__connection.commit()
+
+            return cursor.rowcount
+
+    async def _execute_many(self, sql: str, params: list[tuple]) -> int:
+        """
+        Execute the statement for many parameters in a worker thread.
+
+        :param sql: SQL-template with ?-placeholders.
+        :param params: List of parameters.
+
+        :return: Count of affected rows.
+        """
+        return await asyncio.to_thread(self.__execute_many, sql, params)
+
+    def __migrate(self) -> None:
+        """
+        Open the database and apply the pending migrations (PRAGMA user_version).
+
+        :return: None.
+        """
+        connection: sqlite3.Connection = sqlite3.connect(
+            self.__path, check_same_thread=False
+        )
+        connection.execute("PRAGMA journal_mode=WAL;")
+        connection.execute("PRAGMA synchronous=NORMAL;")
+
+        version: int = connection.execute("PRAGMA user_version;").fetchone()[0]
+        for number, migration in enumerate(SQLITE_MIGRATIONS[version:], start=version + 1):
+            logging.info("Applying SQLite migration %s", number)
+            # The schema and the version are changed in one transaction
+            try:
+                script: str = migration(connection) if callable(migration) else migration
+                connection.executescript(
+                    f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;"
+                )
+            except Exception:
+                if connection.in_transaction:
+                    connection.rollback()
+                connection.close()
+                raise
+
+        self.__connection = connection
+
+    async def init(self) -> None:
+        """
+        Open the database and apply the migrations.
+
+        :return: None.
+        """
+        await asyncio.to_thread(self.__migrate)
+
+    async def close(self) -> None:
+        """
+        Close the database.
+
+        :return: None.
+        """
+        if self.__connection is not None:
+            with self.__lock:
+                self.__connection.close()
+                self.__connection = None
+
+    async def ping(self) -> bool:
+        """
+        Run a trivial query.
+
+        :return: True if the database is open and answers.
+        """
+        if self.__connection is None:
+            return False
+
+        return await self._execute("SELECT 1;", fetch="one") is not None
+
+    async def get_user(self, telegram_id: int) -> dict | None:
+        """
+        Get the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Dict with the user or None.
+        """
+        row: tuple | None = await self._execute(
+            """SELECT telegram_id, telegram_username, firstname, lastname, count_of_ai_queries
+            FROM users WHERE telegram_id = ?;""",
+            (int(telegram_id),),
+            fetch="one"
+        )
+        if row is None:
+            return None
+
+        return {
+            "telegram_id": row[0],
+            "telegram_username": row[1],
+            "firstname": row[2],
+            "lastname": row[3],
+            "count_of_ai_queries": row[4]
+        }
+
+    async def increment_count_of_ai_queries(
+            self,
+            telegram_id: int,
+            telegram_username: str | None,
+            firstname: str,
+            lastname: str | None,
+            count: int = 1
+    ) -> None:
+        """
+        Create the user if needed and increase the count of AI queries.
+
+        :param telegram_id: Telegram User ID.
+        :param telegram_username: Telegram username.
+        :param firstname: First name.
+        :param lastname: Last name.
+        :param count: Increment.
+
+        :return: None.
+        """
+        await self._execute(
+            """INSERT INTO users (
+            telegram_id, telegram_username, firstname, lastname, count_of_ai_queries
+            ) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (telegram_id) DO UPDATE SET
+            count_of_ai_queries = count_of_ai_queries + excluded.count_of_ai_queries,
+            telegram_username = excluded.telegram_username,
+            firstname = excluded.firstname,
+            lastname = excluded.lastname;""",
+            (int(telegram_id), telegram_username, firstname, lastname, count)
+        )
+
+    async def get_count_of_ai_queries(self, telegram_id: int) -> int:
+        """
+        Get the count of AI queries of the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Count of AI queries.
+        """
+        row: tuple | None = await self._execute(
+            "SELECT count_of_ai_queries FROM users WHERE telegram_id = ?;",
+            (int(telegram_id),),
+            fetch="one"
+        )
+
+        return 0 if row is None else int(row[0])
+
+    async def get_context(self, telegram_id: int) -> bytes | str | None:
+        """
+        Get the stored context of the user.
+
+        :param telegram_id: Telegram User ID.
+        :return: Encoded context or None.
+        """
+        row: tuple | None = await self._execute(
+            "SELECT context FROM users WHERE telegram_id = ?;",
+            (int(telegram_id),),
+            fetch="one"
+        )
+
+        return None if row is None else row[0]
+
+    async def update_context(self, telegram_id: int, context: bytes) -> None:
+        """
+        Store the context of the user.
+
+        :param telegram_id: Telegram User ID.
+        :param context: Encoded context.
+
+        :return: None.
+        """
+        await self._execute(
+            "UPDATE users SET context = ?, context_updated_at = ? WHERE telegram_id = ?;",
+            (context, time.time(), int(telegram_id))
+        )
+
+    async def get_quota_usage(self, day: str) -> dict[tuple[str, int], int]:
+        """
+        Get the quota usage of the day.
+
+        :param day: Date (YYYY-MM-DD, UTC).
+        :return: Dict: (kind, telegram_id) -> used.
+        """
+        rows: list = await self._execute(
+            "SELECT telegram_id, kind, used FROM quota_usage WHERE day = ?;",
+            (day,),
+            fetch="all"
+        )
+
+        return {(kind, int(telegram_id)): used for telegram_id, kind, used in rows}
+
+    async def save_quota_usage(self, day: str, rows: list[tuple[int, str, int]]) -> None:
+        """
+        Save the quota usage of the day (one transaction).
+
+        :param day: Date (YYYY-MM-DD, UTC).
+        :param rows: List of (telegram_id, kind, used).
+
+        :return: None.
+        """
+        if rows:
+            await self._execute_many(
+                """INSERT INTO quota_usage (day, telegram_id, kind, used) VALUES (?, ?, ?, ?)
+                ON CONFLICT (day, telegram_id, kind) DO UPDATE SET used = excluded.used;""",
+                [(day, telegram_id, kind, used) for telegram_id, kind, used in rows]
+            )
+
+    def __save_usage(
+            self,
+            events: list[tuple[int, str, str]],
+            hourly: dict[tuple[str, str], int],
+            daily: dict[tuple[str, str], int],
+            active: dict[tuple[str, str], set[int]]
+    ) -> None:
+        """
+        Append the usage events and apply the rollups in one transaction (blocking).
+
+        :param events: List of (telegram_id, kind, created_at).
+        :param hourly: Dict: (bucket, kind) -> requests.
+        :param daily: Dict: (day, kind) -> requests.
+        :param active: Dict: (day, kind) -> Telegram IDs.
+
+        :return: None.
+        """
+        with self.__lock:
+            connection: sqlite3.Connection = self.__connection
+            try:
+                connection.executemany(
+                    "INSERT INTO usage_events (telegram_id, kind, created_at) VALUES (?, ?, ?);",
+                    events
+                )
+                connection.executemany(
+                    """INSERT INTO usage_rollup_hourly (bucket, kind, requests) VALUES (?, ?, ?)
+                    ON CONFLICT (bucket, kind) DO UPDATE SET
+                    requests = requests + excluded.requests;""",
+                    [(bucket, kind, requests) for (bucket, kind), requests in hourly.items()]
+                )
+                for (day, kind), requests in daily.items():
+                    new_users: int = connection.executemany(
+                        """INSERT OR IGNORE INTO usage_active_users (day, kind, telegram_id)
+                        VALUES (?, ?, ?);""",
+                        [(day, kind, telegram_id) for telegram_id in active.get((day, kind), ())]
+                    ).rowcount
+                    connection.execute(
+                        """INSERT INTO usage_rollup_daily (day, kind, requests, users)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT (day, kind) DO UPDATE SET
+                        requests = requests + excluded.requests,
+                        users = users + excluded.users;""",
+                        (day, kind, requests, max(new_users, 0))
+                    )
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+    async def save_usage(
+            self,
+            events: list[tuple[int, str, str]],
+            hourly: dict[tuple[str, str], int],
+            daily: dict[tuple[str, str], int],
+            active: dict[tuple[str, str], set[int]]
+    ) -> None:
+        """
+        Append the usage events and apply their aggregates to the rollups.
+
+        :param events: List of (telegram_id, kind, created_at).
+        :param hourly: Dict: (bucket, kind) -> requests.
+        :param daily: Dict: (day, kind) -> requests.
+        :param active: Dict: (day, kind) -> Telegram IDs.
+
+        :return: None.
+        """
+        await asyncio.to_thread(self.__save_usage, events, hourly, daily, active)
+
+    async def get_usage_rollups(self, granularity: str, since: str) -> list[tuple]:
+        """
+        Read the rollups.
+
+        :param granularity: "hour" or "day".
+        :param since: First bucket / day (inclusive).
+
+        :return: List of rows.
+        """
+        if granularity == "hour":
+            sql: str = """SELECT bucket, kind, requests FROM usage_rollup_hourly
+            WHERE bucket >= ? ORDER BY bucket, kind;"""
+        else:
+            sql = """SELECT day, kind, requests, users FROM usage_rollup_daily
+            WHERE day >= ? ORDER BY day, kind;"""
+
+        return [tuple(row) for row in await self._execute(sql, (since,), fetch="all")]
+
+    def __save_memory_turn(
+            self,
+            telegram_id: int,
+            seq: int,
+            text: str,
+            embedding: bytes,
+            keep: int
+    ) -> None:
+        """
+        Save a turn of the long-term memory and drop the old turns (blocking).
+
+        :param telegram_id: Telegram User ID.
+        :param seq: Sequence number of the turn.
+        :param text: Text of the turn.
+        :param embedding: Embedding of the turn.
+        :param keep: Count of the latest turns to keep.
+
+        :return: None.
+        """
+        with self.__lock:
+            connection: sqlite3.Connection = self.__connection
+            try:
+                connection.execute(
+                    """INSERT OR REPLACE INTO memory_turns (telegram_id, seq, text, embedding)
+                    VALUES (?, ?, ?, ?);""",
+                    (telegram_id, seq, text, embedding)
+                )
+                connection.execute(
+                    "DELETE FROM memory_turns WHERE telegram_id = ? AND seq <= ?;",
+                    (telegram_id, seq - keep)
+                )
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+    async def save_memory_turn(
+            self,
+            telegram_id: int,
+            seq: int,
+            text: str,
+            embedding: bytes,
+            keep: int
+    ) -> None:
+        """
+        Save a turn of the long-term memory and drop the old turns.
+
+        :param telegram_id: Telegram User ID.
+        :param seq: Sequence number of the turn.
+        :param text: Text of the turn.
+        :param embedding: Embedding of the turn.
+        :param keep: Count of the latest turns to keep.
+
+        :return: None.
+        """
+        await asyncio.to_thread(
+            self.__save_memory_turn, telegram_id, seq, text, embedding, keep
+        )
+
+    async def get_memory_turns(self, telegram_id: int, limit: int) -> list[tuple[int, str, bytes]]:
+        """
+        Get the latest turns of the long-term memory.
+
+        :param telegram_id: Telegram User ID.
+        :param limit: Count of the turns.
+
+        :return: List of (seq, text, embedding) ordered by seq.
+        """
+        rows: list = await self._execute(
+            """SELECT seq, text, embedding FROM memory_turns WHERE telegram_id = ?
+            ORDER BY seq DESC LIMIT ?;""",
+            (telegram_id, limit),
+            fetch="all"
+        )
+
+        return [(seq, text, bytes(embedding)) for seq, text, embedding in reversed(rows)]
+
+    async def claim_updates(self, keys: list[str], seen_at: float) -> bool:
+        """
+        Mark the update keys as processed.
+
+        :param keys: Keys of the update.
+        :param seen_at: Unix time of the update.
+
+        :return: True if none of the keys has been processed before.
+        """
+        inserted: int = await self._execute_many(
+            "INSERT OR IGNORE INTO processed_updates (update_key, seen_at) VALUES (?, ?);",
+            [(key, seen_at) for key in keys]
+        )
+
+        return inserted == len(keys)
+
+    async def release_updates(self, keys: list[str]) -> None:
+        """
+        Forget the update keys (the handling has failed, a redelivery must be processed).
+
+        :param keys: Keys of the update.
+        :return: None.
+        """
+        await self._execute_many(
+            "DELETE FROM processed_updates WHERE update_key = ?;", [(key,) for key in keys]
+        )
+
+    async def purge_updates(self, before: float) -> int:
+        """
+        Forget the update keys processed before the time.
+
+        :param before: Unix time.
+        :return: Count of the forgotten keys.
+        """
+        return await self._execute("DELETE FROM processed_updates WHERE seen_at < ?;", (before,))
+
+    async def get_idle_contexts(self, before: float, limit: int) -> list[tuple[int, bytes | str]]:
+        """
+        Get the contexts which have not been written since the time (the oldest first).
+
+        :param before: Unix time.
+        :param limit: Count of the contexts.
+
+        :return: List of (telegram_id, encoded context).
+        """
+        rows: list = await self._execute(
+            """SELECT telegram_id, context FROM users
+            WHERE context_updated_at < ? AND context IS NOT NULL
+            ORDER BY context_updated_at LIMIT ?;""",
+            (before, limit),
+            fetch="all"
+        )
+
+        return [(int(telegram_id), context) for telegram_id, context in rows]
+
+    def __archive_contexts(
+            self,
+            rows: list[tuple[int, bytes]],
+            before: float,
+            archived_at: float
+    ) -> int:
+        """
+        Move the contexts to the archive (blocking).
+
+        :param rows: List of (telegram_id, encoded context for the archive).
+        :param before: Unix time (the same as in get_idle_contexts).
+        :param archived_at: Unix time of the archiving.
+
+        :return: Count of the archived contexts.
+        """
+        with self.__lock:
+            connection: sqlite3.Connection = self.__connection
+            archived: int = 0
+            try:
+                for telegram_id, context in rows:
+                    cursor: sqlite3.Cursor = connection.execute(
+                        """UPDATE users SET context = NULL WHERE telegram_id = ?
+                        AND context_updated_at < ? AND context IS NOT NULL;""",
+                        (telegram_id, before)
+                    )
+                    if cursor.rowcount:
+                        connection.execute(
+                            """INSERT OR REPLACE INTO context_archive
+                            (telegram_id, context, archived_at) VALUES (?, ?, ?);""",
+                            (telegram_id, context, archived_at)
+                        )
+                        archived += 1
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+            return archived
+
+    async def archive_contexts(
+            self,
+            rows: list[tuple[int, bytes]],
+            before: float,
+            archived_at: float
+    ) -> int:
+        """
+        Move the contexts to the archive (one transaction). A context written since
+        the time is left in place.
+
+        :param rows: List of (telegram_id, encoded context for the archive).
+        :param before: Unix time (the same as in get_idle_contexts).
+        :param archived_at: Unix time of the archiving.
+
+        :return: Count of the archived contexts.
+        """
+        return await asyncio.to_thread(self.__archive_contexts, rows, before, archived_at)
+
+    def __restore_context(self, telegram_id: int) -> bytes | None:
+        """
+        Move the archived context of the user back to the users (blocking).
+
+        :param telegram_id: Telegram User ID.
+        :return: Encoded context or None if the user has no archived context.
+        """
+        with self.__lock:
+            connection: sqlite3.Connection = self.__connection
+            try:
+                row: tuple | None = connection.execute(
+                    "SELECT context FROM context_archive WHERE telegram_id = ?;",
+                    (telegram_id,)
+                ).fetchone()
+                if row is None:
+                    return None
+
+                cursor: sqlite3.Cursor = connection.execute(
+                    """UPDATE users SET context = ?, context_updated_at = ?
+                    WHERE telegram_id = ? AND context IS NULL;""",
+                    (row[0], time.time(), telegram_id)
+                )
+                if not cursor.rowcount:
+                    connection.rollback()
+                    return None
+
+                connection.execute(
+                    "DELETE FROM context_archive WHERE telegram_id = ?;", (telegram_id,)
+                )
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+            return bytes(row[0])
+
+    async def restore_context(self, telegram_id: int) -> bytes | None:
+        """
+        Move the archived context of the user back to the users (one transaction).
+
+        :param telegram_id: Telegram User ID.
+        :return: Encoded context or None if the user has no archived context.
+        """
+        return await asyncio.to_thread(self.__restore_context, int(telegram_id))
@@ -0,0 +1,143 @@
+"""
+Module of the context retention job: the contexts which have not been written for
+MAX_IDLE_DAYS are moved from the users table to the compressed archive in small
+throttled batches; HandlerDB.get_context restores an archived context when the user
+returns.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from bot_ai.storage.base import BaseStorage
+from bot_ai.storage.context_codec import ContextCodec
+from bot_ai.storage.factory import StorageFactory
+from bot_ai.utils.metrics import metrics
+
+metrics.describe("contexts_archived_total", "Idle contexts moved to the archive")
+metrics.describe("context_archive_bytes_total", "Size of the contexts before / after archiving")
+
+
+class ContextArchiver:
+    """Periodic archiving of the idle contexts (section "ARCHIVE" of bot.json)."""
+    __instance: "ContextArchiver | None" = None
+
+    def __init__(self, settings: dict) -> None:
+        self.enabled: bool = settings.get("ENABLED", False)
+        self.max_idle: float = settings.get("MAX_IDLE_DAYS", 90) * 86400.0
+        self.batch_size: int = settings.get("BATCH_SIZE", 100)
+        self.batch_pause: float = settings.get("BATCH_PAUSE", 1.0)
+        self.max_batches: int = settings.get("MAX_BATCHES", 50)
+        self.interval: float = settings.get("INTERVAL", 3600.0)
+
+        self.__task: asyncio.Task | None = None
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "ContextArchiver":
+        """
+        Get the archiver (created from the "ARCHIVE" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Context archiver.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("ARCHIVE", {}))
+
+        return cls.__instance
+
+    @staticmethod
+    def __recode(rows: list[tuple[int, bytes | str]]) -> list[tuple[int, bytes]]:
+        """
+        Re-encode the contexts for the archive (blocking, called in a worker thread).
+        An undecodable context is archived as is.
+
+        :param rows: List of (telegram_id, encoded context).
+        :return: List of (telegram_id, context encoded for the archive).
+        """
+        result: list[tuple[int, bytes]] = list()
+        for telegram_id, context in rows:
+            try:
+                result.append(
+                    (telegram_id, ContextCodec.encode(ContextCodec.decode(context), archive=True))
+                )
+            except Exception as ex:
+                logging.warning("Context of user %s is archived as is: %r", telegram_id, ex)
+                result.append(
+                    (telegram_id, context.encode("utf-8") if isinstance(context, str) else context)
+                )
+
+        return result
+
+    async def run_once(self) -> int:
+        """
+        Archive the idle contexts: at most MAX_BATCHES batches of BATCH_SIZE with
+        a BATCH_PAUSE between them, so the job never competes with the live traffic.
+
+        :return: Count of the archived contexts.
+        """
+        storage: BaseStorage = StorageFactory.get()
+        before: float = time.time() - self.max_idle
+        archived: int = 0
+
+        for _ in range(self.max_batches):
+            rows: list[tuple[int, bytes | str]] = await storage.get_idle_contexts(
+                before, self.batch_size
+            )
+            if not rows:
+                break
+
+            recoded: list[tuple[int, bytes]] = await asyncio.to_thread(self.__recode, rows)
+            moved: int = await storage.archive_contexts(recoded, before, time.time())
+            archived += moved
+
+            metrics.inc("contexts_archived_total", moved)
+            metrics.inc(
+                "context_archive_bytes_total", sum(len(context) for _, context in rows),
+                stage="before"
+            )
+            metrics.inc(
+                "context_archive_bytes_total", sum(len(context) for _, context in recoded),
+                stage="after"
+            )
+            if len(rows) < self.batch_size:
+                break
+            await asyncio.sleep(self.batch_pause)
+
+        if archived:
+            logging.info("Archived %s idle contexts", archived)
+
+        return archived
+
+    async def __run(self) -> None:
+        """
+        Archive the idle contexts periodically.
+
+        :return: None.
+        """
+        while True:
+            try:
+                await self.run_once()
+            except Exception as ex:
+                logging.warning("Idle contexts have not been archived: %r", ex)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """
+        Start the periodic archiving.
+
+        :return: None.
+        """
+        if self.enabled and self.__task is None:
+            self.__task = asyncio.create_task(self.__run(), name="context-archiver")
+
+    async def stop(self) -> None:
+        """
+        Stop the periodic archiving (a batch in progress is committed or rolled back
+        by the storage as a whole).
+
+        :return: None.
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
@@ -2,6 +2,8 @@
 import pymysql
 import abc
 
+from bot_ai.utils.migrations import MigrationRunner
+
 
 class BaseCreateTable(abc.ABC):
     """Base class-sector for create table."""
@@ -27,22 +29,14 @@ class CreateTable(BaseCreateTable):
 
     def create(self) -> None:
         """
-        Create-function.
+        Create-function: apply the pending schema migrations.
 
         :return: None.
         """
-
-        query: str = f"""CREATE TABLE IF NOT EXISTS users (
-            id INT PRIMARY KEY AUTO_INCREMENT,
-            telegram_id VARCHAR (255) UNIQUE NOT NULL,
-            telegram_username VARCHAR(255) UNIQUE NOT NULL,
-            firstname VARCHAR (255) NOT NULL,
-            lastname VARCHAR (255) NOT NULL,
-            context LONGTEXT,
-            count_of_ai_queries INT NOT NULL
-            );
-            """
-        self._cursor.execute(query)
+        runner: MigrationRunner = MigrationRunner(
+            self._connection, self._cursor
+        )
+        runner.migrate()
 
         self._connection.commit()
         self._connection.close()
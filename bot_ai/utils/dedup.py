@@ -0,0 +1,190 @@
+"""
+Module of the update deduplication: the update ID (and the callback query ID) of every
+update is checked against a bounded, time-windowed set of the processed keys, which is
+persisted in the storage, so a redelivered update is dropped before any handler work
+even after a restart or in another worker process.
+
+The keys are claimed before the handlers run and released if a handler raises, so
+a redelivery of a failed update is processed again. If the process dies mid-update the
+keys stay claimed and the redelivery is dropped: at-most-once for crashes, which is
+preferred to answering (and charging) a turn twice.
+"""
+import collections
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from bot_ai.storage.factory import StorageFactory
+from bot_ai.utils.metrics import metrics
+
+metrics.describe("duplicate_updates_total", "Redelivered updates dropped before the handlers")
+
+
+class UpdateDeduplicator:
+    """Seen-set of the processed updates (section "DEDUP" of bot.json)."""
+    __instance: "UpdateDeduplicator | None" = None
+
+    def __init__(self, settings: dict) -> None:
+        self.enabled: bool = settings.get("ENABLED", False)
+        self.window: float = settings.get("WINDOW", 86400.0)
+        self.max_entries: int = settings.get("MAX_ENTRIES", 100000)
+        self.persist: bool = settings.get("PERSIST", True)
+        self.purge_interval: float = settings.get("PURGE_INTERVAL", 600.0)
+
+        self.__seen: collections.OrderedDict[str, float] = collections.OrderedDict()
+        self.__purged_at: float = 0.0
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "UpdateDeduplicator":
+        """
+        Get the deduplicator (created from the "DEDUP" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Update deduplicator.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("DEDUP", {}))
+
+        return cls.__instance
+
+    @staticmethod
+    def keys(update: Update) -> list[str]:
+        """
+        Get the idempotency keys of the update.
+
+        :param update: Update.
+        :return: Keys.
+        """
+        keys: list[str] = [f"update:{update.update_id}"]
+        if update.callback_query is not None:
+            keys.append(f"callback:{update.callback_query.id}")
+
+        return keys
+
+    def __expire(self, now: float) -> None:
+        """
+        Forget the keys out of the window or over the size limit (the oldest first).
+
+        :param now: Unix time.
+        :return: None.
+        """
+        while self.__seen and (
+                len(self.__seen) > self.max_entries
+                or next(iter(self.__seen.values())) < now - self.window
+        ):
+            self.__seen.popitem(last=False)
+
+    async def __purge(self, now: float) -> None:
+        """
+        Forget the stored keys out of the window (at most once per PURGE_INTERVAL).
+
+        :param now: Unix time.
+        :return: None.
+        """
+        if now - self.__purged_at < self.purge_interval:
+            return
+
+        self.__purged_at = now
+        try:
+            purged: int = await StorageFactory.get().purge_updates(now - self.window)
+            logging.debug("Forgotten %s processed update keys", purged)
+        except Exception as ex:
+            logging.warning("Processed update keys have not been purged: %r", ex)
+
+    async def first_seen(self, update: Update) -> bool:
+        """
+        Mark the update as processed.
+
+        :param update: Update.
+        :return: True if the update is new, False if it is a duplicate (the update is
+            treated as new if the storage is unavailable).
+        """
+        if not self.enabled:
+            return True
+
+        now: float = time.time()
+        keys: list[str] = self.keys(update)
+        self.__expire(now)
+
+        if any(key in self.__seen for key in keys):
+            metrics.inc("duplicate_updates_total", source="memory")
+            return False
+        for key in keys:
+            self.__seen[key] = now
+
+        if not self.persist:
+            return True
+
+        await self.__purge(now)
+        try:
+            fresh: bool = await StorageFactory.get().claim_updates(keys, now)
+        except Exception as ex:
+            logging.warning("The update has not been claimed in the storage: %r", ex)
+            return True
+
+        if not fresh:
+            metrics.inc("duplicate_updates_total", source="storage")
+
+        return fresh
+
+    async def release(self, update: Update) -> None:
+        """
+        Forget the keys of the update whose handling has failed, so its redelivery is
+        processed.
+
+        :param update: Update.
+        :return: None.
+        """
+        if not self.enabled:
+            return
+
+        keys: list[str] = self.keys(update)
+        for key in keys:
+            self.__seen.pop(key, None)
+
+        if not self.persist:
+            return
+
+        try:
+            await StorageFactory.get().release_updates(keys)
+        except Exception as ex:
+            logging.warning("The update keys have not been released: %r", ex)
+
+
+class DeduplicationMiddleware(BaseMiddleware):
+    """Outer update-middleware which drops the redelivered updates."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        """
+        Skip the handlers if the update has already been processed; release the update
+        if the handlers raise.
+
+        :param handler: Next handler.
+        :param event: Update.
+        :param data: Handler data.
+
+        :return: Result of the handler (None for a duplicate).
+        """
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        deduplicator: UpdateDeduplicator = UpdateDeduplicator.get()
+        if not await deduplicator.first_seen(event):
+            logging.info("Update %s has already been processed, skipping it", event.update_id)
+            return None
+
+        try:
+            return await handler(event, data)
+        except Exception:
+            await deduplicator.release(event)
+            raise
@@ -1,12 +1,17 @@
 """Database handler."""
 import abc
-import json
 import logging
-import pymysql
 
 from aiogram import types
 
-from bot_ai.utils.mysql_connection import Connection
+from bot_ai.storage.base import BaseStorage
+from bot_ai.storage.context_codec import ContextCodec
+from bot_ai.storage.factory import StorageFactory
+from bot_ai.utils.metrics import metrics
+from bot_ai.utils.serializer import Serializer
+from bot_ai.utils.tracing import Tracer
+
+metrics.describe("contexts_restored_total", "Archived contexts restored on the user's return")
 
 
 class BaseHandler(abc.ABC):
@@ -73,9 +78,10 @@ class BaseHandler(abc.ABC):
 
 
 class HandlerDB(BaseHandler):
-    """Handler DB class."""
+    """Handler DB class (works with the configured storage backend)."""
 
     @staticmethod
+    @Tracer.trace("db.update_analytics")
     async def update_analytic_datas_count_ai_queries(
             message: types.Message | types.CallbackQuery,
             count: int = 1
@@ -88,37 +94,16 @@ class HandlerDB(BaseHandler):
 
         :return: None.
         """
-        telegram_username: str = message.from_user.username
-        telegram_id: int = message.from_user.id
-        firstname: str = message.from_user.first_name
-        lastname: str = message.from_user.last_name
-
-        connection: pymysql.Connection = await Connection.get_connection(
-            await HandlerDB.get_data()
+        await StorageFactory.get().increment_count_of_ai_queries(
+            message.from_user.id,
+            message.from_user.username,
+            message.from_user.first_name,
+            message.from_user.last_name,
+            count
         )
-        cursor = connection.cursor()
-
-        query: str = f"""SELECT count_of_ai_queries FROM users 
-        WHERE telegram_id = '{str(telegram_id)}';"""
-        cursor.execute(query)
-        count_of_ai_queries = cursor.fetchall()
-
-        if len(count_of_ai_queries) == 0:
-            query: str = f"""INSERT INTO users (
-            telegram_id, telegram_username, firstname, lastname, count_of_ai_queries
-            ) VALUES (
-            '{str(telegram_id)}', '{telegram_username}', '{firstname}', 
-            '{lastname}', {count});"""
-            cursor.execute(query)
-        else:
-            query: str = f"""UPDATE users SET 
-            count_of_ai_queries = %s WHERE telegram_id = %s;"""
-            cursor.execute(query, (count_of_ai_queries[0][0] + count, str(telegram_id)))
-
-        connection.commit()
-        connection.close()
 
     @staticmethod
+    @Tracer.trace("db.get_analytics")
     async def get_analytic_datas_count_ai_queries(
             telegram_id: int
     ) -> str:
@@ -128,24 +113,12 @@ class HandlerDB(BaseHandler):
         :param telegram_id: Telegram user ID.
         :return: Count of AI queries.
         """
-        connection: pymysql.Connection = await Connection.get_connection(
-            await HandlerDB.get_data()
-        )
-        cursor = connection.cursor()
-
-        query: str = f"""SELECT count_of_ai_queries FROM users 
-                     WHERE telegram_id = '{str(telegram_id)}';"""
-        cursor.execute(query)
-        count_of_ai_queries = cursor.fetchall()
+        count: int = await StorageFactory.get().get_count_of_ai_queries(telegram_id)
 
-        connection.close()
-
-        if len(count_of_ai_queries) == 0:
-            return "0"
-        else:
-            return str(count_of_ai_queries[0][0])
+        return str(count)
 
     @staticmethod
+    @Tracer.trace("db.update_context")
     async def update_context(telegram_id: int, context: list) -> None:
         """
         Update context in database.
@@ -155,36 +128,29 @@ class HandlerDB(BaseHandler):
 
         :return: None.
         """
-        connection: pymysql.Connection = await Connection.get_connection(
-            await HandlerDB.get_data()
+        await StorageFactory.get().update_context(
+            telegram_id,
+            ContextCodec.encode(context)
         )
-        cursor = connection.cursor()
-        query: str = f"""UPDATE users SET 
-                     context = %s WHERE telegram_id = %s;"""
-        cursor.execute(query, (json.dumps({"data": context}).encode("utf-8"), str(telegram_id),))
-
-        connection.commit()
-        connection.close()
 
     @staticmethod
+    @Tracer.trace("db.get_context")
     async def get_context(telegram_id: int) -> list:
         """
-        Get context from database.
+        Get context from database (an archived context is restored on the way).
 
         :param telegram_id: Telegram User ID.
         :return: List with data.
         """
-        connection: pymysql.Connection = await Connection.get_connection(
-            await HandlerDB.get_data()
-        )
-        cursor = connection.cursor()
-
-        query: str = f"""SELECT context FROM users 
-                     WHERE telegram_id = '{str(telegram_id)}';"""
-        cursor.execute(query)
-        context = cursor.fetchall()
+        storage: BaseStorage = StorageFactory.get()
+        context: bytes | str | None = await storage.get_context(telegram_id)
+        if context is None:
+            context = await storage.restore_context(telegram_id)
+            if context is not None:
+                metrics.inc("contexts_restored_total")
+                logging.info("Archived context of user %s has been restored", telegram_id)
 
-        if context[0][0] is None:
+        if context is None:
             return [
                 {
                     "role": "system",
@@ -193,8 +159,7 @@ class HandlerDB(BaseHandler):
             ]
 
         else:
-            messages = json.loads(context[0][0])
-            return messages["data"]
+            return ContextCodec.decode(context)
 
     @staticmethod
     async def get_data(file_path="bot.json") -> dict:
@@ -205,7 +170,7 @@ class HandlerDB(BaseHandler):
         :return: Dict with data.
         """
         with open(file_path, "r", encoding='utf-8') as file:
-            data: dict = json.load(file)
+            data: dict = Serializer.loads(file.read())
 
             dct = dict()
 
@@ -0,0 +1,181 @@
+"""
+Module of the local health endpoint: liveness, readiness (DB pool, GigaChat token)
+and event-loop lag measurement.
+"""
+import asyncio
+import logging
+import time
+
+from aiohttp import web
+
+from bot_ai.gigachat.giga_requests import TokenStore
+from bot_ai.storage.factory import StorageFactory
+from bot_ai.utils.metrics import metrics
+from bot_ai.utils.shutdown import shutdown_coordinator
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes up a periodic task."""
+
+    def __init__(self, interval: float = 0.5) -> None:
+        self.interval: float = interval
+        self.lag: float = 0.0
+        self.max_lag: float = 0.0
+        self.last_tick: float = time.monotonic()
+        self.__task: asyncio.Task | None = None
+
+    async def __run(self) -> None:
+        """
+        Sleep for the interval and record the overshoot.
+
+        :return: None.
+        """
+        while True:
+            start: float = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.last_tick = time.monotonic()
+            self.lag = max(0.0, self.last_tick - start - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+
+    def start(self) -> None:
+        """
+        Start the monitor.
+
+        :return: None.
+        """
+        if self.__task is None:
+            self.__task = asyncio.create_task(self.__run(), name="loop-lag-monitor")
+
+    async def stop(self) -> None:
+        """
+        Stop the monitor.
+
+        :return: None.
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+
+class HealthServer:
+    """
+    Local HTTP endpoint for the orchestrator:
+
+    * ``GET /health/live`` - the process and its event loop are alive;
+    * ``GET /health/ready`` - the storage answers, the GigaChat token is fresh and the
+      bot is not shutting down;
+    * ``GET /metrics`` - the metrics in the Prometheus text format.
+    """
+
+    def __init__(self, settings: dict) -> None:
+        self.__host: str = settings.get("HOST", "127.0.0.1")
+        self.__port: int = settings.get("PORT", 8080)
+        self.__max_lag: float = settings.get("MAX_LOOP_LAG", 1.0)
+        self.__db_timeout: float = settings.get("DB_TIMEOUT", 2.0)
+        self.__token_margin: float = settings.get("TOKEN_MARGIN", 60.0)
+
+        self.monitor: LoopLagMonitor = LoopLagMonitor(settings.get("LAG_INTERVAL", 0.5))
+        self.__runner: web.AppRunner | None = None
+
+        self.app: web.Application = web.Application()
+        self.app.router.add_get("/health/live", self.live)
+        self.app.router.add_get("/health/ready", self.ready)
+        self.app.router.add_get("/metrics", self.export_metrics)
+
+    async def live(self, request: web.Request) -> web.Response:
+        """
+        Liveness: the loop is responsive (the lag monitor keeps ticking).
+
+        :param request: Request.
+        :return: 200 or 503 with JSON-details.
+        """
+        stalled_for: float = time.monotonic() - self.monitor.last_tick
+        alive: bool = stalled_for < self.monitor.interval + self.__max_lag * 5
+
+        return web.json_response(
+            {
+                "status": "ok" if alive else "stalled",
+                "loop_lag": round(self.monitor.lag, 4),
+                "max_loop_lag": round(self.monitor.max_lag, 4)
+            },
+            status=200 if alive else 503
+        )
+
+    async def ready(self, request: web.Request) -> web.Response:
+        """
+        Readiness: storage ping, token freshness, loop lag and shutdown state.
+
+        :param request: Request.
+        :return: 200 or 503 with JSON-details.
+        """
+        checks: dict[str, bool] = dict()
+
+        start: float = time.monotonic()
+        if not shutdown_coordinator.accepting:
+            # The storage may be closing: StorageFactory.get() would re-create it
+            checks["storage"] = False
+        else:
+            try:
+                checks["storage"] = await asyncio.wait_for(
+                    StorageFactory.get().ping(), timeout=self.__db_timeout
+                )
+            except Exception as ex:
+                logging.warning("Readiness: storage ping has failed: %r", ex)
+                checks["storage"] = False
+        storage_latency: float = time.monotonic() - start
+
+        checks["giga_token"] = TokenStore.is_fresh(self.__token_margin)
+        checks["loop_lag"] = self.monitor.lag <= self.__max_lag
+        checks["accepting"] = shutdown_coordinator.accepting
+
+        ready: bool = all(checks.values())
+
+        return web.json_response(
+            {
+                "status": "ready" if ready else "not ready",
+                "checks": checks,
+                "storage_latency": round(storage_latency, 4),
+                "token_expires_in": round(TokenStore.expires_at - time.time(), 1),
+                "loop_lag": round(self.monitor.lag, 4),
+                "in_flight": shutdown_coordinator.in_flight()
+            },
+            status=200 if ready else 503
+        )
+
+    async def export_metrics(self, request: web.Request) -> web.Response:
+        """
+        Metrics of the process in the Prometheus text format.
+
+        :param request: Request.
+        :return: 200 with the metrics.
+        """
+        metrics.set("event_loop_lag_seconds", self.monitor.lag)
+        for kind, count in shutdown_coordinator.in_flight().items():
+            metrics.set("in_flight_jobs", count, kind=kind)
+
+        return web.Response(text=metrics.render(), content_type="text/plain")
+
+    async def start(self) -> None:
+        """
+        Start the monitor and the HTTP server.
+
+        :return: None.
+        """
+        self.monitor.start()
+
+        self.__runner = web.AppRunner(self.app, access_log=None)
+        await self.__runner.setup()
+        await web.TCPSite(self.__runner, self.__host, self.__port).start()
+
+        logging.info("Health endpoint is listening on %s:%s", self.__host, self.__port)
+
+    async def stop(self) -> None:
+        """
+        Stop the HTTP server and the monitor.
+
+        :return: None.
+        """
+        await self.monitor.stop()
+        if self.__runner is not None:
+            await self.__runner.cleanup()
+            self.__runner = None
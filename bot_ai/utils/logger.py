@@ -0,0 +1,232 @@
+"""
+Module of the non-blocking logging pipeline: queue-based handler with a background
+writer thread, JSON-structured output with correlation fields and per-module sampling.
+"""
+import abc
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+update_id_ctx: contextvars.ContextVar[int | None] = contextvars.ContextVar(
+    "update_id", default=None
+)
+user_id_ctx: contextvars.ContextVar[int | None] = contextvars.ContextVar(
+    "user_id", default=None
+)
+
+TEXT_FORMAT: str = "%(levelname)s: %(asctime)s -- %(funcName)s -- %(message)s"
+DATE_FORMAT: str = "%d-%m-%Y %H:%M:%S"
+
+
+class CorrelationFilter(logging.Filter):
+    """Attach update_id / user_id of the current update to every record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """
+        Copy correlation fields from the context variables to the record.
+
+        :param record: Log record.
+        :return: True (the record is never dropped).
+        """
+        record.update_id = update_id_ctx.get()
+        record.user_id = user_id_ctx.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only every N-th INFO (and lower) record per module.
+    Warnings and errors always pass.
+    """
+
+    def __init__(self, rates: dict) -> None:
+        super().__init__()
+        self.__every: dict = {
+            module: max(1, round(1 / rate)) if rate > 0 else 0
+            for module, rate in rates.items()
+        }
+        self.__counters: dict = dict()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """
+        Decide whether the record is emitted.
+
+        :param record: Log record.
+        :return: True if the record passes the sampling.
+        """
+        if record.levelno > logging.INFO:
+            return True
+
+        every: int | None = self.__every.get(record.module)
+        if every is None or every == 1:
+            return True
+        if every == 0:
+            return False
+
+        count: int = self.__counters.get(record.module, 0)
+        self.__counters[record.module] = count + 1
+
+        return count % every == 0
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Format the record. The message is interpolated here, i.e. in the writer thread.
+
+        :param record: Log record.
+        :return: JSON line.
+        """
+        data: dict = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "module": record.module,
+            "func": record.funcName,
+            "msg": record.getMessage(),
+            "update_id": getattr(record, "update_id", None),
+            "user_id": getattr(record, "user_id", None),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler which never blocks the caller: records are enqueued without
+    formatting, and dropped (and counted) if the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped: int = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Keep the record as is: formatting is deferred to the writer thread.
+
+        :param record: Log record.
+        :return: Log record.
+        """
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Put the record into the queue without waiting.
+
+        :param record: Log record.
+        :return: None.
+        """
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BaseLoggingPipeline(abc.ABC):
+    """Base class for the logging pipeline."""
+
+    @staticmethod
+    @abc.abstractmethod
+    def setup(settings: dict) -> logging.handlers.QueueListener:
+        """
+        Configure the root logger.
+
+        :param settings: Logging settings.
+        :return: Started queue listener.
+        """
+
+
+class LoggingPipeline(BaseLoggingPipeline):
+    """Queue-based logging pipeline with a background writer thread."""
+
+    @staticmethod
+    def setup(settings: dict) -> logging.handlers.QueueListener:
+        """
+        Configure the root logger: the caller only enqueues records, the writer thread
+        formats and writes them to stdout.
+
+        :param settings: Logging settings (section "LOGGING" of bot.json).
+        :return: Started queue listener.
+        """
+        stream_handler: logging.StreamHandler = logging.StreamHandler(sys.stdout)
+        if settings.get("FORMAT", "json") == "json":
+            stream_handler.setFormatter(JSONFormatter())
+        else:
+            stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT, DATE_FORMAT))
+
+        log_queue: queue.Queue = queue.Queue(settings.get("QUEUE_SIZE", 10000))
+        queue_handler: DroppingQueueHandler = DroppingQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(settings.get("SAMPLING", {})))
+        queue_handler.addFilter(CorrelationFilter())
+
+        root: logging.Logger = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(settings.get("LEVEL", "INFO"))
+
+        listener: logging.handlers.QueueListener = logging.handlers.QueueListener(
+            log_queue, stream_handler, respect_handler_level=True
+        )
+        listener.start()
+
+        return listener
+
+    @staticmethod
+    def get_data(file_path: str = "bot.json") -> dict:
+        """
+        Get logging settings from bot.json-file.
+
+        :param file_path: bot.json path.
+        :return: Dict with settings.
+        """
+        with open(file_path, "r", encoding="utf-8") as file:
+            data: dict = json.load(file)
+
+            return data.get("LOGGING", {})
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Outer update-middleware which sets the correlation fields of the logs."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        """
+        Set update_id / user_id for the time of the update handling.
+
+        :param handler: Next handler.
+        :param event: Update.
+        :param data: Handler data.
+
+        :return: Result of the handler.
+        """
+        user = data.get("event_from_user")
+        update_token: contextvars.Token = update_id_ctx.set(
+            event.update_id if isinstance(event, Update) else None
+        )
+        user_token: contextvars.Token = user_id_ctx.set(
+            user.id if user is not None else None
+        )
+        try:
+            return await handler(event, data)
+        finally:
+            update_id_ctx.reset(update_token)
+            user_id_ctx.reset(user_token)
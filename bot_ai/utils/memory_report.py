@@ -0,0 +1,238 @@
+"""
+Module of the memory accounting: periodic RSS / high-water mark gauges and an on-demand
+report with the per-subsystem object counts, the most common object types and the
+tracemalloc allocations (each report is diffed with the previous one, so the growth
+between two reports points at a leak).
+"""
+import asyncio
+import collections
+import gc
+import json
+import logging
+import resource
+import tracemalloc
+from typing import Callable
+
+from bot_ai.utils.metrics import metrics
+
+metrics.describe("process_rss_bytes", "Resident set size of the process")
+metrics.describe("process_rss_peak_bytes", "High-water mark of the resident set size")
+
+# Allocations of the tracing itself and of the import machinery are noise
+TRACE_FILTERS: tuple[tracemalloc.Filter, ...] = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class MemoryReporter:
+    """Memory accounting of the process (section "MEMORY_REPORT" of bot.json)."""
+    __instance: "MemoryReporter | None" = None
+
+    def __init__(self, settings: dict) -> None:
+        self.trace_on_start: bool = settings.get("TRACEMALLOC", False)
+        self.frames: int = settings.get("FRAMES", 1)
+        self.top_limit: int = settings.get("TOP", 15)
+        self.rss_interval: float = settings.get("RSS_INTERVAL", 15.0)
+
+        self.__counters: dict[str, Callable[[], int | dict[str, int]]] = dict()
+        self.__snapshot: tracemalloc.Snapshot | None = None
+        self.__types: collections.Counter | None = None
+        self.__counts: dict[str, int] = dict()
+        self.__task: asyncio.Task | None = None
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "MemoryReporter":
+        """
+        Get the reporter (created from the "MEMORY_REPORT" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Memory reporter.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("MEMORY_REPORT", {}))
+
+        return cls.__instance
+
+    def register(self, name: str, counter: Callable[[], int | dict[str, int]]) -> None:
+        """
+        Register a subsystem counter.
+
+        :param name: Name of the subsystem.
+        :param counter: Callable returning the count (or the counts by name).
+
+        :return: None.
+        """
+        self.__counters[name] = counter
+
+    @staticmethod
+    def rss() -> tuple[int, int]:
+        """
+        Get the resident set size and its high-water mark.
+
+        :return: (RSS, peak RSS) in bytes (RSS is 0 if /proc is not available).
+        """
+        values: dict[str, int] = dict()
+        try:
+            with open("/proc/self/status", "r", encoding="ascii") as file:
+                for line in file:
+                    if line.startswith(("VmRSS:", "VmHWM:")):
+                        name, value = line.split(":", 1)
+                        values[name] = int(value.split()[0]) * 1024
+        except OSError:
+            pass
+
+        # ru_maxrss is in kilobytes on Linux
+        peak: int = values.get("VmHWM", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+        return values.get("VmRSS", 0), peak
+
+    def sample_rss(self) -> tuple[int, int]:
+        """
+        Update the RSS gauges.
+
+        :return: (RSS, peak RSS) in bytes.
+        """
+        rss, peak = self.rss()
+        metrics.set("process_rss_bytes", rss)
+        metrics.set("process_rss_peak_bytes", peak)
+
+        return rss, peak
+
+    def counts(self) -> dict[str, int]:
+        """
+        Get the counts of the registered subsystems.
+
+        :return: Dict: subsystem (subsystem.name for the nested counts) -> count.
+        """
+        result: dict[str, int] = dict()
+        for name, counter in self.__counters.items():
+            try:
+                value: int | dict[str, int] = counter()
+            except Exception as ex:
+                logging.warning("Memory counter %s has failed: %r", name, ex)
+                continue
+
+            if isinstance(value, dict):
+                result.update({f"{name}.{key}": count for key, count in value.items()})
+            else:
+                result[name] = value
+
+        return result
+
+    def __object_types(self) -> list[str]:
+        """
+        The most common object types tracked by the GC with the growth since the last
+        report (blocking).
+
+        :return: Lines of the report.
+        """
+        types: collections.Counter = collections.Counter(
+            type(item).__name__ for item in gc.get_objects()
+        )
+        previous: collections.Counter | None = self.__types
+        self.__types = types
+
+        return [
+            f"{count:>9} {count - previous[name]:>+8} {name}" if previous is not None
+            else f"{count:>9} {name}"
+            for name, count in types.most_common(self.top_limit)
+        ]
+
+    def __allocations(self) -> list[str]:
+        """
+        The top allocation sites (the growth since the last report if there is one).
+
+        :return: Lines of the report.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            return ["tracemalloc has been started now: request the report again "
+                    "to see the allocations since this moment"]
+
+        snapshot: tracemalloc.Snapshot = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+        previous: tracemalloc.Snapshot | None = self.__snapshot
+        self.__snapshot = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        lines: list[str] = [f"traced {current / 2 ** 20:.1f} MiB (peak {peak / 2 ** 20:.1f} MiB)"]
+
+        if previous is None:
+            for stat in snapshot.statistics("lineno")[:self.top_limit]:
+                lines.append(f"{stat.size / 1024:>9.1f} KiB {stat.count:>7}  {stat.traceback}")
+        else:
+            for stat in snapshot.compare_to(previous, "lineno")[:self.top_limit]:
+                lines.append(
+                    f"{stat.size_diff / 1024:>+9.1f} KiB {stat.count_diff:>+7}  {stat.traceback}"
+                )
+
+        return lines
+
+    def __collect(self, rss: int, peak: int, counts: dict[str, int]) -> str:
+        """
+        Build the report (blocking).
+
+        :param rss: Resident set size in bytes.
+        :param peak: High-water mark of the resident set size in bytes.
+        :param counts: Counts of the registered subsystems.
+
+        :return: Text of the report.
+        """
+        previous: dict[str, int] = self.__counts
+        self.__counts = counts
+
+        lines: list[str] = [f"RSS {rss / 2 ** 20:.1f} MiB, peak {peak / 2 ** 20:.1f} MiB", ""]
+        lines.append("Subsystems (count, change since the last report):")
+        for name, count in counts.items():
+            lines.append(f"{count:>9} {count - previous.get(name, count):>+8} {name}")
+
+        lines += ["", "Object types (GC):"] + self.__object_types()
+        lines += ["", "Allocations (tracemalloc):"] + self.__allocations()
+
+        return "\n".join(lines)
+
+    async def report(self) -> str:
+        """
+        Build the memory report. The subsystem counters read the structures owned by
+        the event loop, so they run here; only the GC and tracemalloc part runs in a
+        worker thread.
+
+        :return: Text of the report.
+        """
+        rss, peak = self.sample_rss()
+        counts: dict[str, int] = self.counts()
+
+        return await asyncio.to_thread(self.__collect, rss, peak, counts)
+
+    async def __run(self) -> None:
+        """
+        Update the RSS gauges periodically.
+
+        :return: None.
+        """
+        while True:
+            self.sample_rss()
+            await asyncio.sleep(self.rss_interval)
+
+    def start(self) -> None:
+        """
+        Start the RSS sampling (and tracemalloc if it is enabled in the settings).
+
+        :return: None.
+        """
+        if self.trace_on_start and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        if self.__task is None:
+            self.__task = asyncio.create_task(self.__run(), name="memory-rss-sampler")
+
+    async def stop(self) -> None:
+        """
+        Stop the RSS sampling.
+
+        :return: None.
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
@@ -0,0 +1,187 @@
+"""
+Module of the in-process metrics (counters, gauges and histograms) rendered in the
+Prometheus text format by the health endpoint (``GET /metrics``).
+"""
+import bisect
+import threading
+
+LATENCY_BUCKETS: tuple[float, ...] = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets."""
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets: tuple[float, ...] = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Add the value.
+
+        :param value: Observed value.
+        :return: None.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Registry of the metrics of the process (thread-safe, cheap to update)."""
+
+    def __init__(self) -> None:
+        self.__lock: threading.Lock = threading.Lock()
+        self.__counters: dict[str, dict[LabelKey, float]] = dict()
+        self.__gauges: dict[str, dict[LabelKey, float]] = dict()
+        self.__histograms: dict[str, dict[LabelKey, Histogram]] = dict()
+        self.__help: dict[str, str] = dict()
+
+    @staticmethod
+    def __key(labels: dict) -> LabelKey:
+        """
+        Convert the labels to the key of the series.
+
+        :param labels: Labels.
+        :return: Sorted tuple of the labels.
+        """
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def describe(self, name: str, text: str) -> None:
+        """
+        Set the help text of the metric.
+
+        :param name: Name of the metric.
+        :param text: Help text.
+
+        :return: None.
+        """
+        self.__help[name] = text
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """
+        Increase the counter.
+
+        :param name: Name of the counter.
+        :param value: Increment.
+        :param labels: Labels of the series.
+
+        :return: None.
+        """
+        key: LabelKey = self.__key(labels)
+        with self.__lock:
+            series: dict[LabelKey, float] = self.__counters.setdefault(name, dict())
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """
+        Set the gauge.
+
+        :param name: Name of the gauge.
+        :param value: Value.
+        :param labels: Labels of the series.
+
+        :return: None.
+        """
+        with self.__lock:
+            self.__gauges.setdefault(name, dict())[self.__key(labels)] = value
+
+    def observe(
+            self,
+            name: str,
+            value: float,
+            buckets: tuple[float, ...] = LATENCY_BUCKETS,
+            **labels
+    ) -> None:
+        """
+        Add the value to the histogram.
+
+        :param name: Name of the histogram.
+        :param value: Observed value.
+        :param buckets: Upper bounds of the buckets (used when the series is created).
+        :param labels: Labels of the series.
+
+        :return: None.
+        """
+        key: LabelKey = self.__key(labels)
+        with self.__lock:
+            series: dict[LabelKey, Histogram] = self.__histograms.setdefault(name, dict())
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def get(self, name: str, **labels) -> float:
+        """
+        Get the value of the counter or gauge.
+
+        :param name: Name of the metric.
+        :param labels: Labels of the series.
+
+        :return: Value (0.0 if there is no such series).
+        """
+        key: LabelKey = self.__key(labels)
+        with self.__lock:
+            for kind in (self.__counters, self.__gauges):
+                if key in kind.get(name, {}):
+                    return kind[name][key]
+
+        return 0.0
+
+    @staticmethod
+    def __labels(key: LabelKey, extra: tuple[tuple[str, str], ...] = ()) -> str:
+        """
+        Format the labels.
+
+        :param key: Labels of the series.
+        :param extra: Additional labels (e.g. "le").
+
+        :return: Text, e.g. {model="GigaChat"}.
+        """
+        pairs: tuple[tuple[str, str], ...] = key + extra
+        if not pairs:
+            return ""
+
+        return "{" + ",".join(
+            '{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"'))
+            for name, value in pairs
+        ) + "}"
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text format.
+
+        :return: Text.
+        """
+        lines: list[str] = list()
+        with self.__lock:
+            for kind, registry in (("counter", self.__counters), ("gauge", self.__gauges)):
+                for name, series in sorted(registry.items()):
+                    if name in self.__help:
+                        lines.append(f"# HELP {name} {self.__help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{self.__labels(key)} {value:g}")
+
+            for name, series in sorted(self.__histograms.items()):
+                if name in self.__help:
+                    lines.append(f"# HELP {name} {self.__help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative: int = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le: str = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(
+                            f"{name}_bucket{self.__labels(key, (('le', le),))} {cumulative}"
+                        )
+                    lines.append(f"{name}_sum{self.__labels(key)} {histogram.sum:g}")
+                    lines.append(f"{name}_count{self.__labels(key)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics: Metrics = Metrics()
@@ -0,0 +1,397 @@
+"""
+Module of the versioned schema migrations of the database (MySQL).
+
+Every migration is idempotent: it checks the current schema (information_schema)
+before changing it, so a partially applied migration can be safely re-run.
+"""
+import abc
+import logging
+
+import pymysql
+
+
+class BaseMigration(abc.ABC):
+    """Base class-sector for a schema migration."""
+    version: int = 0
+    description: str = ""
+
+    @abc.abstractmethod
+    def up(self, cursor) -> None:
+        """
+        Apply the migration.
+
+        :param cursor: Cursor of the connection.
+        :return: None.
+        """
+
+    @staticmethod
+    def column_type(cursor, table: str, column: str) -> str | None:
+        """
+        Get the data type of the column.
+
+        :param cursor: Cursor of the connection.
+        :param table: Table name.
+        :param column: Column name.
+
+        :return: Data type (lowercase) or None if there is no such column.
+        """
+        cursor.execute(
+            """SELECT DATA_TYPE FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s;""",
+            (table, column)
+        )
+        row = cursor.fetchone()
+
+        return None if row is None else str(row[0]).lower()
+
+    @staticmethod
+    def is_nullable(cursor, table: str, column: str) -> bool:
+        """
+        Check if the column accepts NULL.
+
+        :param cursor: Cursor of the connection.
+        :param table: Table name.
+        :param column: Column name.
+
+        :return: True if the column is nullable.
+        """
+        cursor.execute(
+            """SELECT IS_NULLABLE FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s;""",
+            (table, column)
+        )
+        row = cursor.fetchone()
+
+        return row is not None and row[0] == "YES"
+
+    @staticmethod
+    def index_exists(cursor, table: str, index: str) -> bool:
+        """
+        Check if the index exists.
+
+        :param cursor: Cursor of the connection.
+        :param table: Table name.
+        :param index: Index name.
+
+        :return: True if the index exists.
+        """
+        cursor.execute(
+            """SELECT 1 FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+            LIMIT 1;""",
+            (table, index)
+        )
+
+        return cursor.fetchone() is not None
+
+
+class CreateUsersTable(BaseMigration):
+    """Initial schema: the table of users."""
+    version: int = 1
+    description: str = "create table users"
+
+    def up(self, cursor) -> None:
+        """
+        Apply the migration.
+
+        :param cursor: Cursor of the connection.
+        :return: None.
+        """
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS users (
+            id INT PRIMARY KEY AUTO_INCREMENT,
+            telegram_id VARCHAR (255) UNIQUE NOT NULL,
+            telegram_username VARCHAR(255) UNIQUE NOT NULL,
+            firstname VARCHAR (255) NOT NULL,
+            lastname VARCHAR (255) NOT NULL,
+            context LONGTEXT,
+            count_of_ai_queries INT NOT NULL
+            );"""
+        )
+
+
+class TelegramIdBigint(BaseMigration):
+    """Move telegram_id to BIGINT and relax the constraints of the user's names."""
+    version: int = 2
+    description: str = "telegram_id BIGINT, nullable username / lastname"
+
+    def up(self, cursor) -> None:
+        """
+        Apply the migration.
+
+        :param cursor: Cursor of the connection.
+        :return: None.
+        """
+        if self.column_type(cursor, "users", "telegram_id") != "bigint":
+            cursor.execute("ALTER TABLE users MODIFY telegram_id BIGINT NOT NULL;")
+
+        if self.index_exists(cursor, "users", "telegram_username"):
+            cursor.execute("ALTER TABLE users DROP INDEX telegram_username;")
+
+        if not self.is_nullable(cursor, "users", "telegram_username"):
+            cursor.execute("ALTER TABLE users MODIFY telegram_username VARCHAR(255) NULL;")
+
+        if not self.is_nullable(cursor, "users", "lastname"):
+            cursor.execute("ALTER TABLE users MODIFY lastname VARCHAR(255) NULL;")
+
+
+class UsersCoveringIndexes(BaseMigration):
+    """Covering index for the analytics reads (telegram_id -> count_of_ai_queries)."""
+    version: int = 3
+    description: str = "covering index for analytics reads"
+
+    def up(self, cursor) -> None:
+        """
+        Apply the migration.
+
+        The context reads use the unique index on telegram_id (LONGTEXT can not be
+        a part of an index).
+
+        :param cursor: Cursor of the connection.
+        :return: None.
+        """
+        if not self.index_exists(cursor, "users", "idx_users_telegram_id_caq"):
+            cursor.execute(
+                "CREATE INDEX idx_users_telegram_id_caq "
+                "ON users (telegram_id, count_of_ai_queries);"
+            )
+
+
+class ContextBlob(BaseMigration):
+    """Store the context as binary (see ContextCodec); legacy JSON rows stay readable."""
+    version: int = 4
+    description: str = "context LONGBLOB"
+
+    def up(self, cursor) -> None:
+        """
+        Apply the migration.
+
+        :param cursor: Cursor of the connection.
+        :return: None.
+        """
+        if self.column_type(cursor, "users", "context") != "longblob":
+            cursor.execute("ALTER TABLE users MODIFY context LONGBLOB;")
+
+
+class CreateQuotaUsage(BaseMigration):
+    """Daily quota usage of the users (see RateLimiter)."""
+    version: int = 5
+    description: str = "create table quota_usage"
+
+    def up(self, cursor) -> None:
+        """
+        Apply the migration.
+
+        :param cursor: Cursor of the connection.
+        :return: None.
+        """
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS quota_usage (
+            day DATE NOT NULL,
+            telegram_id BIGINT NOT NULL,
+            kind VARCHAR(16) NOT NULL,
+            used INT NOT NULL,
+            PRIMARY KEY (day, telegram_id, kind)
+            );"""
+        )
+
+
+class CreateUsageRollups(BaseMigration):
+    """Append-only usage events and their hourly / daily rollups."""
+    version: int = 6
+    description: str = "create usage events and rollups"
+
+    def up(self, cursor) -> None:
+        """
+        Apply the migration.
+
+        :param cursor: Cursor of the connection.
+        :return: None.
+        """
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS usage_events (
+            id BIGINT PRIMARY KEY AUTO_INCREMENT,
+            telegram_id BIGINT NOT NULL,
+            kind VARCHAR(16) NOT NULL,
+            created_at DATETIME NOT NULL
+            );"""
+        )
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS usage_rollup_hourly (
+            bucket DATETIME NOT NULL,
+            kind VARCHAR(16) NOT NULL,
+            requests INT NOT NULL,
+            PRIMARY KEY (bucket, kind)
+            );"""
+        )
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS usage_rollup_daily (
+            day DATE NOT NULL,
+            kind VARCHAR(16) NOT NULL,
+            requests INT NOT NULL,
+            users INT NOT NULL,
+            PRIMARY KEY (day, kind)
+            );"""
+        )
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS usage_active_users (
+            day DATE NOT NULL,
+            kind VARCHAR(16) NOT NULL,
+            telegram_id BIGINT NOT NULL,
+            PRIMARY KEY (day, kind, telegram_id)
+            );"""
+        )
+
+
+class CreateMemoryTurns(BaseMigration):
+    """Turns of the long-term memory with their embeddings."""
+    version: int = 7
+    description: str = "create memory turns"
+
+    def up(self, cursor) -> None:
+        """
+        Apply the migration.
+
+        :param cursor: Cursor of the connection.
+        :return: None.
+        """
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS memory_turns (
+            telegram_id BIGINT NOT NULL,
+            seq INT NOT NULL,
+            text MEDIUMTEXT NOT NULL,
+            embedding MEDIUMBLOB NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (telegram_id, seq)
+            );"""
+        )
+
+
+class CreateProcessedUpdates(BaseMigration):
+    """Keys of the processed updates (deduplication of the redelivered updates)."""
+    version: int = 8
+    description: str = "create processed updates"
+
+    def up(self, cursor) -> None:
+        """
+        Apply the migration.
+
+        :param cursor: Cursor of the connection.
+        :return: None.
+        """
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS processed_updates (
+            update_key VARCHAR(96) NOT NULL PRIMARY KEY,
+            seen_at DOUBLE NOT NULL,
+            INDEX idx_processed_updates_seen_at (seen_at)
+            );"""
+        )
+
+
+class CreateContextArchive(BaseMigration):
+    """Time of the last context write and the archive of the idle contexts."""
+    version: int = 9
+    description: str = "context_updated_at, create context archive"
+
+    def up(self, cursor) -> None:
+        """
+        Apply the migration.
+
+        The existing contexts are stamped with the time of the migration, so they are
+        archived only after the idle age has passed since the deployment.
+
+        :param cursor: Cursor of the connection.
+        :return: None.
+        """
+        if self.column_type(cursor, "users", "context_updated_at") is None:
+            cursor.execute("ALTER TABLE users ADD COLUMN context_updated_at DOUBLE NULL;")
+            cursor.execute(
+                "UPDATE users SET context_updated_at = UNIX_TIMESTAMP() "
+                "WHERE context IS NOT NULL;"
+            )
+
+        if not self.index_exists(cursor, "users", "idx_users_context_updated_at"):
+            cursor.execute(
+                "CREATE INDEX idx_users_context_updated_at ON users (context_updated_at);"
+            )
+
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS context_archive (
+            telegram_id BIGINT NOT NULL PRIMARY KEY,
+            context LONGBLOB NOT NULL,
+            archived_at DOUBLE NOT NULL
+            );"""
+        )
+
+
+MIGRATIONS: list[BaseMigration] = [
+    CreateUsersTable(),
+    TelegramIdBigint(),
+    UsersCoveringIndexes(),
+    ContextBlob(),
+    CreateQuotaUsage(),
+    CreateUsageRollups(),
+    CreateMemoryTurns(),
+    CreateProcessedUpdates(),
+    CreateContextArchive(),
+]
+
+
+class MigrationRunner:
+    """Runner of the pending migrations (the applied versions are stored in the DB)."""
+
+    def __init__(
+        self,
+        connection: pymysql.connections.Connection,
+        cursor,
+        migrations: list[BaseMigration] | None = None
+    ) -> None:
+        self.__connection: pymysql.connections.Connection = connection
+        self.__cursor = cursor
+        self.__migrations: list[BaseMigration] = sorted(
+            MIGRATIONS if migrations is None else migrations,
+            key=lambda migration: migration.version
+        )
+
+    def applied_versions(self) -> set[int]:
+        """
+        Get versions of the applied migrations.
+
+        :return: Set of versions.
+        """
+        self.__cursor.execute(
+            """CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );"""
+        )
+        self.__cursor.execute("SELECT version FROM schema_migrations;")
+
+        return {row[0] for row in self.__cursor.fetchall()}
+
+    def migrate(self) -> list[int]:
+        """
+        Apply all pending migrations in order of version.
+
+        :return: List of the applied versions.
+        """
+        applied: set[int] = self.applied_versions()
+        result: list[int] = list()
+
+        for migration in self.__migrations:
+            if migration.version in applied:
+                continue
+
+            logging.info(
+                "Applying migration %s: %s", migration.version, migration.description
+            )
+            migration.up(self.__cursor)
+            self.__cursor.execute(
+                "INSERT IGNORE INTO schema_migrations (version, description) VALUES (%s, %s);",
+                (migration.version, migration.description)
+            )
+            self.__connection.commit()
+            result.append(migration.version)
+
+        return result
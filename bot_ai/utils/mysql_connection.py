@@ -4,6 +4,8 @@ manage DataBase (DB).
 """
 import pymysql
 import logging
+import queue
+import threading
 
 
 class Connection:
@@ -30,12 +32,201 @@ class Connection:
             )
 
         except Exception as ex:
-            logging.warning(f"No connection to the Database (MySQL) occurred! "
-                            f"The exception has arisen: {ex}")
+            logging.warning("No connection to the Database (MySQL) occurred! "
+                            "The exception has arisen: %s", ex)
             connection: str = "Error of connection"
 
-        logging.info(
-            "Successful connection to the database (MySQL)"
-        )
+        else:
+            logging.info(
+                "Successful connection to the database (MySQL)"
+            )
 
         return connection
+
+
+class PreparedStatement:
+    """
+    Statement compiled once per pooled connection and then reused.
+
+    PyMySQL speaks only the text protocol, so the statement is prepared on the
+    client side: the SQL-template and the cursor are kept and only the
+    parameters are escaped on every execution.
+    """
+
+    def __init__(self, connection: pymysql.Connection, sql: str) -> None:
+        self.sql: str = sql
+        self.cursor = connection.cursor()
+        self.executions: int = 0
+
+    def execute(self, params: tuple | None = None) -> int:
+        """
+        Execute the statement.
+
+        :param params: Parameters of the statement.
+        :return: Count of affected rows.
+        """
+        self.executions += 1
+        return self.cursor.execute(self.sql, params)
+
+    def execute_many(self, params: list[tuple]) -> int:
+        """
+        Execute the statement for a batch of parameters (multi-row INSERT if possible).
+
+        :param params: List of parameters.
+        :return: Count of affected rows.
+        """
+        self.executions += 1
+        return self.cursor.executemany(self.sql, params)
+
+
+class PooledConnection:
+    """Connection of the pool with its prepared statements."""
+
+    def __init__(self, connection: pymysql.Connection) -> None:
+        self.connection: pymysql.Connection = connection
+        self.__statements: dict[str, PreparedStatement] = dict()
+
+    def prepare(self, name: str, sql: str) -> PreparedStatement:
+        """
+        Get the prepared statement (prepare it on the first use).
+
+        :param name: Name of the statement.
+        :param sql: SQL-template of the statement.
+
+        :return: Prepared statement.
+        """
+        statement: PreparedStatement | None = self.__statements.get(name)
+        if statement is None:
+            statement = PreparedStatement(self.connection, sql)
+            self.__statements[name] = statement
+
+        return statement
+
+    def close(self) -> None:
+        """
+        Close the statements and the connection.
+
+        :return: None.
+        """
+        for statement in self.__statements.values():
+            statement.cursor.close()
+        self.__statements.clear()
+        self.connection.close()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of the connections to database (MySQL).
+    The connections are used from the worker threads (see QueryExecutor).
+    """
+
+    def __init__(self, mysql_data: dict) -> None:
+        self.__mysql_data: dict = mysql_data
+        self.__size: int = mysql_data.get("POOL_SIZE", 4)
+        self.__idle: queue.LifoQueue = queue.LifoQueue()
+        self.__created: int = 0
+        self.__lock: threading.Lock = threading.Lock()
+
+    def __connect(self) -> PooledConnection:
+        """
+        Open a new connection.
+
+        :return: Pooled connection.
+        """
+        return PooledConnection(
+            pymysql.Connection(
+                host=self.__mysql_data["HOST"],
+                user=self.__mysql_data["USERNAME"],
+                password=self.__mysql_data["PASSWORD"],
+                database=self.__mysql_data["DB_NAME"],
+                port=self.__mysql_data["PORT"]
+            )
+        )
+
+    def acquire(self, timeout: float = 10.0) -> PooledConnection:
+        """
+        Take a connection from the pool (open a new one if the pool is not full).
+        Blocking: call it from a worker thread.
+
+        :param timeout: Timeout of waiting for a free connection.
+        :return: Pooled connection.
+        """
+        try:
+            pooled: PooledConnection = self.__idle.get_nowait()
+        except queue.Empty:
+            with self.__lock:
+                can_create: bool = self.__created < self.__size
+                if can_create:
+                    self.__created += 1
+
+            if can_create:
+                try:
+                    return self.__connect()
+                except Exception:
+                    with self.__lock:
+                        self.__created -= 1
+                    raise
+
+            pooled = self.__idle.get(timeout=timeout)
+
+        try:
+            pooled.connection.ping(reconnect=True)
+        except Exception as ex:
+            # The slot goes back to the pool, the caller gets a new connection (or the error)
+            logging.warning("Idle connection is broken: %r", ex)
+            self.release(pooled, broken=True)
+            return self.acquire(timeout)
+
+        return pooled
+
+    def release(self, pooled: PooledConnection, broken: bool = False) -> None:
+        """
+        Return the connection to the pool.
+
+        :param pooled: Pooled connection.
+        :param broken: Close the connection instead of reusing it.
+
+        :return: None.
+        """
+        if broken:
+            with self.__lock:
+                self.__created -= 1
+            try:
+                pooled.close()
+            except Exception as ex:
+                logging.warning("Error while closing a broken connection: %s", ex)
+            return
+
+        self.__idle.put(pooled)
+
+    def warm_up(self, count: int | None = None) -> int:
+        """
+        Open connections in advance.
+
+        :param count: Count of connections (the size of the pool by default).
+        :return: Count of the opened connections.
+        """
+        opened: list[PooledConnection] = list()
+        try:
+            for _ in range(self.__size if count is None else min(count, self.__size)):
+                opened.append(self.acquire())
+        finally:
+            for pooled in opened:
+                self.release(pooled)
+
+        return len(opened)
+
+    def close(self) -> None:
+        """
+        Close all idle connections.
+
+        :return: None.
+        """
+        while True:
+            try:
+                pooled: PooledConnection = self.__idle.get_nowait()
+            except queue.Empty:
+                break
+            with self.__lock:
+                self.__created -= 1
+            pooled.close()
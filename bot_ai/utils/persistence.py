@@ -0,0 +1,132 @@
+"""
+Module of the background persistence queue: the writes of a turn (analytics counters,
+context) run after the reply, in order per user, with retries; one supervised task per
+user with pending writes, so a slow or failing write never delays the reply.
+"""
+import asyncio
+import collections
+import json
+import logging
+from typing import Awaitable, Callable
+
+from bot_ai.utils.metrics import metrics
+
+metrics.describe("persistence_failures_total", "Background writes dropped after the retries")
+metrics.describe("persistence_retries_total", "Retried background writes")
+
+
+class PersistenceQueue:
+    """Per-user ordered queues of the background writes (section "PERSISTENCE")."""
+    __instance: "PersistenceQueue | None" = None
+
+    def __init__(self, settings: dict) -> None:
+        self.max_retries: int = settings.get("MAX_RETRIES", 3)
+        self.retry_delay: float = settings.get("RETRY_DELAY", 0.5)
+
+        self.__queues: dict[int, collections.deque[tuple[str, Callable[[], Awaitable]]]] = dict()
+        self.__workers: dict[int, asyncio.Task] = dict()
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "PersistenceQueue":
+        """
+        Get the queue (created from the "PERSISTENCE" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Persistence queue.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("PERSISTENCE", {}))
+
+        return cls.__instance
+
+    def pending(self) -> int:
+        """
+        Count of the queued writes.
+
+        :return: Count.
+        """
+        return sum(len(queue) for queue in self.__queues.values())
+
+    async def __write(self, telegram_id: int, name: str, write: Callable[[], Awaitable]) -> None:
+        """
+        Run the write with retries (exponential backoff).
+
+        :param telegram_id: Telegram User ID.
+        :param name: Name of the write (for the logs).
+        :param write: Coroutine function of the write.
+
+        :return: None.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                await write()
+                return
+            except Exception as ex:
+                if attempt == self.max_retries:
+                    metrics.inc("persistence_failures_total", write=name)
+                    logging.error(
+                        "Write %s of user %s has been dropped after %s attempts: %r",
+                        name, telegram_id, attempt + 1, ex
+                    )
+                    return
+
+                metrics.inc("persistence_retries_total", write=name)
+                logging.warning("Write %s of user %s has failed: %r", name, telegram_id, ex)
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    async def __work(self, telegram_id: int) -> None:
+        """
+        Run the writes of the user one by one until the queue is empty.
+
+        :param telegram_id: Telegram User ID.
+        :return: None.
+        """
+        queue: collections.deque = self.__queues[telegram_id]
+        try:
+            while queue:
+                name, write = queue[0]
+                await self.__write(telegram_id, name, write)
+                queue.popleft()
+        finally:
+            if not queue:
+                self.__queues.pop(telegram_id, None)
+            self.__workers.pop(telegram_id, None)
+            metrics.set("persistence_queue_depth", self.pending())
+
+    def submit(self, telegram_id: int, name: str, write: Callable[[], Awaitable]) -> None:
+        """
+        Queue the write after the previous writes of the user.
+
+        :param telegram_id: Telegram User ID.
+        :param name: Name of the write (for the logs and the metrics).
+        :param write: Coroutine function of the write.
+
+        :return: None.
+        """
+        self.__queues.setdefault(telegram_id, collections.deque()).append((name, write))
+        if telegram_id not in self.__workers:
+            self.__workers[telegram_id] = asyncio.create_task(
+                self.__work(telegram_id), name=f"persistence-{telegram_id}"
+            )
+        metrics.set("persistence_queue_depth", self.pending())
+
+    async def drain(self, telegram_id: int) -> None:
+        """
+        Wait for the queued writes of the user (read-your-writes before a context fetch).
+
+        :param telegram_id: Telegram User ID.
+        :return: None.
+        """
+        worker: asyncio.Task | None = self.__workers.get(telegram_id)
+        if worker is not None:
+            await asyncio.shield(worker)
+
+    async def stop(self) -> None:
+        """
+        Wait for all queued writes.
+
+        :return: None.
+        """
+        while self.__workers:
+            await asyncio.gather(*self.__workers.values(), return_exceptions=True)
@@ -0,0 +1,226 @@
+"""
+Module of the on-demand sampling profiler: a background thread samples the stack of
+the event-loop thread for N seconds and produces collapsed stacks (flame-graph input,
+e.g. for flamegraph.pl or speedscope) and the top-N functions.
+"""
+import asyncio
+import collections
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+IDLE_FRAMES: set[tuple[str, str]] = {("select", "selectors.py"), ("poll", "selectors.py")}
+
+
+class ProfileResult:
+    """Samples of one profiling session."""
+
+    def __init__(self, stacks: collections.Counter, samples: int, seconds: float) -> None:
+        self.stacks: collections.Counter = stacks
+        self.samples: int = samples
+        self.seconds: float = seconds
+
+    def collapsed(self) -> str:
+        """
+        Collapsed stacks: "root;child;leaf count" per line.
+
+        :return: Text.
+        """
+        return "\n".join(
+            f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()
+        ) + "\n"
+
+    def top(self, limit: int = 15) -> list[tuple[str, int, int]]:
+        """
+        Top functions by self samples (with their inclusive samples).
+
+        :param limit: Count of functions.
+        :return: List of (function, self samples, total samples).
+        """
+        own: collections.Counter = collections.Counter()
+        total: collections.Counter = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+
+        return [(frame, count, total[frame]) for frame, count in own.most_common(limit)]
+
+    def summary(self, limit: int = 15) -> str:
+        """
+        Text summary of the top functions.
+
+        :param limit: Count of functions.
+        :return: Text.
+        """
+        busy: int = sum(self.stacks.values())
+        lines: list[str] = [
+            f"{self.samples} samples in {self.seconds:.1f} s, busy: {busy} "
+            f"({busy / max(self.samples, 1):.0%})",
+            "self%  total%  function"
+        ]
+        for frame, own, total in self.top(limit):
+            lines.append(
+                f"{own / max(busy, 1):>5.1%} {total / max(busy, 1):>7.1%}  {frame}"
+            )
+
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """Low-overhead sampler of the stack of one thread (one session at a time)."""
+    __instance: "SamplingProfiler | None" = None
+
+    def __init__(self, settings: dict | None = None) -> None:
+        settings = dict() if settings is None else settings
+        self.interval: float = settings.get("INTERVAL", 0.005)
+        self.default_seconds: float = settings.get("DEFAULT_SECONDS", 10)
+        self.max_seconds: float = settings.get("MAX_SECONDS", 60)
+        self.directory: str = settings.get("DIR", "profiles")
+        self.top_limit: int = settings.get("TOP", 15)
+        self.__running: bool = False
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "SamplingProfiler":
+        """
+        Get the profiler (created from the "PROFILER" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Sampling profiler.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("PROFILER", {}))
+
+        return cls.__instance
+
+    @classmethod
+    def configure(cls, settings: dict) -> None:
+        """
+        Create the profiler from the given settings instead of bot.json (e.g. with
+        a per-worker output directory).
+
+        :param settings: Profiler settings.
+        :return: None.
+        """
+        cls.__instance = cls(settings)
+
+    @staticmethod
+    def __label(frame) -> str:
+        """
+        Label of the frame: qualified name (file:line).
+
+        :param frame: Frame.
+        :return: Label.
+        """
+        code = frame.f_code
+        name: str = getattr(code, "co_qualname", code.co_name)
+
+        return (f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                .replace(";", ":"))
+
+    def sample(self, thread_id: int, seconds: float, focus: str | None = None) -> ProfileResult:
+        """
+        Sample the thread (blocking: call it from another thread).
+
+        :param thread_id: Identifier of the sampled thread.
+        :param seconds: Duration.
+        :param focus: Keep only the stacks which contain a frame with this substring
+            (e.g. "chat_dialog" or "__handler_query").
+
+        :return: Profile result (idle samples of the event loop are not in the stacks).
+        """
+        stacks: collections.Counter = collections.Counter()
+        samples: int = 0
+        deadline: float = time.monotonic() + seconds
+
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            samples += 1
+
+            code = frame.f_code
+            if (code.co_name, os.path.basename(code.co_filename)) not in IDLE_FRAMES:
+                stack: list[str] = list()
+                while frame is not None:
+                    stack.append(self.__label(frame))
+                    frame = frame.f_back
+                stack.reverse()
+
+                if focus is None or any(focus in label for label in stack):
+                    stacks[tuple(stack)] += 1
+
+            del frame
+            time.sleep(self.interval)
+
+        return ProfileResult(stacks, samples, seconds)
+
+    async def profile(self, seconds: float | None = None, focus: str | None = None) -> ProfileResult:
+        """
+        Profile the event-loop thread (the caller's thread) without blocking the loop.
+
+        :param seconds: Duration (limited by MAX_SECONDS).
+        :param focus: Substring of the frames to focus on.
+
+        :return: Profile result.
+        """
+        if self.__running:
+            raise RuntimeError("The profiler is already running")
+
+        seconds = min(self.default_seconds if seconds is None else seconds, self.max_seconds)
+        self.__running = True
+        try:
+            return await asyncio.to_thread(
+                self.sample, threading.get_ident(), seconds, focus
+            )
+        finally:
+            self.__running = False
+
+    def save(self, result: ProfileResult) -> str:
+        """
+        Save the collapsed stacks and the summary to the profiles directory.
+
+        :param result: Profile result.
+        :return: Path of the collapsed stacks file.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        name: str = time.strftime("profile-%Y%m%d-%H%M%S")
+        path: str = os.path.join(self.directory, f"{name}.collapsed")
+
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(result.collapsed())
+        with open(os.path.join(self.directory, f"{name}.txt"), "w", encoding="utf-8") as file:
+            file.write(result.summary(self.top_limit))
+
+        return path
+
+    def install_signal_handler(self, signum: int = getattr(signal, "SIGUSR1", 0)) -> None:
+        """
+        Profile for DEFAULT_SECONDS on the signal (SIGUSR1 by default) and save the result.
+
+        :param signum: Signal number.
+        :return: None.
+        """
+        if not signum:
+            return
+
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+
+        async def run() -> None:
+            try:
+                result: ProfileResult = await self.profile()
+            except RuntimeError as ex:
+                logging.warning("Profiling has not been started: %s", ex)
+                return
+            path: str = await asyncio.to_thread(self.save, result)
+            logging.info("Profile has been saved to %s\n%s", path, result.summary(self.top_limit))
+
+        try:
+            loop.add_signal_handler(signum, lambda: loop.create_task(run()))
+        except NotImplementedError:
+            logging.warning("Signal handlers are not supported, use the /profile command")
@@ -0,0 +1,375 @@
+"""
+Module of the parameterized query layer: named statements, prepared once per pooled
+connection, executed in worker threads, timed and callable in batches.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable
+
+from bot_ai.utils.mysql_connection import ConnectionPool, PooledConnection
+
+
+class Query:
+    """Named parameterized statement."""
+
+    def __init__(self, name: str, sql: str, fetch: str | None = None) -> None:
+        """
+        :param name: Name of the statement (key of the prepared statement and of the stats).
+        :param sql: SQL-template with %s-placeholders.
+        :param fetch: "one", "all" or None (return the count of affected rows).
+        """
+        self.name: str = name
+        self.sql: str = sql
+        self.fetch: str | None = fetch
+
+
+SELECT_ONE: Query = Query(
+    "select_one",
+    "SELECT 1;",
+    fetch="one"
+)
+SELECT_COUNT_OF_AI_QUERIES: Query = Query(
+    "select_count_of_ai_queries",
+    "SELECT count_of_ai_queries FROM users WHERE telegram_id = %s;",
+    fetch="one"
+)
+UPSERT_COUNT_OF_AI_QUERIES: Query = Query(
+    "upsert_count_of_ai_queries",
+    """INSERT INTO users (
+    telegram_id, telegram_username, firstname, lastname, count_of_ai_queries
+    ) VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    count_of_ai_queries = count_of_ai_queries + VALUES(count_of_ai_queries),
+    telegram_username = VALUES(telegram_username),
+    firstname = VALUES(firstname),
+    lastname = VALUES(lastname);"""
+)
+SELECT_USER: Query = Query(
+    "select_user",
+    """SELECT telegram_id, telegram_username, firstname, lastname, count_of_ai_queries
+    FROM users WHERE telegram_id = %s;""",
+    fetch="one"
+)
+SELECT_CONTEXT: Query = Query(
+    "select_context",
+    "SELECT context FROM users WHERE telegram_id = %s;",
+    fetch="one"
+)
+UPDATE_CONTEXT: Query = Query(
+    "update_context",
+    "UPDATE users SET context = %s, context_updated_at = %s WHERE telegram_id = %s;"
+)
+SELECT_IDLE_CONTEXTS: Query = Query(
+    "select_idle_contexts",
+    """SELECT telegram_id, context FROM users
+    WHERE context_updated_at < %s AND context IS NOT NULL
+    ORDER BY context_updated_at LIMIT %s;""",
+    fetch="all"
+)
+CLEAR_IDLE_CONTEXT: Query = Query(
+    "clear_idle_context",
+    """UPDATE users SET context = NULL
+    WHERE telegram_id = %s AND context_updated_at < %s AND context IS NOT NULL;"""
+)
+UPSERT_ARCHIVED_CONTEXT: Query = Query(
+    "upsert_archived_context",
+    """INSERT INTO context_archive (telegram_id, context, archived_at) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE context = VALUES(context), archived_at = VALUES(archived_at);"""
+)
+SELECT_ARCHIVED_CONTEXT: Query = Query(
+    "select_archived_context",
+    "SELECT context FROM context_archive WHERE telegram_id = %s FOR UPDATE;",
+    fetch="one"
+)
+RESTORE_CONTEXT: Query = Query(
+    "restore_context",
+    """UPDATE users SET context = %s, context_updated_at = %s
+    WHERE telegram_id = %s AND context IS NULL;"""
+)
+DELETE_ARCHIVED_CONTEXT: Query = Query(
+    "delete_archived_context",
+    "DELETE FROM context_archive WHERE telegram_id = %s;"
+)
+SELECT_QUOTA_USAGE: Query = Query(
+    "select_quota_usage",
+    "SELECT telegram_id, kind, used FROM quota_usage WHERE day = %s;",
+    fetch="all"
+)
+UPSERT_QUOTA_USAGE: Query = Query(
+    "upsert_quota_usage",
+    """INSERT INTO quota_usage (day, telegram_id, kind, used) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE used = VALUES(used);"""
+)
+INSERT_USAGE_EVENTS: Query = Query(
+    "insert_usage_events",
+    "INSERT INTO usage_events (telegram_id, kind, created_at) VALUES (%s, %s, %s);"
+)
+UPSERT_USAGE_HOURLY: Query = Query(
+    "upsert_usage_hourly",
+    """INSERT INTO usage_rollup_hourly (bucket, kind, requests) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE requests = requests + VALUES(requests);"""
+)
+INSERT_ACTIVE_USERS: Query = Query(
+    "insert_active_users",
+    "INSERT IGNORE INTO usage_active_users (day, kind, telegram_id) VALUES (%s, %s, %s);"
+)
+UPSERT_USAGE_DAILY: Query = Query(
+    "upsert_usage_daily",
+    """INSERT INTO usage_rollup_daily (day, kind, requests, users) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    requests = requests + VALUES(requests),
+    users = users + VALUES(users);"""
+)
+SELECT_USAGE_HOURLY: Query = Query(
+    "select_usage_hourly",
+    """SELECT bucket, kind, requests FROM usage_rollup_hourly
+    WHERE bucket >= %s ORDER BY bucket, kind;""",
+    fetch="all"
+)
+SELECT_USAGE_DAILY: Query = Query(
+    "select_usage_daily",
+    """SELECT day, kind, requests, users FROM usage_rollup_daily
+    WHERE day >= %s ORDER BY day, kind;""",
+    fetch="all"
+)
+INSERT_MEMORY_TURN: Query = Query(
+    "insert_memory_turn",
+    """INSERT INTO memory_turns (telegram_id, seq, text, embedding) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE text = VALUES(text), embedding = VALUES(embedding);"""
+)
+DELETE_OLD_MEMORY_TURNS: Query = Query(
+    "delete_old_memory_turns",
+    "DELETE FROM memory_turns WHERE telegram_id = %s AND seq <= %s;"
+)
+SELECT_MEMORY_TURNS: Query = Query(
+    "select_memory_turns",
+    """SELECT seq, text, embedding FROM memory_turns WHERE telegram_id = %s
+    ORDER BY seq DESC LIMIT %s;""",
+    fetch="all"
+)
+INSERT_PROCESSED_UPDATE: Query = Query(
+    "insert_processed_update",
+    "INSERT IGNORE INTO processed_updates (update_key, seen_at) VALUES (%s, %s);"
+)
+DELETE_PROCESSED_UPDATE: Query = Query(
+    "delete_processed_update",
+    "DELETE FROM processed_updates WHERE update_key = %s;"
+)
+DELETE_PROCESSED_UPDATES: Query = Query(
+    "delete_processed_updates",
+    "DELETE FROM processed_updates WHERE seen_at < %s;"
+)
+
+
+class QueryStats:
+    """Timings of the executed statements."""
+
+    def __init__(self, slow_threshold: float = 0.2) -> None:
+        self.slow_threshold: float = slow_threshold
+        self.__stats: dict[str, list] = dict()
+        # Recorded from the worker threads of QueryExecutor
+        self.__lock: threading.Lock = threading.Lock()
+
+    def record(self, name: str, duration: float) -> None:
+        """
+        Record a duration of the statement.
+
+        :param name: Name of the statement.
+        :param duration: Duration in seconds.
+
+        :return: None.
+        """
+        with self.__lock:
+            stat: list | None = self.__stats.get(name)
+            if stat is None:
+                self.__stats[name] = [1, duration, duration]
+            else:
+                stat[0] += 1
+                stat[1] += duration
+                stat[2] = max(stat[2], duration)
+
+        if duration >= self.slow_threshold:
+            logging.warning("Slow query %s: %.3f s", name, duration)
+
+    def snapshot(self) -> dict[str, dict]:
+        """
+        Get the stats.
+
+        :return: Dict: name -> count, total, avg and max duration.
+        """
+        with self.__lock:
+            return {
+                name: {
+                    "count": count,
+                    "total": total,
+                    "avg": total / count,
+                    "max": maximum
+                }
+                for name, (count, total, maximum) in self.__stats.items()
+            }
+
+
+class QueryExecutor:
+    """
+    Executor of the queries. The blocking driver calls are run in worker threads,
+    so the event loop is never blocked by the database.
+    """
+
+    def __init__(self, pool: ConnectionPool, stats: QueryStats | None = None) -> None:
+        self.pool: ConnectionPool = pool
+        self.stats: QueryStats = QueryStats() if stats is None else stats
+
+    def __run(self, pooled: PooledConnection, query: Query, params: tuple | None):
+        """
+        Run one statement on the connection.
+
+        :param pooled: Pooled connection.
+        :param query: Query.
+        :param params: Parameters.
+
+        :return: Row, rows or count of affected rows.
+        """
+        statement = pooled.prepare(query.name, query.sql)
+
+        start: float = time.perf_counter()
+        affected: int = statement.execute(params)
+        if query.fetch == "one":
+            result = statement.cursor.fetchone()
+        elif query.fetch == "all":
+            result = statement.cursor.fetchall()
+        else:
+            result = affected
+        self.stats.record(query.name, time.perf_counter() - start)
+
+        return result
+
+    def __transaction(self, work) -> object:
+        """
+        Run the work on one pooled connection in one transaction.
+
+        :param work: Callable(pooled_connection).
+        :return: Result of the work.
+        """
+        pooled: PooledConnection = self.pool.acquire()
+        try:
+            result = work(pooled)
+            pooled.connection.commit()
+        except Exception:
+            try:
+                pooled.connection.rollback()
+            except Exception:
+                self.pool.release(pooled, broken=True)
+                raise
+            self.pool.release(pooled)
+            raise
+
+        self.pool.release(pooled)
+
+        return result
+
+    async def execute(self, query: Query, params: tuple | None = None):
+        """
+        Execute the statement.
+
+        :param query: Query.
+        :param params: Parameters.
+
+        :return: Row (fetch="one"), rows (fetch="all") or count of affected rows.
+        """
+        return await asyncio.to_thread(
+            self.__transaction,
+            lambda pooled: self.__run(pooled, query, params)
+        )
+
+    async def execute_batch(self, batch: list[tuple[Query, tuple | None]]) -> list:
+        """
+        Execute several statements on one connection in one transaction.
+
+        :param batch: List of (query, parameters).
+        :return: List of results (in order of the batch).
+        """
+        return await asyncio.to_thread(
+            self.__transaction,
+            lambda pooled: [self.__run(pooled, query, params) for query, params in batch]
+        )
+
+    async def transaction(self, work: Callable[[Callable], object]) -> object:
+        """
+        Run dependent statements on one connection in one transaction.
+
+        :param work: Callable(run), where run(query, params) executes one statement
+            (a list of parameters executes the statement for each of them).
+        :return: Result of the work.
+        """
+        def run_all(pooled: PooledConnection) -> object:
+            def run(query: Query, params: tuple | list | None = None):
+                if isinstance(params, list):
+                    statement = pooled.prepare(query.name, query.sql)
+                    start: float = time.perf_counter()
+                    affected: int = statement.execute_many(params) if params else 0
+                    self.stats.record(query.name, time.perf_counter() - start)
+                    return affected
+
+                return self.__run(pooled, query, params)
+
+            return work(run)
+
+        return await asyncio.to_thread(self.__transaction, run_all)
+
+    async def execute_many(self, query: Query, params: list[tuple]) -> int:
+        """
+        Execute one statement for many parameters (one round trip for INSERT).
+
+        :param query: Query.
+        :param params: List of parameters.
+
+        :return: Count of affected rows.
+        """
+        def work(pooled: PooledConnection) -> int:
+            statement = pooled.prepare(query.name, query.sql)
+            start: float = time.perf_counter()
+            affected: int = statement.execute_many(params)
+            self.stats.record(query.name, time.perf_counter() - start)
+            return affected
+
+        return await asyncio.to_thread(self.__transaction, work)
+
+
+class Database:
+    """Holder of the process-wide query executor."""
+    __executor: QueryExecutor | None = None
+
+    @classmethod
+    def get_executor(cls, mysql_data: dict) -> QueryExecutor:
+        """
+        Get the query executor (create the pool on the first call).
+
+        :param mysql_data: MySQL Data.
+        :return: Query executor.
+        """
+        if cls.__executor is None:
+            cls.__executor = QueryExecutor(ConnectionPool(mysql_data))
+
+        return cls.__executor
+
+    @classmethod
+    def is_created(cls) -> bool:
+        """
+        Check if the executor has been created.
+
+        :return: True if the pool exists.
+        """
+        return cls.__executor is not None
+
+    @classmethod
+    def close(cls) -> None:
+        """
+        Close the pool.
+
+        :return: None.
+        """
+        if cls.__executor is not None:
+            cls.__executor.pool.close()
+            cls.__executor = None
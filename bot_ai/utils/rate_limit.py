@@ -0,0 +1,294 @@
+"""
+Module of the per-user rate limits (token buckets) and daily quotas of the text and
+image requests. The counters live in memory and are persisted periodically.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from bot_ai.storage.factory import StorageFactory
+
+KINDS: tuple[str, ...] = ("text", "image")
+
+
+class TokenBucket:
+    """Token bucket: `rate` tokens per second, at most `burst` tokens."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate: float = rate
+        self.burst: float = burst
+        self.tokens: float = burst
+        self.updated: float = time.monotonic()
+
+    def __refill(self, now: float) -> None:
+        """
+        Add the tokens accumulated since the last update.
+
+        :param now: Monotonic time.
+        :return: None.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float | None = None) -> float:
+        """
+        Take one token.
+
+        :param now: Monotonic time.
+        :return: 0.0 if the token has been taken, otherwise seconds to wait.
+        """
+        now = time.monotonic() if now is None else now
+        self.__refill(now)
+
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+
+        return (1.0 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        """
+        Check if the bucket is full (i.e. it can be forgotten).
+
+        :param now: Monotonic time.
+        :return: True if the bucket is full.
+        """
+        self.__refill(now)
+
+        return self.tokens >= self.burst
+
+
+class LimitDecision:
+    """Result of the limit check."""
+
+    def __init__(self, allowed: bool, reason: str | None = None, retry_after: float = 0.0):
+        self.allowed: bool = allowed
+        self.reason: str | None = reason
+        self.retry_after: float = retry_after
+
+    def message(self) -> str:
+        """
+        Friendly rejection message for the user.
+
+        :return: Text.
+        """
+        if self.reason == "quota":
+            return ("🙌 You have used up today's limit of requests of this kind. "
+                    "The limit is reset at 00:00 UTC, see you tomorrow!")
+
+        return (f"⏳ Too many requests, please, slow down a little. "
+                f"Try again in {max(1, round(self.retry_after))} s.")
+
+
+class RateLimiter:
+    """Per-user token buckets and daily quotas for "text" and "image" requests."""
+    __instance: "RateLimiter | None" = None
+
+    def __init__(self, settings: dict) -> None:
+        self.enabled: bool = settings.get("ENABLED", True)
+        self.__persist_interval: float = settings.get("PERSIST_INTERVAL", 60.0)
+        self.__limits: dict[str, dict] = {
+            kind: settings.get(kind.upper(), {}) for kind in KINDS
+        }
+
+        self.__buckets: dict[tuple[str, int], TokenBucket] = dict()
+        self.__day: str = self.today()
+        self.__used: dict[tuple[str, int], int] = dict()
+        self.__dirty: set[tuple[str, int]] = set()
+        self.__task: asyncio.Task | None = None
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "RateLimiter":
+        """
+        Get the limiter (create it from the "LIMITS" section of bot.json on the first call).
+
+        :param file_path: bot.json path.
+        :return: Rate limiter.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("LIMITS", {"ENABLED": False}))
+
+        return cls.__instance
+
+    def tracked(self) -> dict[str, int]:
+        """
+        Count of the tracked buckets and daily counters (memory accounting).
+
+        :return: Dict: name -> count.
+        """
+        return {"buckets": len(self.__buckets), "quota_counters": len(self.__used)}
+
+    @staticmethod
+    def today() -> str:
+        """
+        Get the current quota day (UTC).
+
+        :return: Date in the format YYYY-MM-DD.
+        """
+        return time.strftime("%Y-%m-%d", time.gmtime())
+
+    def __roll_day(self) -> None:
+        """
+        Reset the daily counters at the day boundary.
+
+        :return: None.
+        """
+        today: str = self.today()
+        if today != self.__day:
+            self.__day = today
+            self.__used.clear()
+            self.__dirty.clear()
+
+    def acquire(self, kind: str, telegram_id: int) -> LimitDecision:
+        """
+        Check the limits and count the request if it is allowed.
+
+        :param kind: "text" or "image".
+        :param telegram_id: Telegram User ID.
+
+        :return: Decision.
+        """
+        if not self.enabled:
+            return LimitDecision(True)
+
+        self.__roll_day()
+        limits: dict = self.__limits[kind]
+        key: tuple[str, int] = (kind, int(telegram_id))
+
+        daily: int | None = limits.get("DAILY")
+        if daily is not None and self.__used.get(key, 0) >= daily:
+            return LimitDecision(False, "quota")
+
+        if limits.get("RATE") is not None:
+            bucket: TokenBucket | None = self.__buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(limits["RATE"], limits.get("BURST", 1))
+                self.__buckets[key] = bucket
+
+            wait: float = bucket.take()
+            if wait > 0:
+                return LimitDecision(False, "rate", wait)
+
+        self.__used[key] = self.__used.get(key, 0) + 1
+        self.__dirty.add(key)
+
+        return LimitDecision(True)
+
+    def refund(self, kind: str, telegram_id: int) -> None:
+        """
+        Give back the quota of a request which has not been served (e.g. an API error).
+
+        :param kind: "text" or "image".
+        :param telegram_id: Telegram User ID.
+
+        :return: None.
+        """
+        key: tuple[str, int] = (kind, int(telegram_id))
+        if self.enabled and self.__used.get(key, 0) > 0:
+            self.__used[key] -= 1
+            self.__dirty.add(key)
+
+    def remaining(self, kind: str, telegram_id: int) -> int | None:
+        """
+        Get the remaining daily quota.
+
+        :param kind: "text" or "image".
+        :param telegram_id: Telegram User ID.
+
+        :return: Count of requests left today or None (unlimited).
+        """
+        daily: int | None = self.__limits[kind].get("DAILY")
+        if not self.enabled or daily is None:
+            return None
+
+        self.__roll_day()
+
+        return max(0, daily - self.__used.get((kind, int(telegram_id)), 0))
+
+    async def load(self) -> None:
+        """
+        Load today's usage from the storage (added to the requests counted meanwhile).
+
+        :return: None.
+        """
+        if not self.enabled:
+            return
+
+        day: str = self.__day
+        usage: dict[tuple[str, int], int] = await StorageFactory.get().get_quota_usage(day)
+        if day != self.__day:
+            return
+
+        for key, used in usage.items():
+            self.__used[key] = self.__used.get(key, 0) + used
+
+        logging.info("Loaded quota usage of %s users", len(usage))
+
+    async def flush(self) -> None:
+        """
+        Persist the changed counters (one batch).
+
+        :return: None.
+        """
+        if not self.__dirty:
+            return
+
+        day: str = self.__day
+        rows: list[tuple[int, str, int]] = [
+            (telegram_id, kind, self.__used.get((kind, telegram_id), 0))
+            for kind, telegram_id in self.__dirty
+        ]
+        self.__dirty = set()
+
+        try:
+            await StorageFactory.get().save_quota_usage(day, rows)
+        except Exception as ex:
+            logging.warning("Quota usage has not been persisted: %r", ex)
+            if day == self.__day:
+                self.__dirty.update((kind, telegram_id) for telegram_id, kind, _ in rows)
+
+    def __forget_idle_buckets(self) -> None:
+        """
+        Drop full buckets: a new bucket is full anyway.
+
+        :return: None.
+        """
+        now: float = time.monotonic()
+        for key in [key for key, bucket in self.__buckets.items() if bucket.is_full(now)]:
+            del self.__buckets[key]
+
+    async def __run(self) -> None:
+        """
+        Periodic persistence of the counters.
+
+        :return: None.
+        """
+        while True:
+            await asyncio.sleep(self.__persist_interval)
+            self.__roll_day()
+            self.__forget_idle_buckets()
+            await self.flush()
+
+    def start(self) -> None:
+        """
+        Start the periodic persistence.
+
+        :return: None.
+        """
+        if self.enabled and self.__task is None:
+            self.__task = asyncio.create_task(self.__run(), name="rate-limit-persistence")
+
+    async def stop(self) -> None:
+        """
+        Stop the periodic persistence and persist the rest.
+
+        :return: None.
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+        await self.flush()
@@ -0,0 +1,256 @@
+"""
+Module of the work scheduler of the GigaChat requests: the text and image lanes share
+a fixed number of slots by weighted fair queuing, and under overload the queued work
+is shed (the lowest priority first) with an estimated wait for the user.
+"""
+import asyncio
+import collections
+import contextlib
+import json
+import time
+from typing import AsyncIterator, Awaitable, Callable
+
+from bot_ai.utils.metrics import metrics
+
+metrics.describe("scheduler_shed_total", "Requests rejected or dropped by the scheduler")
+metrics.describe("scheduler_wait_seconds", "Time spent in the scheduler queue")
+
+
+class OverloadedError(Exception):
+    """The request has been shed by the scheduler."""
+
+    def __init__(self, lane: str, retry_after: float) -> None:
+        super().__init__(f"The {lane} lane is overloaded")
+        self.lane: str = lane
+        self.retry_after: float = retry_after
+
+    def message(self) -> str:
+        """
+        Friendly message for the user.
+
+        :return: Text.
+        """
+        return (f"🚦 Too many requests right now, please, try again in about "
+                f"{max(5, round(self.retry_after))} s.")
+
+
+class Ticket:
+    """Queued request."""
+
+    def __init__(self, tag: float) -> None:
+        self.tag: float = tag
+        self.enqueued_at: float = time.monotonic()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class Lane:
+    """Queue of one kind of work."""
+
+    def __init__(self, name: str, settings: dict) -> None:
+        self.name: str = name
+        self.weight: float = settings.get("WEIGHT", 1.0)
+        self.priority: int = settings.get("PRIORITY", 0)
+        self.max_age: float = settings.get("MAX_QUEUE_AGE", 30.0)
+        self.service: float = settings.get("EXPECTED_SECONDS", 5.0)
+        self.queue: collections.deque[Ticket] = collections.deque()
+        self.finish: float = 0.0
+
+
+class WorkScheduler:
+    """Scheduler of the GigaChat work (section "SCHEDULER" of bot.json)."""
+    __instance: "WorkScheduler | None" = None
+
+    def __init__(self, settings: dict) -> None:
+        self.enabled: bool = settings.get("ENABLED", False)
+        self.concurrency: int = settings.get("CONCURRENCY", 8)
+        self.max_queue: int = settings.get("MAX_QUEUE", 200)
+        self.notify_after: float = settings.get("NOTIFY_AFTER", 5.0)
+        self.alpha: float = settings.get("ALPHA", 0.2)
+        self.lanes: dict[str, Lane] = {
+            name: Lane(name, lane)
+            for name, lane in settings.get("LANES", {"text": {}, "image": {}}).items()
+        }
+
+        self.__busy: int = 0
+        self.__virtual_time: float = 0.0
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "WorkScheduler":
+        """
+        Get the scheduler (created from the "SCHEDULER" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Work scheduler.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("SCHEDULER", {}))
+
+        return cls.__instance
+
+    def queued(self) -> int:
+        """
+        Count of the queued requests.
+
+        :return: Count.
+        """
+        return sum(len(lane.queue) for lane in self.lanes.values())
+
+    def estimate(self, lane: Lane, position: int | None = None) -> float:
+        """
+        Estimate the wait in the lane: the work ahead served with the lane's weighted
+        share of the slots.
+
+        :param lane: Lane.
+        :param position: Position in the queue (the end of the queue by default).
+
+        :return: Seconds.
+        """
+        if self.__busy < self.concurrency and not lane.queue:
+            return 0.0
+
+        position = len(lane.queue) if position is None else position
+        weights: float = sum(
+            other.weight for other in self.lanes.values() if other.queue or other is lane
+        )
+        share: float = self.concurrency * lane.weight / weights
+
+        return (position + 1) * lane.service / share
+
+    def __shed_for(self, lane: Lane) -> bool:
+        """
+        Make room in the full queue: drop the newest request of a lane with a lower
+        priority than the given one.
+
+        :param lane: Lane of the new request.
+        :return: True if a request has been dropped.
+        """
+        victims: list[Lane] = sorted(
+            (other for other in self.lanes.values()
+             if other.queue and other.priority > lane.priority),
+            key=lambda other: -other.priority
+        )
+        if not victims:
+            return False
+
+        victim: Lane = victims[0]
+        ticket: Ticket = victim.queue.pop()
+        ticket.future.set_exception(OverloadedError(victim.name, self.estimate(victim)))
+        metrics.inc("scheduler_shed_total", lane=victim.name, reason="priority")
+
+        return True
+
+    def __dispatch(self) -> None:
+        """
+        Grant the free slots to the queued requests with the smallest finish tags.
+
+        :return: None.
+        """
+        while self.__busy < self.concurrency:
+            heads: list[Lane] = [lane for lane in self.lanes.values() if lane.queue]
+            if not heads:
+                break
+
+            lane: Lane = min(heads, key=lambda other: other.queue[0].tag)
+            ticket: Ticket = lane.queue.popleft()
+            self.__virtual_time = ticket.tag
+            self.__busy += 1
+            ticket.future.set_result(None)
+
+        for lane in self.lanes.values():
+            metrics.set("scheduler_queue_depth", len(lane.queue), lane=lane.name)
+
+    def __release(self, lane: Lane, started: float) -> None:
+        """
+        Free the slot and update the service time of the lane.
+
+        :param lane: Lane.
+        :param started: Monotonic time of the start of the work.
+
+        :return: None.
+        """
+        duration: float = time.monotonic() - started
+        lane.service = self.alpha * duration + (1 - self.alpha) * lane.service
+        self.__busy -= 1
+        self.__dispatch()
+
+    async def __wait(
+            self,
+            lane: Lane,
+            on_queued: Callable[[float], Awaitable] | None
+    ) -> None:
+        """
+        Queue the request and wait for a slot.
+
+        :param lane: Lane.
+        :param on_queued: Callback with the estimated wait (called if it is long).
+
+        :return: None.
+        """
+        wait: float = self.estimate(lane)
+        if wait > lane.max_age or (
+                self.queued() >= self.max_queue and not self.__shed_for(lane)
+        ):
+            metrics.inc("scheduler_shed_total", lane=lane.name, reason="admission")
+            raise OverloadedError(lane.name, wait)
+
+        tag: float = max(self.__virtual_time, lane.finish) + lane.service / lane.weight
+        lane.finish = tag
+        ticket: Ticket = Ticket(tag)
+        lane.queue.append(ticket)
+        self.__dispatch()
+
+        try:
+            if not ticket.future.done() and on_queued is not None and wait >= self.notify_after:
+                await on_queued(wait)
+            await asyncio.wait_for(asyncio.shield(ticket.future), timeout=lane.max_age)
+        except asyncio.TimeoutError:
+            if ticket in lane.queue:
+                lane.queue.remove(ticket)
+                metrics.inc("scheduler_shed_total", lane=lane.name, reason="age")
+                raise OverloadedError(lane.name, self.estimate(lane)) from None
+            await ticket.future
+        except BaseException:
+            if ticket in lane.queue:
+                lane.queue.remove(ticket)
+            elif ticket.future.done() and not ticket.future.cancelled() \
+                    and ticket.future.exception() is None:
+                self.__busy -= 1
+                self.__dispatch()
+            raise
+        finally:
+            metrics.observe(
+                "scheduler_wait_seconds", time.monotonic() - ticket.enqueued_at, lane=lane.name
+            )
+
+    @contextlib.asynccontextmanager
+    async def slot(
+            self,
+            kind: str,
+            on_queued: Callable[[float], Awaitable] | None = None
+    ) -> AsyncIterator[None]:
+        """
+        Run the work in a slot of the lane.
+
+        :param kind: Name of the lane ("text" or "image").
+        :param on_queued: Async callback with the estimated wait in seconds (called right
+            after the request is queued if the estimated wait is at least NOTIFY_AFTER
+            seconds).
+
+        :return: Context manager (raises OverloadedError if the request is shed).
+        """
+        lane: Lane | None = self.lanes.get(kind)
+        if not self.enabled or lane is None:
+            yield
+            return
+
+        if self.__busy < self.concurrency and not self.queued():
+            self.__busy += 1
+        else:
+            await self.__wait(lane, on_queued)
+
+        started: float = time.monotonic()
+        try:
+            yield
+        finally:
+            self.__release(lane, started)
@@ -0,0 +1,46 @@
+"""
+Module of the JSON serializer of the API payloads, the stored context and the
+configuration: orjson if it is installed (UTF-8 bytes with no intermediate str), the
+standard library otherwise. Both backends produce compact UTF-8 JSON.
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Serializer:
+    """Fast JSON serializer with the standard library fallback."""
+    backend: str = "orjson" if orjson is not None else "json"
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:
+        """
+        Serialize the object to UTF-8 JSON (ready to be sent as the request body).
+
+        :param obj: Object.
+        :return: JSON bytes.
+        """
+        if orjson is not None:
+            return orjson.dumps(obj)
+
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def loads(data: bytes | bytearray | memoryview | str) -> Any:
+        """
+        Deserialize the JSON.
+
+        :param data: JSON bytes or text.
+        :return: Object.
+        """
+        if orjson is not None:
+            return orjson.loads(data)
+
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+
+        return json.loads(data)
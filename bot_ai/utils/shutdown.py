@@ -0,0 +1,159 @@
+"""
+Module of the graceful shutdown: stop intake, drain in-flight AI jobs up to a deadline,
+flush pending writes, close pools and sessions.
+"""
+import asyncio
+import contextlib
+import logging
+import signal
+import time
+from typing import AsyncIterator, Awaitable, Callable
+
+from aiogram import Dispatcher
+
+
+class ShutdownCoordinator:
+    """Tracker of the in-flight jobs and runner of the shutdown hooks."""
+
+    def __init__(self) -> None:
+        self.accepting: bool = True
+        self.__jobs: dict[asyncio.Task, tuple[str, int | None, float]] = dict()
+        self.__flush_hooks: list[tuple[str, Callable[[], Awaitable]]] = list()
+        self.__close_hooks: list[tuple[str, Callable[[], Awaitable]]] = list()
+
+    @contextlib.asynccontextmanager
+    async def job(self, kind: str, user_id: int | None = None) -> AsyncIterator[None]:
+        """
+        Mark the current task as an in-flight job (e.g. "chat", "image").
+
+        :param kind: Kind of the job.
+        :param user_id: Telegram ID of the user.
+
+        :return: Context manager.
+        """
+        task: asyncio.Task | None = asyncio.current_task()
+        if task is not None:
+            self.__jobs[task] = (kind, user_id, time.monotonic())
+        try:
+            yield
+        finally:
+            if task is not None:
+                self.__jobs.pop(task, None)
+
+    def in_flight(self) -> dict[str, int]:
+        """
+        Get the count of the in-flight jobs by kind.
+
+        :return: Dict: kind -> count.
+        """
+        result: dict[str, int] = dict()
+        for kind, _, _ in self.__jobs.values():
+            result[kind] = result.get(kind, 0) + 1
+
+        return result
+
+    def register_flush(self, name: str, hook: Callable[[], Awaitable]) -> None:
+        """
+        Register a hook which flushes pending writes (runs after the drain).
+
+        :param name: Name of the hook.
+        :param hook: Coroutine function.
+
+        :return: None.
+        """
+        self.__flush_hooks.append((name, hook))
+
+    def register_close(self, name: str, hook: Callable[[], Awaitable]) -> None:
+        """
+        Register a hook which closes a pool / session (runs after the flush hooks).
+
+        :param name: Name of the hook.
+        :param hook: Coroutine function.
+
+        :return: None.
+        """
+        self.__close_hooks.append((name, hook))
+
+    def install_signal_handlers(self, dispatcher: Dispatcher) -> None:
+        """
+        Stop the intake of updates on SIGTERM / SIGINT.
+
+        :param dispatcher: Dispatcher of the bot.
+        :return: None.
+        """
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+
+        def stop(signum: int) -> None:
+            if not self.accepting:
+                return
+            logging.warning(
+                "Signal %s: stopping the intake of updates", signal.Signals(signum).name
+            )
+            self.accepting = False
+            loop.create_task(dispatcher.stop_polling())
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, stop, signum)
+            except NotImplementedError:
+                signal.signal(signum, lambda number, _: loop.call_soon_threadsafe(stop, number))
+
+    async def __run_hooks(
+            self,
+            stage: str,
+            hooks: list[tuple[str, Callable[[], Awaitable]]],
+            timeout: float
+    ) -> None:
+        """
+        Run the hooks one by one, each one limited by the timeout.
+
+        :param stage: Name of the stage (for the logs).
+        :param hooks: List of (name, coroutine function).
+        :param timeout: Timeout of a hook in seconds.
+
+        :return: None.
+        """
+        for name, hook in hooks:
+            try:
+                await asyncio.wait_for(hook(), timeout=max(timeout, 0.1))
+            except Exception as ex:
+                logging.error("Shutdown %s hook %s has failed: %r", stage, name, ex)
+
+    async def shutdown(self, deadline: float = 25.0) -> None:
+        """
+        Wait for the in-flight jobs up to the deadline, cancel (and log) the rest,
+        then flush the pending writes and close the resources.
+
+        :param deadline: Total time budget in seconds.
+        :return: None.
+        """
+        self.accepting = False
+        started_at: float = time.monotonic()
+
+        jobs: dict[asyncio.Task, tuple[str, int | None, float]] = dict(self.__jobs)
+        if jobs:
+            logging.info("Waiting for the in-flight jobs: %s", self.in_flight())
+            _, pending = await asyncio.wait(set(jobs), timeout=deadline * 0.8)
+
+            for task in pending:
+                kind, user_id, job_started_at = jobs[task]
+                logging.warning(
+                    "Abandoned %s job of the user %s (running for %.1f s)",
+                    kind, user_id, time.monotonic() - job_started_at
+                )
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending, timeout=1.0)
+
+        remaining: float = deadline - (time.monotonic() - started_at)
+        await self.__run_hooks("flush", self.__flush_hooks, remaining / 2)
+
+        remaining = deadline - (time.monotonic() - started_at)
+        await self.__run_hooks("close", self.__close_hooks, remaining)
+
+        logging.info(
+            "Shutdown has been completed in %.3f s", time.monotonic() - started_at
+        )
+
+
+shutdown_coordinator: ShutdownCoordinator = ShutdownCoordinator()
@@ -0,0 +1,116 @@
+"""
+Module of the startup sequence: independent initialization phases run concurrently,
+each one is timed, and the bot starts as soon as the critical phases are done.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable
+
+
+class StartupError(RuntimeError):
+    """A critical startup phase has failed."""
+
+
+class Startup:
+    """Concurrent startup phases with a per-phase timing breakdown."""
+
+    def __init__(self) -> None:
+        self.timings: dict[str, float] = dict()
+        self.__background: set[asyncio.Task] = set()
+        self.__started_at: float = time.perf_counter()
+
+    async def __phase(
+            self,
+            name: str,
+            phase: Awaitable,
+            dependency: asyncio.Task | None = None
+    ) -> None:
+        """
+        Run and time the phase (after its dependency, if any).
+
+        :param name: Name of the phase.
+        :param phase: Awaitable of the phase.
+        :param dependency: Task of the phase which must be completed first.
+
+        :return: None.
+        """
+        if dependency is not None:
+            try:
+                await asyncio.shield(dependency)
+            except BaseException:
+                if asyncio.iscoroutine(phase):
+                    phase.close()
+                raise
+
+        start: float = time.perf_counter()
+        try:
+            await phase
+        finally:
+            self.timings[name] = time.perf_counter() - start
+            logging.info(
+                "Startup phase %s has taken %.3f s", name, self.timings[name]
+            )
+
+    async def run(
+            self,
+            phases: dict[str, Awaitable],
+            critical: set[str],
+            depends_on: dict[str, str] | None = None
+    ) -> None:
+        """
+        Start all phases concurrently and wait only for the critical ones. The rest
+        complete in the background (their errors are logged).
+
+        :param phases: Dict: name of the phase -> awaitable.
+        :param critical: Names of the phases the bot can not work without.
+        :param depends_on: Dict: name of the phase -> name of a phase (listed earlier)
+            which must be completed first.
+
+        :return: None.
+        """
+        depends_on = dict() if depends_on is None else depends_on
+        tasks: dict[str, asyncio.Task] = dict()
+        for name, phase in phases.items():
+            tasks[name] = asyncio.create_task(
+                self.__phase(name, phase, tasks.get(depends_on.get(name))),
+                name=f"startup-{name}"
+            )
+
+        for name, task in tasks.items():
+            if name not in critical:
+                self.__background.add(task)
+                task.add_done_callback(self.__background_done)
+
+        critical_tasks: list[asyncio.Task] = [
+            task for name, task in tasks.items() if name in critical
+        ]
+        results: list = await asyncio.gather(*critical_tasks, return_exceptions=True)
+
+        for name, result in zip([name for name in tasks if name in critical], results):
+            if isinstance(result, BaseException):
+                for task in tasks.values():
+                    task.cancel()
+                raise StartupError(f"Startup phase {name} has failed: {result}") from result
+
+        logging.info(
+            "Critical startup phases are ready in %.3f s: %s",
+            time.perf_counter() - self.__started_at,
+            ", ".join(f"{name}={self.timings[name]:.3f}s" for name in sorted(critical))
+        )
+
+    def __background_done(self, task: asyncio.Task) -> None:
+        """
+        Log the result of a background phase.
+
+        :param task: Task of the phase.
+        :return: None.
+        """
+        self.__background.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logging.warning(
+                "Background startup phase %s has failed: %s",
+                task.get_name(), task.exception()
+            )
@@ -0,0 +1,288 @@
+"""
+Module of the lightweight per-update tracing: one root span per update, child spans
+around DB, GigaChat and Telegram API calls, exported to a local file in the Chrome
+trace format (open it in chrome://tracing or https://ui.perfetto.dev).
+"""
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Iterator
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """Timed operation of a trace."""
+    __ids: Iterator[int] = itertools.count(1)
+
+    def __init__(self, name: str, trace_id: int, parent: "Span | None", attrs: dict) -> None:
+        self.name: str = name
+        self.trace_id: int = trace_id
+        self.span_id: int = next(self.__ids)
+        self.parent_id: int | None = None if parent is None else parent.span_id
+        self.attrs: dict = attrs
+        self.start: float = time.time()
+        self.__started: float = time.perf_counter()
+        self.duration: float = 0.0
+        self.error: str | None = None
+
+    def end(self) -> None:
+        """
+        Finish the span.
+
+        :return: None.
+        """
+        self.duration = time.perf_counter() - self.__started
+
+    def to_chrome(self, pid: int) -> dict:
+        """
+        Convert the span to a "complete" event of the Chrome trace format.
+
+        :param pid: Process ID.
+        :return: Dict-event.
+        """
+        args: dict = dict(self.attrs, span_id=self.span_id, parent_id=self.parent_id)
+        if self.error is not None:
+            args["error"] = self.error
+
+        return {
+            "name": self.name,
+            "cat": self.name.split(".", 1)[0],
+            "ph": "X",
+            "ts": int(self.start * 1e6),
+            "dur": int(self.duration * 1e6),
+            "pid": pid,
+            "tid": self.trace_id,
+            "args": args
+        }
+
+
+class SpanExporter:
+    """Background thread which appends the finished spans to the trace file."""
+
+    def __init__(self, path: str, max_queue: int = 10000) -> None:
+        self.__path: str = path
+        self.__queue: queue.Queue = queue.Queue(max_queue)
+        self.__pid: int = os.getpid()
+        self.dropped: int = 0
+        self.__thread: threading.Thread = threading.Thread(
+            target=self.__run, name="span-exporter", daemon=True
+        )
+        self.__thread.start()
+
+    def export(self, span: Span) -> None:
+        """
+        Enqueue the span without blocking.
+
+        :param span: Finished span.
+        :return: None.
+        """
+        try:
+            self.__queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def __run(self) -> None:
+        """
+        Write the spans: the file is a JSON array (the Chrome trace viewer accepts
+        an unterminated array, so the file stays valid while it grows).
+
+        :return: None.
+        """
+        new_file: bool = not os.path.exists(self.__path) or os.path.getsize(self.__path) == 0
+        with open(self.__path, "a", encoding="utf-8") as file:
+            if new_file:
+                file.write("[\n")
+
+            while True:
+                span: Span | None = self.__queue.get()
+                if span is None:
+                    break
+
+                file.write(json.dumps(span.to_chrome(self.__pid), ensure_ascii=False, default=str))
+                file.write(",\n")
+                if self.__queue.empty():
+                    file.flush()
+
+    def close(self) -> None:
+        """
+        Write the queued spans and stop the thread.
+
+        :return: None.
+        """
+        self.__queue.put(None)
+        self.__thread.join(timeout=5)
+
+
+class Tracer:
+    """Process-wide tracer: sampling of the root spans and creation of the child spans."""
+    enabled: bool = False
+    sample_rate: float = 1.0
+    exporter: SpanExporter | None = None
+    __traces: Iterator[int] = itertools.count(1)
+
+    @classmethod
+    def configure(cls, settings: dict) -> None:
+        """
+        Configure the tracer (section "TRACING" of bot.json).
+
+        :param settings: Tracing settings.
+        :return: None.
+        """
+        cls.enabled = settings.get("ENABLED", False)
+        cls.sample_rate = settings.get("SAMPLE_RATE", 1.0)
+        if cls.enabled and cls.exporter is None:
+            cls.exporter = SpanExporter(settings.get("PATH", "traces.json"))
+            logging.info("Tracing is enabled, sample rate: %s", cls.sample_rate)
+
+    @classmethod
+    def close(cls) -> None:
+        """
+        Flush and stop the exporter.
+
+        :return: None.
+        """
+        if cls.exporter is not None:
+            cls.exporter.close()
+            cls.exporter = None
+        cls.enabled = False
+
+    @classmethod
+    @contextlib.contextmanager
+    def root(cls, name: str, **attrs) -> Iterator["Span | None"]:
+        """
+        Start a new (sampled) trace.
+
+        :param name: Name of the root span.
+        :param attrs: Attributes of the span.
+
+        :return: Context manager with the span (None if the trace is not sampled).
+        """
+        if not cls.enabled or random.random() >= cls.sample_rate:
+            yield None
+            return
+
+        span: Span = Span(name, next(cls.__traces), None, attrs)
+        with cls.__activate(span):
+            yield span
+
+    @classmethod
+    @contextlib.contextmanager
+    def span(cls, name: str, **attrs) -> Iterator["Span | None"]:
+        """
+        Start a child span of the current span (no-op outside of a sampled trace).
+
+        :param name: Name of the span, e.g. "db.get_context".
+        :param attrs: Attributes of the span.
+
+        :return: Context manager with the span or None.
+        """
+        parent: Span | None = current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span: Span = Span(name, parent.trace_id, parent, attrs)
+        with cls.__activate(span):
+            yield span
+
+    @classmethod
+    @contextlib.contextmanager
+    def __activate(cls, span: Span) -> Iterator[Span]:
+        """
+        Make the span current and export it at the end.
+
+        :param span: Span.
+        :return: Context manager with the span.
+        """
+        token: contextvars.Token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as ex:
+            span.error = repr(ex)
+            raise
+        finally:
+            current_span.reset(token)
+            span.end()
+            if cls.exporter is not None:
+                cls.exporter.export(span)
+
+    @classmethod
+    def trace(cls, name: str) -> Callable:
+        """
+        Decorator: wrap the coroutine function into a child span.
+
+        :param name: Name of the span.
+        :return: Decorator.
+        """
+        def decorator(function: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with cls.span(name):
+                    return await function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Outer update-middleware which opens the root span of the update."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        """
+        Handle the update inside the root span.
+
+        :param handler: Next handler.
+        :param event: Update.
+        :param data: Handler data.
+
+        :return: Result of the handler.
+        """
+        if not Tracer.enabled:
+            return await handler(event, data)
+
+        user = data.get("event_from_user")
+        with Tracer.root(
+                "update",
+                update_id=event.update_id if isinstance(event, Update) else None,
+                update_type=event.event_type if isinstance(event, Update) else None,
+                user_id=None if user is None else user.id
+        ):
+            return await handler(event, data)
+
+
+class TelegramTracingMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: a child span around every Telegram Bot API call."""
+
+    async def __call__(self, make_request, bot, method):
+        """
+        Call the Telegram Bot API inside a span.
+
+        :param make_request: Next request handler.
+        :param bot: Bot.
+        :param method: Telegram method.
+
+        :return: Response.
+        """
+        with Tracer.span(f"telegram.{type(method).__name__}"):
+            return await make_request(bot, method)
@@ -0,0 +1,259 @@
+"""
+Module of the opt-in traffic recorder: anonymized metadata of every update (time,
+keyed hash of the user ID, flow, action, text length, handling time) is appended to a
+rotating JSONL file, the input of the replay load test (benchmarks/replay_traffic.py).
+No texts are recorded.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import secrets
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+# Callback data of the buttons which start the image generation (the rest is the menu)
+IMAGE_ACTIONS: tuple[str, ...] = ("start_image_generate", "generate")
+
+
+class TrafficRecorder:
+    """Recorder of the update metadata (section "TRAFFIC_RECORDER" of bot.json)."""
+    __instance: "TrafficRecorder | None" = None
+
+    def __init__(self, settings: dict) -> None:
+        self.enabled: bool = settings.get("ENABLED", False)
+        self.path: str = settings.get("PATH", "traffic/updates.jsonl")
+        self.max_bytes: int = settings.get("MAX_BYTES", 50 * 1024 * 1024)
+        self.backups: int = settings.get("BACKUPS", 5)
+        self.flush_interval: float = settings.get("FLUSH_INTERVAL", 1.0)
+        # Without a configured salt the hashes are stable only within one run
+        salt: str = settings.get("SALT", "") or secrets.token_hex(16)
+        self.__salt: bytes = salt.encode("utf-8")[:64]
+
+        self.__buffer: list[str] = list()
+        self.__task: asyncio.Task | None = None
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "TrafficRecorder":
+        """
+        Get the recorder (created from the "TRAFFIC_RECORDER" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Traffic recorder.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("TRAFFIC_RECORDER", {}))
+
+        return cls.__instance
+
+    @classmethod
+    def configure(cls, settings: dict) -> None:
+        """
+        Create the recorder from the given settings instead of bot.json (e.g. with
+        a per-worker file).
+
+        :param settings: Recorder settings.
+        :return: None.
+        """
+        cls.__instance = cls(settings)
+
+    def anonymize(self, telegram_id: int) -> str:
+        """
+        Keyed hash of the user ID.
+
+        :param telegram_id: Telegram User ID.
+        :return: Hex digest.
+        """
+        return hashlib.blake2b(
+            str(telegram_id).encode("utf-8"), key=self.__salt, digest_size=8
+        ).hexdigest()
+
+    @staticmethod
+    def describe(update: Update, raw_state: str | None) -> tuple[str, str, int] | None:
+        """
+        Get the flow, the action and the text length of the update.
+
+        :param update: Update.
+        :param raw_state: FSM state of the user before the update.
+
+        :return: (flow, action, length) or None if the update is not recorded.
+        """
+        if update.message is not None:
+            text: str = update.message.text or ""
+            if text.startswith("/"):
+                action: str = "command:" + text[1:].split(maxsplit=1)[0].split("@")[0].lower()
+            else:
+                action = "text"
+
+            if raw_state is not None and raw_state.startswith("GetQuery"):
+                flow: str = "chat"
+            elif raw_state is not None and raw_state.startswith("GigaImage"):
+                flow = "image"
+            else:
+                flow = "menu"
+
+            return flow, action, len(text)
+
+        if update.callback_query is not None:
+            data: str = update.callback_query.data or ""
+            flow = "image" if data in IMAGE_ACTIONS else "menu"
+            if data == "start_chat_dialog_ai":
+                flow = "chat"
+
+            return flow, "callback:" + data, 0
+
+        return None
+
+    def record(
+            self,
+            update: Update,
+            raw_state: str | None,
+            user_id: int | None,
+            seconds: float,
+            ok: bool
+    ) -> None:
+        """
+        Buffer the record of the handled update.
+
+        :param update: Update.
+        :param raw_state: FSM state of the user before the update.
+        :param user_id: Telegram User ID.
+        :param seconds: Handling time.
+        :param ok: False if the handler has raised.
+
+        :return: None.
+        """
+        if not self.enabled or user_id is None:
+            return
+
+        described: tuple[str, str, int] | None = self.describe(update, raw_state)
+        if described is None:
+            return
+
+        flow, action, length = described
+        self.__buffer.append(json.dumps({
+            "ts": round(time.time() - seconds, 3),
+            "user": self.anonymize(user_id),
+            "flow": flow,
+            "action": action,
+            "length": length,
+            "handler_ms": round(seconds * 1000, 1),
+            "ok": ok
+        }) + "\n")
+
+    def __rotate(self) -> None:
+        """
+        Shift the backups (updates.jsonl.1 is the newest) and start a new file.
+
+        :return: None.
+        """
+        for number in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{number}"):
+                os.replace(f"{self.path}.{number}", f"{self.path}.{number + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def __write(self, lines: list[str]) -> None:
+        """
+        Append the records to the file (blocking, called in a worker thread).
+
+        :param lines: JSON lines.
+        :return: None.
+        """
+        directory: str = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self.__rotate()
+
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("".join(lines))
+
+    async def flush(self) -> None:
+        """
+        Write the buffered records.
+
+        :return: None.
+        """
+        if not self.__buffer:
+            return
+
+        lines: list[str] = self.__buffer
+        self.__buffer = list()
+        try:
+            await asyncio.to_thread(self.__write, lines)
+        except OSError as ex:
+            logging.warning("Traffic records have not been written: %r", ex)
+
+    async def __run(self) -> None:
+        """
+        Flush the records periodically.
+
+        :return: None.
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """
+        Start the periodic flush.
+
+        :return: None.
+        """
+        if self.enabled and self.__task is None:
+            self.__task = asyncio.create_task(self.__run(), name="traffic-recorder-flush")
+
+    async def stop(self) -> None:
+        """
+        Stop the periodic flush and write the rest.
+
+        :return: None.
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+        await self.flush()
+
+
+class TrafficRecordingMiddleware(BaseMiddleware):
+    """Outer update-middleware which records the metadata of the handled updates."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        """
+        Measure the handling of the update and record it.
+
+        :param handler: Next handler.
+        :param event: Update.
+        :param data: Handler data.
+
+        :return: Result of the handler.
+        """
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        user = data.get("event_from_user")
+        raw_state: str | None = data.get("raw_state")
+        start: float = time.perf_counter()
+        ok: bool = False
+        try:
+            result: Any = await handler(event, data)
+            ok = True
+            return result
+        finally:
+            TrafficRecorder.get().record(
+                event, raw_state, user.id if user is not None else None,
+                time.perf_counter() - start, ok
+            )
@@ -0,0 +1,178 @@
+"""
+Module of the usage analytics pipeline: usage events are buffered in memory and
+flushed in batches together with their hourly / daily rollups, so the global stats
+are read from the rollups only.
+"""
+import asyncio
+import datetime
+import json
+import logging
+
+from bot_ai.storage.factory import StorageFactory
+
+ALL_KINDS: str = "all"
+
+
+class UsageRecorder:
+    """Buffer of the usage events with the periodic flush to the storage."""
+    __instance: "UsageRecorder | None" = None
+
+    def __init__(self, settings: dict) -> None:
+        self.__interval: float = settings.get("FLUSH_INTERVAL", 10.0)
+        self.__max_buffer: int = settings.get("MAX_BUFFER", 10000)
+        self.__events: list[tuple[int, str, str]] = list()
+        self.__task: asyncio.Task | None = None
+
+    @classmethod
+    def get(cls, file_path: str = "bot.json") -> "UsageRecorder":
+        """
+        Get the recorder (created from the "USAGE_STATS" section of bot.json).
+
+        :param file_path: bot.json path.
+        :return: Usage recorder.
+        """
+        if cls.__instance is None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                cls.__instance = cls(json.load(file).get("USAGE_STATS", {}))
+
+        return cls.__instance
+
+    def record(self, telegram_id: int, kind: str) -> None:
+        """
+        Record one served request.
+
+        :param telegram_id: Telegram User ID.
+        :param kind: "text" or "image".
+
+        :return: None.
+        """
+        created_at: str = datetime.datetime.now(datetime.timezone.utc).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+        self.__events.append((int(telegram_id), kind, created_at))
+
+        if len(self.__events) >= self.__max_buffer:
+            asyncio.get_running_loop().create_task(self.flush())
+
+    @staticmethod
+    def aggregate(events: list[tuple[int, str, str]]) -> tuple[dict, dict, dict]:
+        """
+        Aggregate the events to the rollup deltas (each event also counts for "all").
+
+        :param events: List of (telegram_id, kind, created_at).
+        :return: Hourly requests, daily requests and daily active users.
+        """
+        hourly: dict[tuple[str, str], int] = dict()
+        daily: dict[tuple[str, str], int] = dict()
+        active: dict[tuple[str, str], set[int]] = dict()
+
+        for telegram_id, kind, created_at in events:
+            bucket: str = created_at[:13] + ":00:00"
+            day: str = created_at[:10]
+            for name in (kind, ALL_KINDS):
+                hourly[(bucket, name)] = hourly.get((bucket, name), 0) + 1
+                daily[(day, name)] = daily.get((day, name), 0) + 1
+                active.setdefault((day, name), set()).add(telegram_id)
+
+        return hourly, daily, active
+
+    async def flush(self) -> None:
+        """
+        Write the buffered events and their rollups (one transaction).
+
+        :return: None.
+        """
+        if not self.__events:
+            return
+
+        events: list[tuple[int, str, str]] = self.__events
+        self.__events = list()
+
+        try:
+            await StorageFactory.get().save_usage(events, *self.aggregate(events))
+        except Exception as ex:
+            logging.warning("Usage events have not been saved: %r", ex)
+            if len(self.__events) + len(events) <= self.__max_buffer * 2:
+                self.__events = events + self.__events
+            else:
+                logging.error("Dropped %s usage events", len(events))
+
+    async def __run(self) -> None:
+        """
+        Periodic flush.
+
+        :return: None.
+        """
+        while True:
+            await asyncio.sleep(self.__interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """
+        Start the periodic flush.
+
+        :return: None.
+        """
+        if self.__task is None:
+            self.__task = asyncio.create_task(self.__run(), name="usage-stats-flush")
+
+    async def stop(self) -> None:
+        """
+        Stop the periodic flush and write the rest.
+
+        :return: None.
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+        await self.flush()
+
+
+class UsageReport:
+    """Text report of the global usage built from the rollups."""
+
+    @staticmethod
+    async def build(days: int = 7, hours: int = 24) -> str:
+        """
+        Build the report: daily requests / active users and the requests of the last hours.
+
+        :param days: Count of days.
+        :param hours: Count of hours.
+
+        :return: HTML-text.
+        """
+        now: datetime.datetime = datetime.datetime.now(datetime.timezone.utc)
+        since_day: str = (now - datetime.timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        since_hour: str = (now - datetime.timedelta(hours=hours - 1)).strftime(
+            "%Y-%m-%d %H:00:00"
+        )
+
+        storage = StorageFactory.get()
+        daily: list[tuple] = await storage.get_usage_rollups("day", since_day)
+        hourly: list[tuple] = await storage.get_usage_rollups("hour", since_hour)
+
+        by_day: dict[str, dict[str, tuple[int, int]]] = dict()
+        for day, kind, requests, users in daily:
+            by_day.setdefault(str(day)[:10], dict())[kind] = (requests, users)
+
+        lines: list[str] = [
+            "📊 <b>Usage (UTC)</b>",
+            "<b>*-*-*-*-*-*-*-*-*-*-*</b>",
+            "",
+            "<code>day         DAU  req  text  img</code>"
+        ]
+        for day in sorted(by_day):
+            kinds: dict[str, tuple[int, int]] = by_day[day]
+            lines.append(
+                f"<code>{day}  {kinds.get(ALL_KINDS, (0, 0))[1]:>4} "
+                f"{kinds.get(ALL_KINDS, (0, 0))[0]:>4} {kinds.get('text', (0, 0))[0]:>5} "
+                f"{kinds.get('image', (0, 0))[0]:>4}</code>"
+            )
+
+        last_hours: int = sum(
+            requests for _, kind, requests in hourly if kind == ALL_KINDS
+        )
+        lines.append("")
+        lines.append(f"Requests in the last {hours} h: <b>{last_hours}</b>")
+
+        return "\n".join(lines)
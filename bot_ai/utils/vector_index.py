@@ -0,0 +1,153 @@
+"""
+Module of the in-memory vector index: normalized vectors in one NumPy matrix (grown
+on demand up to the capacity), batched cosine search, top-k search and
+least-recently-used eviction when the index is full.
+"""
+import time
+from typing import Any, Sequence
+
+
+class VectorIndex:
+    """Bounded cosine similarity index (NumPy is imported on creation)."""
+
+    def __init__(self, dim: int, capacity: int, initial: int = 64) -> None:
+        import numpy
+
+        self.__np = numpy
+        self.dim: int = dim
+        self.capacity: int = capacity
+        size: int = min(initial, capacity)
+        self.__vectors = numpy.zeros((size, dim), dtype=numpy.float32)
+        self.__used = numpy.zeros(size, dtype=bool)
+        self.__last_used = numpy.zeros(size, dtype=numpy.float64)
+        self.__high: int = 0
+        self.payloads: list[Any] = [None] * size
+        self.evictions: int = 0
+
+    def __grow(self) -> None:
+        """
+        Double the allocated rows (at most up to the capacity).
+
+        :return: None.
+        """
+        size: int = min(self.capacity, max(1, len(self.payloads) * 2))
+        extra: int = size - len(self.payloads)
+
+        self.__vectors = self.__np.concatenate(
+            [self.__vectors, self.__np.zeros((extra, self.dim), dtype=self.__np.float32)]
+        )
+        self.__used = self.__np.concatenate(
+            [self.__used, self.__np.zeros(extra, dtype=bool)]
+        )
+        self.__last_used = self.__np.concatenate(
+            [self.__last_used, self.__np.zeros(extra, dtype=self.__np.float64)]
+        )
+        self.payloads.extend([None] * extra)
+
+    def __len__(self) -> int:
+        """
+        Count of the vectors.
+
+        :return: Count.
+        """
+        return int(self.__used[:self.__high].sum())
+
+    def __normalize(self, vectors):
+        """
+        Convert the vectors to a float32 matrix of unit rows.
+
+        :param vectors: Sequence of the vectors.
+        :return: Matrix.
+        """
+        matrix = self.__np.asarray(vectors, dtype=self.__np.float32).reshape(-1, self.dim)
+        norms = self.__np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+
+        return matrix / norms
+
+    def add(self, vector: Sequence[float], payload: Any) -> int:
+        """
+        Add the vector (evict the least recently used one if the index is full).
+
+        :param vector: Vector.
+        :param payload: Payload of the vector.
+
+        :return: Slot of the vector.
+        """
+        if self.__high == len(self.payloads) < self.capacity:
+            self.__grow()
+
+        if self.__high < len(self.payloads):
+            slot: int = self.__high
+            self.__high += 1
+        else:
+            free = self.__np.flatnonzero(~self.__used)
+            if free.size:
+                slot = int(free[0])
+            else:
+                slot = int(self.__np.argmin(self.__last_used[:self.__high]))
+                self.evictions += 1
+
+        self.__vectors[slot] = self.__normalize([vector])[0]
+        self.__used[slot] = True
+        self.__last_used[slot] = time.monotonic()
+        self.payloads[slot] = payload
+
+        return slot
+
+    def remove(self, slot: int) -> None:
+        """
+        Remove the vector.
+
+        :param slot: Slot of the vector.
+        :return: None.
+        """
+        self.__used[slot] = False
+        self.payloads[slot] = None
+
+    def touch(self, slot: int) -> None:
+        """
+        Mark the vector as recently used.
+
+        :param slot: Slot of the vector.
+        :return: None.
+        """
+        self.__last_used[slot] = time.monotonic()
+
+    def search(self, vectors: Sequence[Sequence[float]]) -> list[tuple[int, float]]:
+        """
+        Find the most similar vector for every query (one matrix product for the batch).
+
+        :param vectors: Query vectors.
+        :return: List of (slot, cosine similarity); slot -1 if the index is empty.
+        """
+        if not self.__used[:self.__high].any():
+            return [(-1, -1.0)] * len(vectors)
+
+        scores = self.__normalize(vectors) @ self.__vectors[:self.__high].T
+        scores[:, ~self.__used[:self.__high]] = -2.0
+        best = scores.argmax(axis=1)
+
+        return [(int(slot), float(scores[row, slot])) for row, slot in enumerate(best)]
+
+    def top_k(self, vector: Sequence[float], k: int) -> list[tuple[int, float]]:
+        """
+        Find the k most similar vectors.
+
+        :param vector: Query vector.
+        :param k: Count of the vectors.
+
+        :return: List of (slot, cosine similarity) ordered by similarity.
+        """
+        if k <= 0 or not self.__used[:self.__high].any():
+            return list()
+
+        scores = self.__vectors[:self.__high] @ self.__normalize([vector])[0]
+        scores[~self.__used[:self.__high]] = -2.0
+        k = min(k, self.__high)
+        best = self.__np.argpartition(-scores, k - 1)[:k]
+
+        return sorted(
+            ((int(slot), float(scores[slot])) for slot in best if scores[slot] > -2.0),
+            key=lambda item: -item[1]
+        )
@@ -0,0 +1,348 @@
+"""
+Module of the multi-process mode: the front process polls the updates and shards them
+by user ID to N worker processes over local queues; every worker runs its own
+dispatcher, HTTP session and DB pool. Crashed workers are restarted by the front.
+"""
+import asyncio
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from bot_ai.bot import BotAI, GetData
+from bot_ai.storage.factory import StorageFactory
+from bot_ai.utils.logger import LoggingPipeline
+from bot_ai.utils.profiler import SamplingProfiler
+from bot_ai.utils.shutdown import shutdown_coordinator
+from bot_ai.utils.traffic import TrafficRecorder
+
+
+def worker_path(path: str, index: int) -> str:
+    """
+    Get the per-worker variant of an output path (traces.json -> traces.worker-0.json),
+    so the processes never append to the same file.
+
+    :param path: Path of the file.
+    :param index: Index of the worker.
+
+    :return: Path.
+    """
+    root, extension = os.path.splitext(path)
+
+    return f"{root}.worker-{index}{extension}"
+
+
+class UpdateSharder:
+    """Choice of the worker for the update."""
+
+    @staticmethod
+    def key(update: Update) -> int:
+        """
+        Get the sharding key: the user ID (the chat ID or the update ID otherwise).
+
+        :param update: Update.
+        :return: Key.
+        """
+        try:
+            event = update.event
+        except Exception:
+            return update.update_id
+
+        user = getattr(event, "from_user", None)
+        if user is not None:
+            return user.id
+        chat = getattr(event, "chat", None)
+        if chat is not None:
+            return chat.id
+
+        return update.update_id
+
+    @classmethod
+    def shard(cls, update: Update, count: int) -> int:
+        """
+        Get the index of the worker.
+
+        :param update: Update.
+        :param count: Count of the workers.
+
+        :return: Index.
+        """
+        return cls.key(update) % count
+
+
+class WorkerIntake:
+    """Source of the updates of a worker: the queue filled by the front process."""
+
+    def __init__(self, updates: multiprocessing.Queue, parent_pid: int, deadline: float) -> None:
+        self.__updates: multiprocessing.Queue = updates
+        self.__parent_pid: int = parent_pid
+        self.__deadline: float = deadline
+
+    def __get(self) -> str | None:
+        """
+        Get the next update (blocking); None when the front asks to stop or has died.
+
+        :return: JSON of the update or None.
+        """
+        while True:
+            try:
+                return self.__updates.get(timeout=1.0)
+            except queue.Empty:
+                if os.getppid() != self.__parent_pid:
+                    logging.error("The front process has gone, stopping the worker")
+                    return None
+
+    async def __call__(self, bot: Bot, dispatcher: Dispatcher) -> None:
+        """
+        Feed the updates of the queue to the dispatcher until the stop marker.
+
+        :param bot: Bot.
+        :param dispatcher: Dispatcher.
+
+        :return: None.
+        """
+        tasks: set[asyncio.Task] = set()
+        while True:
+            raw: str | None = await asyncio.to_thread(self.__get)
+            if raw is None:
+                break
+
+            update: Update = Update.model_validate_json(raw, context={"bot": bot})
+            task: asyncio.Task = asyncio.create_task(dispatcher.feed_update(bot, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        shutdown_coordinator.accepting = False
+        if tasks:
+            await asyncio.wait(tasks, timeout=self.__deadline)
+
+
+def worker_main(index: int, updates: multiprocessing.Queue, parent_pid: int) -> None:
+    """
+    Entry point of a worker process.
+
+    :param index: Index of the worker.
+    :param updates: Queue of the updates of the worker.
+    :param parent_pid: PID of the front process.
+
+    :return: None.
+    """
+    # The front process stops the workers itself (after the queues are drained)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    listener: logging.handlers.QueueListener = LoggingPipeline.setup(LoggingPipeline.get_data())
+    try:
+        asyncio.run(run_worker(index, updates, parent_pid))
+    finally:
+        listener.stop()
+
+
+async def run_worker(index: int, updates: multiprocessing.Queue, parent_pid: int) -> None:
+    """
+    Run the bot of a worker process.
+
+    :param index: Index of the worker.
+    :param updates: Queue of the updates of the worker.
+    :param parent_pid: PID of the front process.
+
+    :return: None.
+    """
+    data: dict = await GetData.get_data()
+    data["HEALTH"] = dict(data["HEALTH"], PORT=data["HEALTH"].get("PORT", 8080) + index + 1)
+    data["TRACING"] = dict(
+        data["TRACING"], PATH=worker_path(data["TRACING"].get("PATH", "traces.json"), index)
+    )
+    SamplingProfiler.configure(dict(
+        data["PROFILER"],
+        DIR=os.path.join(data["PROFILER"].get("DIR", "profiles"), f"worker-{index}")
+    ))
+    TrafficRecorder.configure(dict(
+        data["TRAFFIC_RECORDER"],
+        PATH=worker_path(data["TRAFFIC_RECORDER"].get("PATH", "traffic/updates.jsonl"), index)
+    ))
+
+    logging.info("Worker %s has started (pid %s)", index, os.getpid())
+    bot: BotAI = BotAI(data["BOT_TOKEN"], data["MYSQL"], data)
+    await bot.run(
+        WorkerIntake(updates, parent_pid, data["SHUTDOWN"].get("DEADLINE", 25.0))
+    )
+
+
+class WorkerCluster:
+    """Front process: polling, sharding and supervision of the workers."""
+
+    def __init__(
+            self,
+            token: str,
+            settings: dict,
+            deadline: float = 25.0,
+            telegram_api: dict | None = None
+    ) -> None:
+        self.__token: str = token
+        self.__telegram_api: dict = dict() if telegram_api is None else telegram_api
+        self.__count: int = settings.get("COUNT", 4)
+        self.__poll_timeout: int = settings.get("POLL_TIMEOUT", 30)
+        self.__max_backoff: float = settings.get("MAX_RESTART_BACKOFF", 30.0)
+        self.__deadline: float = deadline
+
+        self.__context = multiprocessing.get_context("spawn")
+        self.__queues: list[multiprocessing.Queue] = [
+            self.__context.Queue(settings.get("QUEUE_SIZE", 1000)) for _ in range(self.__count)
+        ]
+        self.__processes: list[multiprocessing.Process | None] = [None] * self.__count
+        self.__restarts: list[int] = [0] * self.__count
+        self.__running: bool = True
+
+    def __start_worker(self, index: int) -> None:
+        """
+        Start (or restart) the worker process.
+
+        :param index: Index of the worker.
+        :return: None.
+        """
+        process: multiprocessing.Process = self.__context.Process(
+            target=worker_main,
+            args=(index, self.__queues[index], os.getpid()),
+            name=f"bot-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.__processes[index] = process
+
+    async def __supervise(self) -> None:
+        """
+        Restart the crashed workers with an exponential backoff.
+
+        :return: None.
+        """
+        started_at: list[float] = [time.monotonic()] * self.__count
+        while self.__running:
+            await asyncio.sleep(1.0)
+            for index, process in enumerate(self.__processes):
+                if process is None or process.is_alive() or not self.__running:
+                    continue
+
+                if time.monotonic() - started_at[index] > self.__max_backoff * 2:
+                    self.__restarts[index] = 0
+                backoff: float = min(self.__max_backoff, 2.0 ** self.__restarts[index] - 1)
+                logging.error(
+                    "Worker %s has exited with code %s, restarting in %.0f s",
+                    index, process.exitcode, backoff
+                )
+                self.__processes[index] = None
+                await asyncio.sleep(backoff)
+                if self.__running:
+                    self.__restarts[index] += 1
+                    started_at[index] = time.monotonic()
+                    self.__start_worker(index)
+
+    def __put(self, index: int, item: str | None, timeout: float | None = None) -> bool:
+        """
+        Put the item into the queue of the worker (blocking, called in a worker thread).
+        The put is retried while the front is running, so it never outlives the shutdown.
+
+        :param index: Index of the worker.
+        :param item: JSON of the update or None (the stop marker).
+        :param timeout: Max wait for the stop marker (None for the updates).
+
+        :return: True if the item has been queued.
+        """
+        while True:
+            try:
+                self.__queues[index].put(item, timeout=1.0 if timeout is None else timeout)
+                return True
+            except queue.Full:
+                if timeout is not None or not self.__running:
+                    return False
+
+    async def __poll(self, bot: Bot) -> None:
+        """
+        Long polling: put every update into the queue of its worker (the put blocks
+        while the queue is full, so a slow worker slows the intake down).
+
+        :param bot: Bot of the front process.
+        :return: None.
+        """
+        offset: int | None = None
+        while self.__running:
+            try:
+                updates: list[Update] = await bot.get_updates(
+                    offset=offset, timeout=self.__poll_timeout
+                )
+            except Exception as ex:
+                logging.warning("Polling has failed: %r", ex)
+                await asyncio.sleep(1.0)
+                continue
+
+            for update in updates:
+                worker: int = UpdateSharder.shard(update, self.__count)
+                if not await asyncio.to_thread(
+                        self.__put, worker, update.model_dump_json(exclude_unset=True)
+                ):
+                    return
+                offset = update.update_id + 1
+
+    async def run(self) -> None:
+        """
+        Start the workers, poll until SIGTERM / SIGINT, then stop the workers (they
+        drain their queues first).
+
+        :return: None.
+        """
+        # The schema is migrated once here: concurrent migrations in the workers race
+        await StorageFactory.get().init()
+        await StorageFactory.close()
+
+        for index in range(self.__count):
+            self.__start_worker(index)
+        logging.info("Started %s worker processes", self.__count)
+
+        bot: Bot = Bot(self.__token, **BotAI.session_options(self.__telegram_api))
+        poll: asyncio.Task = asyncio.create_task(self.__poll(bot), name="front-polling")
+        supervise: asyncio.Task = asyncio.create_task(self.__supervise(), name="supervisor")
+
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+
+        def stop(signum: int) -> None:
+            logging.warning("Signal %s: stopping the front", signal.Signals(signum).name)
+            self.__running = False
+            poll.cancel()
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, stop, signum)
+            except NotImplementedError:
+                signal.signal(signum, lambda number, _: loop.call_soon_threadsafe(stop, number))
+
+        try:
+            await poll
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.__running = False
+            supervise.cancel()
+            await bot.session.close()
+
+        # A dead worker or one whose queue stays full is terminated instead of waiting
+        for index, process in enumerate(self.__processes):
+            if process is None or not process.is_alive():
+                continue
+            if not await asyncio.to_thread(self.__put, index, None, 5.0):
+                logging.error("Worker %s does not take the stop marker, terminating", process.name)
+                process.terminate()
+
+        deadline: float = time.monotonic() + self.__deadline + 5
+        for process in self.__processes:
+            if process is not None and process.is_alive():
+                await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    logging.error("Worker %s has not stopped in time, terminating", process.name)
+                    process.terminate()
+
+        logging.info("All workers have stopped")
@@ -1,8 +1,9 @@
 """Main module."""
 import asyncio
 import logging
-import sys
-from bot_ai.bot import run
+from bot_ai.bot import GetData, run
+from bot_ai.utils.logger import LoggingPipeline
+from bot_ai.workers import WorkerCluster
 
 
 class Main:
@@ -14,23 +15,30 @@ class Main:
 
         :return: None.
         """
-        await run()
+        data: dict = await GetData.get_data()
+        if data["WORKERS"].get("ENABLED", False):
+            await WorkerCluster(
+                data["BOT_TOKEN"],
+                data["WORKERS"],
+                data["SHUTDOWN"].get("DEADLINE", 25.0),
+                data["TELEGRAM_API"]
+            ).run()
+        else:
+            await run()
 
 
 async def main() -> None:
     """Main function."""
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(levelname)s: %(asctime)s -- %(funcName)s -- %(message)s",
-        datefmt="%d-%m-%Y %H:%M:%S",
-        stream=sys.stdout
-    )
+    listener = LoggingPipeline.setup(LoggingPipeline.get_data())
 
     logging.info(
-        f"Start main-function in the main module"
+        "Start main-function in the main module"
     )
-    await Main.main()
+    try:
+        await Main.main()
+    finally:
+        listener.stop()
 
 
 if __name__ == "__main__":